@@ -5,13 +5,17 @@ from pprint import pprint
 import click
 from cerberus import Validator
 
-from src.tasks.tasks import TASKS
+from src.tasks.tasks import get_task
 
 ENV_CHOICES = ("aws", "desktop", "laptop")
 CONFIG_SCHEMA = {
     "runtime": {
         "type": "dict",
-        "schema": {"cuda": {"type": "boolean", "required": True, "nullable": False},},
+        "schema": {
+            "cuda": {"type": "boolean", "required": True, "nullable": False},
+            "compile_net": {"type": "boolean", "required": False},
+            "memory_profile": {"type": "string", "required": False, "nullable": True},
+        },
     },
     "logging": {
         "type": "dict",
@@ -36,6 +40,8 @@ CONFIG_SCHEMA = {
                         "required": True,
                         "nullable": True,
                     },
+                    "resume": {"type": "boolean", "required": False},
+                    "run_id": {"type": "string", "required": False, "nullable": True},
                 },
             },
         },
@@ -44,8 +50,20 @@ CONFIG_SCHEMA = {
         "type": "dict",
         "schema": {
             "epochs": {"type": "integer", "required": True, "nullable": False},
-            "batch_size": {"type": "integer", "required": True, "nullable": False},
+            "batch_size": {
+                "anyof": [{"type": "integer"}, {"type": "string", "allowed": ["auto"]}],
+                "required": True,
+                "nullable": False,
+            },
+            "batch_memory_budget_gb": {
+                "type": "float",
+                "required": False,
+                "nullable": True,
+            },
             "subsample": {"type": "integer", "required": True, "nullable": True},
+            "ema_decay": {"type": "float", "required": False, "nullable": True},
+            "recompute_budget_gb": {"type": "float", "required": False, "nullable": True},
+            "mix_librispeech": {"type": "boolean", "required": False},
         },
     },
 }
@@ -63,7 +81,7 @@ def train_cli(env, branch):
         configs = yaml.load(f)
 
     task_name = configs["task"]
-    train_func = TASKS[task_name]
+    train_func = get_task(task_name)
     # Read default config, merge in default env settings.
     print(f"Loading config for env {env}...")
     config = configs["default"]
@@ -86,6 +104,11 @@ def train_cli(env, branch):
         wandb_name = branch.replace("train/", "")
         config["logging"]["wandb"]["run_name"] = wandb_name
 
+    # Runs on the same branch resume each other's training state by default.
+    checkpoint_config = config["logging"]["checkpoint"]
+    if not checkpoint_config.get("run_id"):
+        checkpoint_config["run_id"] = config["logging"]["wandb"]["run_name"]
+
     print("Found task config:")
     pprint(config)
     is_valid = validator.validate(config)
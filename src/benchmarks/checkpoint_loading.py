@@ -0,0 +1,74 @@
+"""
+Compare model loading time for pickled full.ckpt checkpoints and flat tensor files.
+Models are built with random weights and saved to a temporary directory. Files are read
+from a warm page cache, so this measures deserialization rather than disk speed.
+
+    python -m src.benchmarks.checkpoint_loading
+"""
+import os
+import time
+import tempfile
+
+import torch
+
+from src.utils import tensor_file
+from src.tasks.waveunet.models.wave_u_net import WaveUNet
+from src.tasks.acoustic_scenes_spectral.model import SpectralSceneNet
+
+NUM_RUNS = 5
+# The evaluation script loads three WaveUNets.
+MODELS = [
+    ("3x WaveUNet", WaveUNet, 3),
+    ("SpectralSceneNet", SpectralSceneNet, 1),
+]
+
+
+def run_benchmark():
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"Loading models onto {device}, best of {NUM_RUNS} runs\n")
+    print(
+        "{: <20}{: >12}{: >18}{: >18}".format(
+            "Model", "Size (MB)", "full.ckpt (ms)", "safetensors (ms)"
+        )
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, net_class, num_copies in MODELS:
+            net = net_class()
+            full_path = os.path.join(tmp_dir, "model.full.ckpt")
+            flat_path = os.path.join(tmp_dir, "model.safetensors")
+            torch.save(net, full_path)
+            tensor_file.save_module(net, flat_path)
+            size_mb = num_copies * os.path.getsize(flat_path) / 2 ** 20
+
+            def load_full():
+                for _ in range(num_copies):
+                    torch.load(full_path, map_location=device, weights_only=False)
+
+            def load_flat():
+                for _ in range(num_copies):
+                    tensor_file.load_module(flat_path, device)
+
+            full_ms = time_fn(load_full, device)
+            flat_ms = time_fn(load_flat, device)
+            print(
+                "{: <20}{: >12.1f}{: >18.1f}{: >18.1f}".format(
+                    name, size_mb, full_ms, flat_ms
+                )
+            )
+
+
+def time_fn(fn, device):
+    durations = []
+    for _ in range(NUM_RUNS):
+        start = time.time()
+        fn()
+        if device == "cuda":
+            torch.cuda.synchronize()
+
+        durations.append(1000 * (time.time() - start))
+
+    return min(durations)
+
+
+if __name__ == "__main__":
+    run_benchmark()
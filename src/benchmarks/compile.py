@@ -0,0 +1,134 @@
+"""
+Compare eager and compiled (torch.compile) training steps, see `Trainer.use_compile`.
+For each model, reports the time taken to compile the first step, the steady-state
+step time in each mode, and how many compiled steps it takes to win back the compile time.
+Runs on CPU, and also on GPU if one is available.
+
+    python -m src.benchmarks.compile
+"""
+import time
+
+import torch
+import torch.nn as nn
+
+from src.utils.trainer import Trainer
+from src.utils.loss import AudioFeatureLoss
+from src.tasks.waveunet.models.wave_u_net import WaveUNet
+from src.tasks.spectral_u_net.model import SpectralUNet
+from src.tasks.acoustic_scenes.model import SceneNet, NUM_LABELS
+
+NUM_WARMUP_STEPS = 2
+NUM_STEPS = 10
+BATCH_SIZE = 4
+AUDIO_LENGTH = 2 ** 15
+
+mse = nn.MSELoss()
+cross_entropy = nn.CrossEntropyLoss()
+
+
+def get_wave_u_net_mse(device):
+    inputs = torch.randn(BATCH_SIZE, AUDIO_LENGTH, device=device)
+    return WaveUNet(), [lambda i, o, t: mse(o, t)], inputs, inputs.clone()
+
+
+def get_wave_u_net_feature_loss(device):
+    feature_net = SceneNet().get_feature_extractor().to(device)
+    feature_loss = AudioFeatureLoss(feature_net, use_cuda=device == "cuda")
+    inputs = torch.randn(BATCH_SIZE, AUDIO_LENGTH, device=device)
+    return WaveUNet(), [feature_loss], inputs, inputs.clone()
+
+
+def get_spectral_u_net_mse(device):
+    inputs = torch.randn(BATCH_SIZE, 1, 80, 256, device=device)
+    return SpectralUNet(), [lambda i, o, t: mse(o, t)], inputs, inputs.clone()
+
+
+def get_scene_net(device):
+    inputs = torch.randn(BATCH_SIZE, AUDIO_LENGTH, device=device)
+    targets = torch.randint(NUM_LABELS, (BATCH_SIZE,), device=device)
+    return SceneNet(), [lambda i, o, t: cross_entropy(o, t)], inputs, targets
+
+
+BENCHMARKS = [
+    ("WaveUNet MSE", get_wave_u_net_mse),
+    ("WaveUNet feature loss", get_wave_u_net_feature_loss),
+    ("SpectralUNet MSE", get_spectral_u_net_mse),
+    ("SceneNet", get_scene_net),
+]
+
+
+def run_benchmark():
+    devices = ["cpu", "cuda"] if torch.cuda.is_available() else ["cpu"]
+    results = []
+    for device in devices:
+        for name, get_benchmark in BENCHMARKS:
+            torch._dynamo.reset()
+            eager_ms, _ = time_steps(get_benchmark, device, compile_net=False)
+            compiled_ms, first_step_s = time_steps(
+                get_benchmark, device, compile_net=True
+            )
+            compile_s = first_step_s - compiled_ms / 1000
+            results.append((device, name, eager_ms, compile_s, compiled_ms))
+
+    print(f"\nTraining steps with batch size {BATCH_SIZE}, mean of {NUM_STEPS} steps\n")
+    header = "{: <8}{: <25}{: >12}{: >14}{: >16}{: >11}{: >13}"
+    row = "{: <8}{: <25}{: >12.1f}{: >14.1f}{: >16.1f}{: >11.2f}{: >13}"
+    print(
+        header.format(
+            "Device",
+            "Model",
+            "Eager (ms)",
+            "Compile (s)",
+            "Compiled (ms)",
+            "Speed-up",
+            "Break-even",
+        )
+    )
+    for device, name, eager_ms, compile_s, compiled_ms in results:
+        # Number of steps before the compile time has been won back.
+        saved_ms = eager_ms - compiled_ms
+        break_even = f"{1000 * compile_s / saved_ms:.0f}" if saved_ms > 0 else "never"
+        speed_up = eager_ms / compiled_ms
+        print(
+            row.format(
+                device, name, eager_ms, compile_s, compiled_ms, speed_up, break_even
+            )
+        )
+
+
+def time_steps(get_benchmark, device, compile_net):
+    """
+    Returns the mean steady-state step time in ms, and the time taken by the first step.
+    """
+    torch.manual_seed(0)
+    net, loss_fns, inputs, targets = get_benchmark(device)
+    net = net.to(device).train()
+    trainer = Trainer(cuda=device == "cuda", compile_net=compile_net)
+    for loss_fn in loss_fns:
+        trainer.register_loss_fn(loss_fn)
+
+    optimizer = torch.optim.AdamW(net.parameters())
+
+    def step():
+        optimizer.zero_grad()
+        _, loss = trainer.run_step(net, inputs, targets)
+        loss.backward()
+        optimizer.step()
+        if device == "cuda":
+            torch.cuda.synchronize()
+
+    start = time.time()
+    step()
+    first_step_s = time.time() - start
+    for _ in range(NUM_WARMUP_STEPS):
+        step()
+
+    start = time.time()
+    for _ in range(NUM_STEPS):
+        step()
+
+    return 1000 * (time.time() - start) / NUM_STEPS, first_step_s
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,373 @@
+"""
+Micro-benchmarks for the components of the training pipelines, on CPU:
+
+- forward and backward passes of each model, at several batch sizes and audio lengths
+- feature and multi-scale GAN losses, forward and backward
+- spectral transforms in spectral.py and griffin_lim.py
+- each dataset's __getitem__
+
+Datasets are benchmarked without reading from disk: their in-memory arrays are filled
+with random audio of the usual length, and __init__ is skipped.
+
+Results are written as JSON, with the mean time per call, throughput in items (samples
+or clips) per second, and peak memory. Peak memory is the peak process RSS while running
+the component, above the level after it was set up, sampled every millisecond.
+Results can be compared against a saved baseline, which flags slower components:
+
+    python -m src.benchmarks.components --output results.json
+    python -m src.benchmarks.components --baseline src/benchmarks/components_baseline.json
+    python -m src.benchmarks.components --only WaveUNet
+"""
+import os
+import gc
+import sys
+import json
+import time
+import platform
+import threading
+
+import click
+import numpy as np
+import torch
+
+from src import datasets
+from src.utils import spectral, griffin_lim
+from src.utils.loss import AudioFeatureLoss, MultiScaleLoss, LeastSquaresLoss
+from src.utils.debug.memory import get_rss_bytes
+from src.tasks.waveunet.models.wave_u_net import WaveUNet
+from src.tasks.waveunet.models.mel_discriminator import MelDiscriminatorNet
+from src.tasks.spectral_u_net.model import SpectralUNet
+from src.tasks.acoustic_scenes.model import SceneNet
+from src.tasks.acoustic_scenes_spectral.model import SpectralSceneNet
+from src.tasks.speech_denoise.model import SpeechDenoiseNet
+
+BASELINE_PATH = "src/benchmarks/components_baseline.json"
+MIN_RUNS = 3
+MIN_SECONDS = 1
+# Components which are this much slower than the baseline are flagged.
+REGRESSION_THRESHOLD = 0.1
+SAMPLE_INTERVAL_S = 1e-3
+BATCH_SIZES = [1, 4]
+SPECTRAL_SAMPLES = 47360  # Gives an 80 x 256 WaveGlow spectrogram
+
+
+@click.command()
+@click.option("--output", default=None, help="Path to write results JSON to.")
+@click.option("--baseline", default=None, help="Path of baseline results to compare.")
+@click.option("--only", default=None, help="Only run benchmarks containing this text.")
+@click.option("--threshold", default=REGRESSION_THRESHOLD, help="Slowdown to flag.")
+def benchmark_cli(output, baseline, only, threshold):
+    """
+    Run component micro-benchmarks
+    """
+    torch.manual_seed(0)
+    np.random.seed(0)
+    results = run_benchmarks(only)
+    report = {"machine": get_machine_info(), "results": results}
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+        print(f"\nSaved results to {output}")
+
+    if baseline:
+        with open(baseline, "r") as f:
+            baseline_report = json.load(f)
+
+        num_regressions = compare(report, baseline_report, threshold)
+        sys.exit(1 if num_regressions else 0)
+
+
+def run_benchmarks(only=None):
+    """
+    Run each benchmark, returns a dict of results by benchmark name.
+    """
+    results = {}
+    row = "{: <52}{: >12}{: >14}{: >12}"
+    print(row.format("Benchmark", "Time (ms)", "Items / s", "Peak (MB)"))
+    for name, setup, num_items in get_benchmarks():
+        if only and only not in name:
+            continue
+
+        result = time_benchmark(setup, num_items)
+        results[name] = result
+        print(
+            "{: <52}{: >12.2f}{: >14.1f}{: >12.1f}".format(
+                name, result["ms"], result["items_per_s"], result["peak_mb"]
+            )
+        )
+
+    return results
+
+
+def get_benchmarks():
+    """
+    Returns a list of (name, setup, number of items per call).
+    Each setup function builds the component and returns the function to time.
+    """
+    benchmarks = []
+    model_cases = [
+        ("WaveUNet", WaveUNet, [2 ** 14, 2 ** 15]),
+        ("SpectralUNet", SpectralUNet, [(80, 256)]),
+        ("SceneNet", SceneNet, [32767, 2 ** 16]),
+        ("SpectralSceneNet", SpectralSceneNet, [(80, 256)]),
+        ("MelDiscriminatorNet", MelDiscriminatorNet, [2 ** 14, 2 ** 15]),
+        ("SpeechDenoiseNet", SpeechDenoiseNet, [2 ** 13, 2 ** 14]),
+    ]
+    for model_name, net_class, input_sizes in model_cases:
+        for input_size in input_sizes:
+            for batch_size in BATCH_SIZES:
+                if type(input_size) is tuple:
+                    input_shape = (batch_size, 1) + input_size
+                    size_name = "x".join(str(s) for s in input_size)
+                else:
+                    input_shape = (batch_size, 1, input_size)
+                    size_name = str(input_size)
+
+                name = f"model/{model_name}/batch-{batch_size}/{size_name}"
+                setup = get_model_setup(net_class, input_shape)
+                benchmarks.append((name, setup, batch_size))
+
+    benchmarks += [
+        ("loss/AudioFeatureLoss/batch-4/32768", setup_feature_loss, 4),
+        ("loss/MultiScaleLoss/discriminator/batch-4/16384", setup_disc_loss, 4),
+        ("loss/MultiScaleLoss/generator/batch-4/16384", setup_gen_loss, 4),
+    ]
+    audio = np.random.uniform(-1, 1, SPECTRAL_SAMPLES).astype("float32")
+    log_mel_spec = spectral.audio_to_log_mel_spec(audio)
+    log_mel_batch = torch.tensor(np.stack([log_mel_spec] * 4))
+    spec = spectral.audio_to_spec(audio)
+    benchmarks += [
+        ("spectral/audio_to_spec", lambda: lambda: spectral.audio_to_spec(audio), 1),
+        ("spectral/spec_to_audio", lambda: lambda: spectral.spec_to_audio(spec), 1),
+        (
+            "spectral/audio_to_log_mel_spec",
+            lambda: lambda: spectral.audio_to_log_mel_spec(audio),
+            1,
+        ),
+        (
+            "spectral/log_mel_spec_to_audio",
+            lambda: lambda: spectral.log_mel_spec_to_audio(log_mel_spec),
+            1,
+        ),
+        (
+            "spectral/audio_to_waveglow_spec",
+            lambda: lambda: spectral.audio_to_waveglow_spec(audio),
+            1,
+        ),
+        (
+            "spectral/griffin_lim/batch-4",
+            lambda: lambda: griffin_lim.log_mel_spec_to_audio(log_mel_batch),
+            4,
+        ),
+    ]
+    for dataset_name, attrs in get_dataset_cases():
+        setup = get_dataset_setup(dataset_name, attrs)
+        benchmarks.append((f"dataset/{dataset_name}", setup, 1))
+
+    return benchmarks
+
+
+def get_model_setup(net_class, input_shape):
+    def setup():
+        net = net_class().train()
+        input_t = torch.randn(input_shape)
+
+        def step():
+            net.zero_grad()
+            net(input_t).float().mean().backward()
+
+        return step
+
+    return setup
+
+
+def setup_feature_loss():
+    feature_loss = AudioFeatureLoss(SceneNet().get_feature_extractor(), use_cuda=False)
+    inputs = torch.randn(4, 2 ** 15)
+    targets = torch.randn(4, 2 ** 15)
+    outputs = torch.randn(4, 2 ** 15, requires_grad=True)
+    return lambda: feature_loss(inputs, outputs, targets).backward()
+
+
+def setup_disc_loss():
+    loss = MultiScaleLoss(LeastSquaresLoss(MelDiscriminatorNet()))
+    real, fake = torch.randn(4, 1, 2 ** 14), torch.randn(4, 1, 2 ** 14)
+    return lambda: loss.for_discriminator(real, fake).backward()
+
+
+def setup_gen_loss():
+    loss = MultiScaleLoss(LeastSquaresLoss(MelDiscriminatorNet()))
+    real, fake = torch.randn(4, 1, 2 ** 14), torch.randn(4, 1, 2 ** 14)
+    fake.requires_grad_(True)
+    return lambda: loss.for_generator(real, fake).backward()
+
+
+def get_dataset_cases():
+    """
+    Returns a list of (dataset class name, in-memory attributes).
+    """
+    num_items = 8
+
+    def get_audio(length):
+        return [
+            np.random.uniform(-1, 1, length).astype("float32") for _ in range(num_items)
+        ]
+
+    speech_attrs = {
+        "clean_data": get_audio(2 ** 15),
+        "noisy_data": get_audio(2 ** 15),
+        "clean_only": False,
+    }
+    spectral_speech_attrs = {
+        "clean_data": get_audio(SPECTRAL_SAMPLES),
+        "noisy_data": get_audio(SPECTRAL_SAMPLES),
+        "clean_only": False,
+    }
+    labels = list(range(num_items))
+    return [
+        ("SceneDataset", {"data": get_audio(32767), "data_labels": labels}),
+        (
+            "SpectralSceneDataset",
+            {"data": get_audio(SPECTRAL_SAMPLES), "data_labels": labels},
+        ),
+        (
+            "ChimeDataset",
+            {
+                "data": get_audio(64000),
+                "data_labels": [np.zeros(8, dtype="float32")] * num_items,
+            },
+        ),
+        ("NoisySpeechDataset", speech_attrs),
+        ("NoisySpectralSpeechDataset", spectral_speech_attrs),
+        ("AugmentedSpeechDataset", speech_attrs),
+        ("SilenceDataset", {}),
+        (
+            "NoisyLibreSpeechDataset",
+            {
+                "clean_data": [torch.tensor(a) for a in get_audio(2 ** 16)],
+                "noise_data": [torch.tensor(a) for a in get_audio(2 ** 16)],
+                "clean_only": False,
+            },
+        ),
+        ("NoisyScenesDataset", {"noise_data": get_audio(2 ** 16)}),
+        (
+            "SyntheticSpeechDataset",
+            {
+                "num_items": num_items,
+                "audio_length": 2 ** 15,
+                "seed": 0,
+                "train": True,
+                "noise_types": ("white", "pink", "brown", "babble"),
+                "clean_only": False,
+            },
+        ),
+    ]
+
+
+def get_dataset_setup(dataset_name, attrs):
+    def setup():
+        dataset_class = getattr(datasets, dataset_name)
+        dataset = dataset_class.__new__(dataset_class)
+        dataset.__dict__.update(attrs)
+        counter = iter(range(sys.maxsize))
+        return lambda: dataset[next(counter) % len(dataset)]
+
+    return setup
+
+
+def time_benchmark(setup, num_items):
+    """
+    Run a benchmark for at least MIN_RUNS calls and MIN_SECONDS.
+    """
+    fn = setup()
+    gc.collect()
+    with PeakMemory() as peak_memory:
+        fn()  # Warm up
+        num_runs = 0
+        start = time.time()
+        while num_runs < MIN_RUNS or time.time() - start < MIN_SECONDS:
+            fn()
+            num_runs += 1
+
+        mean_s = (time.time() - start) / num_runs
+
+    return {
+        "ms": 1000 * mean_s,
+        "items_per_s": num_items / mean_s,
+        "peak_mb": peak_memory.peak_bytes / 2 ** 20,
+        "runs": num_runs,
+    }
+
+
+class PeakMemory:
+    """
+    Context which samples the process RSS in a background thread, and records the peak
+    increase over the RSS at the start.
+    """
+
+    def __enter__(self):
+        self.start_bytes = get_rss_bytes()
+        self.peak_bytes = 0
+        self.is_running = True
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.is_running = False
+        self.thread.join()
+
+    def _sample(self):
+        while self.is_running:
+            self.peak_bytes = max(self.peak_bytes, get_rss_bytes() - self.start_bytes)
+            time.sleep(SAMPLE_INTERVAL_S)
+
+
+def get_machine_info():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "torch": torch.__version__,
+        "python": platform.python_version(),
+    }
+
+
+def compare(report, baseline_report, threshold):
+    """
+    Print the change in throughput against the baseline, returns the number of
+    components which are more than `threshold` slower.
+    """
+    if report["machine"] != baseline_report["machine"]:
+        print("\nWarning: baseline was recorded on a different machine or setup")
+
+    print(f"\nComparing against baseline, flagging {threshold:.0%} slowdowns\n")
+    row = "{: <52}{: >14}{: >14}{: >10}{: >14}"
+    print(row.format("Benchmark", "Baseline /s", "Current /s", "Change", ""))
+    num_regressions = 0
+    for name, result in report["results"].items():
+        if name not in baseline_report["results"]:
+            continue
+
+        baseline_rate = baseline_report["results"][name]["items_per_s"]
+        change = result["items_per_s"] / baseline_rate - 1
+        is_regression = change < -threshold
+        num_regressions += is_regression
+        print(
+            "{: <52}{: >14.1f}{: >14.1f}{: >+10.0%}{: >14}".format(
+                name,
+                baseline_rate,
+                result["items_per_s"],
+                change,
+                "REGRESSION" if is_regression else "",
+            )
+        )
+
+    print(f"\n{num_regressions} regressions")
+    return num_regressions
+
+
+if __name__ == "__main__":
+    benchmark_cli()
@@ -0,0 +1,75 @@
+"""
+Compare speed and quality of librosa's Griffin-Lim against the batched torch version.
+Quality is measured as spectral convergence (lower is better) on synthetic audio.
+
+    python -m src.benchmarks.griffin_lim
+"""
+import time
+
+import numpy as np
+import torch
+
+from src.utils import spectral
+from src.utils import griffin_lim
+
+SAMPLING_RATE = 16000
+BATCH_SIZE = 8
+AUDIO_LENGTH = 3 * SAMPLING_RATE
+
+
+def run_benchmark():
+    clean = np.stack([get_harmonic_audio(110 + 20 * i) for i in range(BATCH_SIZE)])
+    noisy = clean + 0.05 * np.random.randn(*clean.shape).astype("float32")
+    log_specs = np.stack([spectral.audio_to_log_mel_spec(a) for a in clean])
+    mag_t = griffin_lim.mel_to_magnitude(torch.tensor(np.exp(log_specs)))
+    true_mag_t = torch.stft(
+        torch.tensor(clean),
+        n_fft=1024,
+        hop_length=256,
+        window=torch.hann_window(1024),
+        pad_mode="reflect",
+        return_complex=True,
+    ).abs()
+
+    print(f"Reconstructing {BATCH_SIZE} clips of {AUDIO_LENGTH} samples\n")
+    print("{: <40}{: >12}{: >12}{: >12}".format("Method", "Time (s)", "Iters", "SC"))
+
+    start = time.time()
+    audio = np.stack([spectral.log_mel_spec_to_audio(s) for s in log_specs])
+    duration = time.time() - start
+    audio_t = torch.tensor(audio[:, :AUDIO_LENGTH])
+    print_result("librosa mel_to_audio", duration, 32, audio_t, true_mag_t)
+
+    runs = [
+        ("torch Griffin-Lim", {"momentum": 0, "tol": 0}),
+        ("torch fast Griffin-Lim", {"tol": 0}),
+        ("torch fast Griffin-Lim, early stop", {}),
+        ("torch fast Griffin-Lim, warm start", {"init_audio": torch.tensor(noisy)}),
+    ]
+    for name, kwargs in runs:
+        kwargs = {"length": AUDIO_LENGTH, **kwargs}
+        start = time.time()
+        audio_t, num_iters = griffin_lim.griffin_lim(mag_t, **kwargs)
+        duration = time.time() - start
+        print_result(name, duration, num_iters, audio_t, true_mag_t)
+
+
+def print_result(name, duration, num_iters, audio_t, true_mag_t):
+    convergence = griffin_lim.spectral_convergence(audio_t, true_mag_t).mean().item()
+    row = "{: <40}{: >12.3f}{: >12}{: >12.3f}"
+    print(row.format(name, duration, num_iters, convergence))
+
+
+def get_harmonic_audio(freq):
+    """
+    A speech-like harmonic signal with a wobbling pitch.
+    """
+    times = np.arange(AUDIO_LENGTH) / SAMPLING_RATE
+    phase = 2 * np.pi * freq * (times + 0.02 * np.sin(2 * np.pi * 3 * times))
+    audio = sum(np.sin(k * phase) / k for k in range(1, 10))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 2 * times)
+    return (0.2 * envelope * audio).astype("float32")
+
+
+if __name__ == "__main__":
+    run_benchmark()
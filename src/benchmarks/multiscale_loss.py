@@ -0,0 +1,116 @@
+"""
+Compare the batched multi-scale GAN loss (see multiscale_loss.py) against the loop it
+replaced, which ran the discriminator on real and fake audio separately at each scale.
+Times the discriminator and generator losses, forward and backward, for a
+MelDiscriminatorNet shared by every scale, or a separate discriminator for each scale.
+Concurrent scales are only timed on GPU.
+
+    python -m src.benchmarks.multiscale_loss
+"""
+import time
+
+import torch
+
+from src.utils.loss import MultiScaleLoss, LeastSquaresLoss
+from src.tasks.waveunet.models.mel_discriminator import MelDiscriminatorNet
+
+NUM_STEPS = 5
+BATCH_SIZES = [4, 16]
+AUDIO_LENGTH = 2 ** 14
+NUM_SCALES = 2
+
+
+class LoopMultiScaleLoss:
+    """
+    The multi-scale loss before batching, for comparison.
+    """
+
+    def __init__(self, loss_fns, num_scales=NUM_SCALES):
+        self.loss_fns = loss_fns
+        self.downsample = torch.nn.AvgPool1d(kernel_size=4, stride=2, padding=2)
+        self.num_scales = num_scales
+
+    def for_generator(self, real_audio, fake_audio):
+        return self._get_loss(real_audio, fake_audio, "for_generator")
+
+    def for_discriminator(self, real_audio, fake_audio):
+        return self._get_loss(real_audio, fake_audio, "for_discriminator")
+
+    def _get_loss(self, real_audio, fake_audio, method):
+        loss = 0
+        real = real_audio
+        fake = fake_audio
+        for loss_fn in self.loss_fns:
+            loss += getattr(loss_fn, method)(real, fake)
+            real = self.downsample(real)
+            fake = self.downsample(fake)
+
+        return loss / (self.num_scales + 1)
+
+
+def get_losses(disc_nets, device):
+    """
+    Returns a list of (name, loss) to compare, for the given discriminator per scale.
+    """
+    loss_fns = [LeastSquaresLoss(disc_net) for disc_net in disc_nets]
+    losses = [
+        ("loop", LoopMultiScaleLoss(loss_fns)),
+        ("batched", MultiScaleLoss(loss_fns[0], NUM_SCALES, disc_nets)),
+    ]
+    if device == "cuda":
+        concurrent_loss = MultiScaleLoss(loss_fns[0], NUM_SCALES, disc_nets, True)
+        losses.append(("concurrent", concurrent_loss))
+
+    return losses
+
+
+def run_benchmark():
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    torch.manual_seed(0)
+    shared_net = MelDiscriminatorNet().to(device)
+    cases = [
+        ("shared", [shared_net] * (NUM_SCALES + 1)),
+        ("per-scale", [MelDiscriminatorNet().to(device) for _ in range(NUM_SCALES + 1)]),
+    ]
+    rows = []
+    for disc_name, disc_nets in cases:
+        for batch_size in BATCH_SIZES:
+            real = torch.randn(batch_size, AUDIO_LENGTH, device=device)
+            fake = torch.randn(batch_size, AUDIO_LENGTH, device=device)
+            for loss_name, loss in get_losses(disc_nets, device):
+                for step_name in ["discriminator", "generator"]:
+                    step_ms = time_steps(loss, step_name, real, fake, device)
+                    rows.append([disc_name, batch_size, loss_name, step_name, step_ms])
+
+    print(f"\nMulti-scale loss on {device}, mean of {NUM_STEPS} steps\n")
+    header = "{: <12}{: >7}  {: <12}{: <16}{: >12}"
+    print(header.format("Disc", "Batch", "Loss", "Step", "Step (ms)"))
+    for row in rows:
+        print("{: <12}{: >7}  {: <12}{: <16}{: >12.1f}".format(*row))
+
+
+def time_steps(loss, step_name, real, fake, device):
+    """
+    Returns the mean forward and backward time of the loss in ms.
+    """
+    if step_name == "generator":
+        fake = fake.detach().requires_grad_(True)
+        loss_fn = loss.for_generator
+    else:
+        loss_fn = loss.for_discriminator
+
+    def step():
+        loss_fn(real, fake).backward()
+        if device == "cuda":
+            torch.cuda.synchronize()
+
+    step()
+    start = time.time()
+    for _ in range(NUM_STEPS):
+        step()
+
+    return 1000 * (time.time() - start) / NUM_STEPS
+
+
+if __name__ == "__main__":
+    run_benchmark()
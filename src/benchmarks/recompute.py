@@ -0,0 +1,115 @@
+"""
+Map batch size to activation memory and training step time, for each recompute policy
+(see recompute.py). Activation memory is estimated from a single sample by the policy,
+and on GPU the measured peak memory is reported too.
+
+    python -m src.benchmarks.recompute
+"""
+import time
+
+import torch
+
+from src.utils.recompute import RecomputePolicy, measure_layers
+from src.tasks.acoustic_scenes.model import SceneNet, MIN_SAMPLES
+from src.tasks.speech_denoise.model import SpeechDenoiseNet
+
+NUM_STEPS = 3
+BATCH_SIZES = [4, 8, 16]
+SPEECH_SAMPLES = 2 ** 14
+# Fraction of the activation memory used without recomputation.
+BUDGET_FRACTIONS = [0.5, 0.25]
+
+
+def get_scene_net(device):
+    net = SceneNet().to(device)
+    return net, net.conv_layers, MIN_SAMPLES
+
+
+def get_speech_denoise_net(device):
+    net = SpeechDenoiseNet().to(device)
+    return net, net.convs, SPEECH_SAMPLES
+
+
+BENCHMARKS = [
+    ("SceneNet", get_scene_net),
+    ("SpeechDenoiseNet", get_speech_denoise_net),
+]
+
+
+def run_benchmark():
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    rows = []
+    for name, get_benchmark in BENCHMARKS:
+        net, layers, num_samples = get_benchmark(device)
+        sample_input = torch.zeros(1, 1, num_samples, device=device)
+        sizes = measure_layers(net, layers, sample_input)
+        sample_bytes = sum(saved for saved, _ in sizes)
+        for batch_size in BATCH_SIZES:
+            policies = [("off", RecomputePolicy(None)), ("all", RecomputePolicy(0))]
+            for fraction in BUDGET_FRACTIONS:
+                budget = int(fraction * batch_size * sample_bytes)
+                policies.append((f"{fraction:.0%} budget", RecomputePolicy(budget)))
+
+            for policy_name, policy in policies:
+                net.set_recompute_policy(policy, batch_size, num_samples)
+                activation_bytes = batch_size * sum(
+                    inputs if idx in net.recompute_layers else saved
+                    for idx, (saved, inputs) in enumerate(sizes)
+                )
+                step_ms, peak_bytes = time_steps(net, batch_size, num_samples, device)
+                peak_mb = f"{peak_bytes / 2 ** 20:.0f}" if peak_bytes else "-"
+                rows.append(
+                    [
+                        name,
+                        batch_size,
+                        policy_name,
+                        len(net.recompute_layers),
+                        activation_bytes / 2 ** 20,
+                        peak_mb,
+                        step_ms,
+                    ]
+                )
+
+    print(f"\nTraining steps on {device}, mean of {NUM_STEPS} steps\n")
+    header = "{: <18}{: >7}  {: <12}{: >12}{: >18}{: >16}{: >12}"
+    columns = [
+        "Model",
+        "Batch",
+        "Policy",
+        "Recomputed",
+        "Activations (MB)",
+        "Peak GPU (MB)",
+        "Step (ms)",
+    ]
+    print(header.format(*columns))
+    for row in rows:
+        print("{: <18}{: >7}  {: <12}{: >12}{: >18.0f}{: >16}{: >12.1f}".format(*row))
+
+
+def time_steps(net, batch_size, num_samples, device):
+    """
+    Returns the mean forward and backward step time in ms, and peak GPU memory in bytes.
+    """
+    input_t = torch.randn(batch_size, 1, num_samples, device=device)
+
+    def step():
+        net.zero_grad()
+        net(input_t).float().mean().backward()
+        if device == "cuda":
+            torch.cuda.synchronize()
+
+    step()
+    if device == "cuda":
+        torch.cuda.reset_peak_memory_stats()
+
+    start = time.time()
+    for _ in range(NUM_STEPS):
+        step()
+
+    step_ms = 1000 * (time.time() - start) / NUM_STEPS
+    peak_bytes = torch.cuda.max_memory_allocated() if device == "cuda" else None
+    return step_ms, peak_bytes
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,54 @@
+"""
+Measure CLI startup time, and time to first batch for each training task.
+Each measurement runs in a fresh Python process, best of a few runs.
+
+Time to first batch covers starting Python, importing the task, and getting the first
+batch from the Trainer's data loader. The loader reads an in-memory dataset, so this
+measures start up overhead rather than reading data from disk.
+
+    python -m src.benchmarks.startup
+"""
+import sys
+import time
+import subprocess
+
+from src.tasks.tasks import TASKS
+
+NUM_RUNS = 3
+FIRST_BATCH_SCRIPT = """
+from src.tasks.tasks import get_task
+get_task("{task_name}")
+
+import torch
+from torch.utils.data import TensorDataset
+from src.utils.trainer import Trainer
+
+audio = torch.zeros(64, 2 ** 15)
+loader = Trainer(cuda=False).load_data_loader(TensorDataset(audio, audio), batch_size=16)
+next(iter(loader))
+"""
+
+
+def run_benchmark():
+    print(f"Start up time, best of {NUM_RUNS} runs\n")
+    help_s = time_command([sys.executable, "-m", "src", "--help"])
+    print("{: <30}{: >10.2f}s\n".format("python -m src --help", help_s))
+    print("{: <30}{: >11}".format("Task", "First batch"))
+    for task_name in TASKS:
+        script = FIRST_BATCH_SCRIPT.format(task_name=task_name)
+        first_batch_s = time_command([sys.executable, "-c", script])
+        print("{: <30}{: >10.2f}s".format(task_name, first_batch_s))
+
+
+def time_command(command):
+    durations = []
+    for _ in range(NUM_RUNS):
+        start = time.time()
+        subprocess.run(command, check=True, capture_output=True)
+        durations.append(time.time() - start)
+
+    return min(durations)
+
+
+if __name__ == "__main__":
+    run_benchmark()
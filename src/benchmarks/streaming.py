@@ -0,0 +1,52 @@
+"""
+Measure latency and throughput of the streaming enhancement pipelines on CPU.
+
+    python -m src.benchmarks.streaming
+"""
+import numpy as np
+import torch
+
+from src.tasks.waveunet.models.wave_u_net import WaveUNet
+from src.tasks.waveunet.models.streaming import StreamingWaveUNet
+from src.tasks.spectral_u_net.model import SpectralUNet
+from src.tasks.spectral_u_net.streaming import StreamingSpectralUNet
+
+SAMPLING_RATE = 16000
+AUDIO_SECONDS = 5
+HOP = 256
+
+
+def run_benchmark():
+    audio = np.random.uniform(-1, 1, AUDIO_SECONDS * SAMPLING_RATE).astype("float32")
+    print(f"Streaming {AUDIO_SECONDS}s of audio in hops of {HOP} samples\n")
+    print(
+        "{: <30}{: >15}{: >15}{: >15}".format(
+            "Pipeline", "Latency (ms)", "RTF", "x realtime"
+        )
+    )
+
+    wave_stream = StreamingWaveUNet(WaveUNet(causal=True).eval(), hop=HOP)
+    audio_t = torch.tensor(audio).view(1, -1)
+    for idx in range(0, audio_t.shape[1], HOP):
+        wave_stream.step(audio_t[:, idx : idx + HOP])
+
+    print_result("WaveUNet (causal)", wave_stream)
+
+    for update_frames in [1, 4, 16]:
+        spec_stream = StreamingSpectralUNet(
+            SpectralUNet().eval(), update_frames=update_frames
+        )
+        for idx in range(0, len(audio), HOP):
+            spec_stream.step(audio[idx : idx + HOP])
+
+        print_result(f"SpectralUNet (update {update_frames})", spec_stream)
+
+
+def print_result(name, stream):
+    rtf = stream.real_time_factor
+    row = "{: <30}{: >15.1f}{: >15.3f}{: >15.1f}"
+    print(row.format(name, stream.latency_ms, rtf, 1 / rtf))
+
+
+if __name__ == "__main__":
+    run_benchmark()
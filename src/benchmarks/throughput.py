@@ -0,0 +1,324 @@
+"""
+Measure end-to-end training throughput of each task in TASKS, without any data from S3.
+
+Each task runs its real training function with the Trainer, models and losses, but its
+dataset is replaced with random in-memory data of the right shapes, and feature loss
+networks are untrained stand-ins rather than checkpoints. A task is stopped after a
+fixed number of training steps, so for tasks with several training phases only the
+first phase is measured.
+
+Reports, for each task:
+
+- training steps and samples per second, after a few warm up steps
+- the share of step time spent waiting on the data loader
+- peak host memory (max RSS of the training process, not data loader workers)
+- peak device memory, on GPU
+
+Each task runs in a fresh process, so peak memory isn't shared between tasks.
+
+    python -m src.benchmarks.throughput
+    python -m src.benchmarks.throughput --task spectral_unet_fl --steps 20 --output out.json
+"""
+import os
+import json
+import time
+import resource
+import importlib
+import contextlib
+import multiprocessing
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+import torch
+from torch.utils.data import Dataset
+
+from src.tasks.tasks import TASKS
+
+NUM_STEPS = 10
+NUM_WARMUP_STEPS = 2
+BATCH_SIZE = 4
+# Number of distinct random items in each synthetic dataset, which are repeated.
+NUM_UNIQUE_ITEMS = 8
+NUM_LABELS = 15
+# Synthetic data for each task: the names of the task module's datasets, the shape of an
+# input and a target (None for a class label), and the feature loss network, if any.
+TASK_DATA = {
+    "waveunet_train_gan": ("NoisySpeechDataset", [2 ** 15], [2 ** 15], None),
+    "waveunet_train_mse": (
+        ("NoisySpeechDataset", "NoisyLibreSpeechDataset", "NoisyScenesDataset"),
+        [2 ** 15],
+        [2 ** 15],
+        None,
+    ),
+    "waveunet_train_fl": (
+        "Dataset",
+        [2 ** 15],
+        [2 ** 15],
+        "src.tasks.acoustic_scenes.model:SceneNet",
+    ),
+    "spectral_unet_train": ("Dataset", [1, 80, 256], [1, 80, 256], None),
+    "spectral_unet_fl": (
+        "Dataset",
+        [1, 80, 256],
+        [1, 80, 256],
+        "src.tasks.acoustic_scenes_spectral.model:SpectralSceneNet",
+    ),
+    "scene_net_train": ("Dataset", [32767], None, None),
+    "scene_net_spectral_train": ("Dataset", [1, 80, 256], None, None),
+}
+# Fixed hyperparams for tasks which sample them.
+HYPERPARAMS = {
+    "scene_net_train": {
+        "learning_rate": 1e-4,
+        "weight_decay": 1e-5,
+        "adam_betas": (0.9, 0.99),
+    },
+}
+# Training config for tasks with optional features, so that they're measured too.
+TRAINING = {
+    "waveunet_train_mse": {"mix_librispeech": True},
+}
+
+
+@click.command()
+@click.option("--task", "task_names", multiple=True, type=click.Choice(list(TASKS)))
+@click.option("--steps", default=NUM_STEPS, help="Training steps to time.")
+@click.option("--warmup", default=NUM_WARMUP_STEPS, help="Untimed steps first.")
+@click.option("--batch-size", default=BATCH_SIZE)
+@click.option("--cuda/--no-cuda", default=torch.cuda.is_available())
+@click.option("--output", default=None, help="Path to write results JSON to.")
+@click.option("--verbose", is_flag=True, help="Show training output.")
+def benchmark_cli(task_names, steps, warmup, batch_size, cuda, output, verbose):
+    """
+    Measure training throughput of each task with synthetic data
+    """
+    task_names = task_names or list(TASKS)
+    device = "cuda" if cuda else "cpu"
+    print(f"Training on {device}, batch size {batch_size}, {steps} steps per task\n")
+    row = "{: <28}{: >10}{: >12}{: >12}{: >14}{: >14}"
+    columns = ["Task", "Steps/s", "Samples/s", "Data wait", "Host (MB)", "GPU (MB)"]
+    print(row.format(*columns))
+    # CUDA can't be used in forked processes.
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for task_name in task_names:
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            args = (task_name, steps, warmup, batch_size, cuda, verbose)
+            result = pool.submit(run_task, *args).result()
+
+        results[task_name] = result
+        gpu_mb = f"{result['peak_gpu_mb']:.0f}" if cuda else "-"
+        print(
+            "{: <28}{: >10.2f}{: >12.1f}{: >12.0%}{: >14.0f}{: >14}".format(
+                task_name,
+                result["steps_per_s"],
+                result["samples_per_s"],
+                result["data_wait"],
+                result["peak_host_mb"],
+                gpu_mb,
+            )
+        )
+
+    if output:
+        report = {
+            "device": device,
+            "batch_size": batch_size,
+            "steps": steps,
+            "torch": torch.__version__,
+            "results": results,
+        }
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+        print(f"\nSaved results to {output}")
+
+
+def run_task(task_name, num_steps, num_warmup, batch_size, use_cuda, verbose=False):
+    """
+    Train a task on synthetic data for a fixed number of steps, returns its throughput.
+    """
+    module_name, fn_name = TASKS[task_name].split(":")
+    module = importlib.import_module(module_name)
+    dataset_names, input_shape, target_shape, loss_net_path = TASK_DATA[task_name]
+    if isinstance(dataset_names, str):
+        dataset_names = [dataset_names]
+
+    num_items = (num_warmup + num_steps) * batch_size
+
+    def get_dataset(*args, train=True, subsample=None):
+        # A single batch is enough for validation.
+        length = num_items if train else batch_size
+        return SyntheticDataset(input_shape, target_shape, length, train)
+
+    timer = StepTimer(num_steps, num_warmup, use_cuda)
+    load_data_loader = module.Trainer.load_data_loader
+    load_multi_source_data_loaders = module.Trainer.load_multi_source_data_loaders
+
+    def load_timed_data_loader(trainer, dataset, batch_size):
+        loader = load_data_loader(trainer, dataset, batch_size)
+        return TimedDataLoader(loader, timer) if dataset.train else loader
+
+    def load_timed_multi_source_data_loaders(trainer, *args, **kwargs):
+        # Time the mixed batches, rather than each source's batches.
+        with mock.patch.object(module.Trainer, "load_data_loader", load_data_loader):
+            train_loader, test_loader = load_multi_source_data_loaders(
+                trainer, *args, **kwargs
+            )
+
+        return TimedDataLoader(train_loader, timer), test_loader
+
+    runtime = {"cuda": use_cuda}
+    training = {"epochs": 1, "batch_size": batch_size, "subsample": None}
+    training.update(TRAINING.get(task_name, {}))
+    logging = {
+        "wandb": {"project_name": None, "run_name": None},
+        "checkpoint": {"save_name": None, "save_epochs": None},
+    }
+    kwargs = {}
+    if task_name in HYPERPARAMS:
+        kwargs["hyperparams"] = {**HYPERPARAMS[task_name], "batch_size": batch_size}
+
+    with contextlib.ExitStack() as stack:
+        for dataset_name in dataset_names:
+            stack.enter_context(mock.patch.object(module, dataset_name, get_dataset))
+
+        stack.enter_context(
+            mock.patch.object(
+                module.Trainer, "load_data_loader", load_timed_data_loader
+            )
+        )
+        stack.enter_context(
+            mock.patch.object(
+                module.Trainer,
+                "load_multi_source_data_loaders",
+                load_timed_multi_source_data_loaders,
+            )
+        )
+        if loss_net_path:
+            loss_net_class = get_class(loss_net_path)
+            load_loss_net = lambda *args, **kwargs: loss_net_class()
+            stack.enter_context(
+                mock.patch.object(module, "load_checkpoint", load_loss_net)
+            )
+
+        if not verbose:
+            devnull = stack.enter_context(open(os.devnull, "w"))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+            stack.enter_context(contextlib.redirect_stderr(devnull))
+
+        try:
+            getattr(module, fn_name)(runtime, training, logging, **kwargs)
+        except StopBenchmark:
+            pass
+
+    assert timer.num_timed_steps, f"Task {task_name} ran no timed steps"
+    steps_per_s = timer.num_timed_steps / timer.step_s
+    return {
+        "steps": timer.num_timed_steps,
+        "steps_per_s": steps_per_s,
+        "samples_per_s": steps_per_s * batch_size,
+        "data_wait": timer.wait_s / timer.step_s,
+        # Linux reports max RSS in KB.
+        "peak_host_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10,
+        "peak_gpu_mb": torch.cuda.max_memory_allocated() / 2 ** 20 if use_cuda else None,
+    }
+
+
+def get_class(path):
+    module_name, class_name = path.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class SyntheticDataset(Dataset):
+    """
+    Random inputs and targets of fixed shapes, held in memory.
+    Targets are class labels if `target_shape` is None.
+    """
+
+    def __init__(self, input_shape, target_shape, length, train):
+        self.length = length
+        self.train = train
+        # Some tasks switch their dataset to clean speech only.
+        self.clean_only = False
+        generator = torch.Generator().manual_seed(0 if train else 1)
+        num_unique = min(length, NUM_UNIQUE_ITEMS)
+        self.inputs = torch.rand([num_unique] + input_shape, generator=generator)
+        if target_shape:
+            self.targets = torch.rand([num_unique] + target_shape, generator=generator)
+        else:
+            self.targets = torch.randint(NUM_LABELS, [num_unique], generator=generator)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        idx = idx % len(self.inputs)
+        return self.inputs[idx], self.targets[idx]
+
+
+class StopBenchmark(Exception):
+    pass
+
+
+class StepTimer:
+    """
+    Adds up the time of each training step, and the time spent waiting for its batch.
+    Stops training once enough steps have been timed.
+    """
+
+    def __init__(self, num_steps, num_warmup, use_cuda):
+        self.num_steps = num_steps
+        self.num_warmup = num_warmup
+        self.use_cuda = use_cuda
+        self.num_total_steps = 0
+        self.num_timed_steps = 0
+        self.wait_s = 0
+        self.step_s = 0
+
+    def add_step(self, wait_s, start_time):
+        if self.use_cuda:
+            torch.cuda.synchronize()
+
+        self.num_total_steps += 1
+        if self.num_total_steps > self.num_warmup:
+            self.num_timed_steps += 1
+            self.wait_s += wait_s
+            self.step_s += time.time() - start_time
+
+        if self.num_timed_steps == self.num_steps:
+            raise StopBenchmark()
+
+
+class TimedDataLoader:
+    """
+    Wraps a data loader to time each training step: a step starts when the Trainer asks
+    for a batch, and ends when it asks for the next one.
+    """
+
+    def __init__(self, loader, timer):
+        self.loader = loader
+        self.timer = timer
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def __iter__(self):
+        batches = iter(self.loader)
+        while True:
+            start_time = time.time()
+            try:
+                batch = next(batches)
+            except StopIteration:
+                return
+
+            wait_s = time.time() - start_time
+            yield batch
+            self.timer.add_step(wait_s, start_time)
+
+
+if __name__ == "__main__":
+    benchmark_cli()
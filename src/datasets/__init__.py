@@ -1,13 +1,31 @@
-# Scenes datasets
-from .scenes.chime.chime_dataset import ChimeDataset
-from .scenes.tut_acoustic_scenes.scene_dataset import SceneDataset
-from .scenes.tut_acoustic_scenes.scene_dataset_spectral import SpectralSceneDataset
-
-# Speech datasets
-from .speech.noisy_speech.speech_dataset import NoisySpeechDataset
-from .speech.noisy_speech.speech_dataset_spectral import NoisySpectralSpeechDataset
-from .speech.silence.silence_dataset import SilenceDataset
-from .speech.augmented_speech.augmented_speech import AugmentedSpeechDataset
-from .speech.speech_evaluation.dataset import SpeechEvaluationDataset
-from .speech.noisy_librispeech.librispeech_dataset import NoisyLibreSpeechDataset
-from .speech.noisy_librispeech.noise_data import NoisyScenesDataset
+"""
+Datasets are imported when first accessed, eg. `from src.datasets import SceneDataset`
+only imports the scene dataset module, not every dataset and its dependencies.
+"""
+import importlib
+
+DATASETS = {
+    # Scenes datasets
+    "ChimeDataset": ".scenes.chime.chime_dataset",
+    "SceneDataset": ".scenes.tut_acoustic_scenes.scene_dataset",
+    "SpectralSceneDataset": ".scenes.tut_acoustic_scenes.scene_dataset_spectral",
+    # Speech datasets
+    "NoisySpeechDataset": ".speech.noisy_speech.speech_dataset",
+    "NoisySpectralSpeechDataset": ".speech.noisy_speech.speech_dataset_spectral",
+    "SilenceDataset": ".speech.silence.silence_dataset",
+    "AugmentedSpeechDataset": ".speech.augmented_speech.augmented_speech",
+    "SpeechEvaluationDataset": ".speech.speech_evaluation.dataset",
+    "NoisyLibreSpeechDataset": ".speech.noisy_librispeech.librispeech_dataset",
+    "NoisyScenesDataset": ".speech.noisy_librispeech.noise_data",
+    "SyntheticSpeechDataset": ".speech.synthetic.synthetic_dataset",
+}
+
+__all__ = list(DATASETS)
+
+
+def __getattr__(name):
+    if name not in DATASETS:
+        raise AttributeError(f"module {__name__} has no attribute {name}")
+
+    module = importlib.import_module(DATASETS[name], __name__)
+    return getattr(module, name)
@@ -23,6 +23,7 @@ class NoisyLibreSpeechDataset(S3BackedDataset):
     """
 
     def __init__(self, noise_data, train, subsample=None, quiet=True):
+        self.clean_only = False
         self.quiet = quiet
         self.noise_data = noise_data
         super().__init__(dataset_name=DATASET_NAME, quiet=quiet)
@@ -62,9 +63,12 @@ class NoisyLibreSpeechDataset(S3BackedDataset):
         Get item by integer index,
         """
         clean = self.clean_data[idx]
+        clean_chunk = subsample_chunk_random(clean, AUDIO_LENGTH)
+        if self.clean_only:
+            return clean_chunk, clean_chunk
+
         noise_idx = random.randint(0, len(self.noise_data) - 1)
         noise = self.noise_data[noise_idx]
-        clean_chunk = subsample_chunk_random(clean, AUDIO_LENGTH)
         noise_chunk = subsample_chunk_random(noise, AUDIO_LENGTH)
         noise_chunk = noise_chunk * random.randint(1, 10)
         noise_chunk[noise_chunk > 1] = 1
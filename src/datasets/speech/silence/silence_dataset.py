@@ -1,10 +1,5 @@
-import os
-
-import numpy as np
 import torch
-from tqdm import tqdm
 from torch.utils.data import Dataset
-from scipy.io import wavfile
 
 NUM_SAMPLES = 500
 SAMPLE_LENGTH = 32767
@@ -17,28 +12,17 @@ class SilenceDataset(Dataset):
 
     def __init__(self, train):
         dataset_label = "training" if train else "validation"
-        print(f"Loading {dataset_label} silence dataset into memory.")
-
-        print("Loading clean data...")
-        self.clean_data = [
-            np.zeros(SAMPLE_LENGTH).astype("float32") for _ in range(NUM_SAMPLES)
-        ]
-
-        print("Loading noisy data...")
-        self.noisy_data = [
-            np.zeros(SAMPLE_LENGTH).astype("float32") for _ in range(NUM_SAMPLES)
-        ]
-
-        print("Done loading dataset into memory.")
+        print(f"Using {dataset_label} silence dataset.")
 
     def __len__(self):
         """
         How many samples there are in the dataset.
         """
-        return len(self.noisy_data)
+        return NUM_SAMPLES
 
     def __getitem__(self, idx):
         """
         Get item by integer index,
+        Silence is made on demand, rather than keeping arrays of zeros in memory.
         """
-        return torch.tensor(self.noisy_data[idx]), torch.tensor(self.clean_data[idx])
+        return torch.zeros(SAMPLE_LENGTH), torch.zeros(SAMPLE_LENGTH)
@@ -7,7 +7,6 @@ import sys
 import torch
 import numpy as np
 from tqdm import tqdm
-import matplotlib.pyplot as plt
 from scipy.io import wavfile
 
 
@@ -65,7 +64,7 @@ def evaluate(checkpoints, samples):
     for checkpoint in checkpoints:
         name = checkpoint["name"]
         print(f"\tLoading checkpoint {name}")
-        net = load_checkpoint(checkpoint["file"], use_cuda=USE_CUDA)
+        net = load_checkpoint(checkpoint["file"], use_cuda=USE_CUDA, pin=True)
         net.eval()
         checkpoint["net"] = net
 
@@ -124,6 +123,8 @@ def save_audio_array(snippet, snippets, sample_id, name, arr):
 
     # Save audio imagery
     save_filepath = os.path.join(save_dir, "plot.png")
+    import matplotlib.pyplot as plt
+
     plt.ioff()
     fig, (ax1, ax2) = plt.subplots(ncols=2)
     fig.set_size_inches(16, 6)
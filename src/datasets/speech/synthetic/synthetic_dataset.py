@@ -0,0 +1,157 @@
+"""
+Synthetic noisy speech, generated on demand, for load testing without any downloads.
+
+Each item is synthesized from the dataset's seed and the item's index, so it's the same
+every time it's read, and nothing is held in memory: the dataset can have any length.
+
+Speech is a sum of harmonics of a slowly gliding pitch, shaped by a few moving formants
+and a syllable-rate loudness envelope with pauses. Noise is colored (white, pink or
+brown) or babble, a mix of several other synthetic voices. Noise is added to the speech
+at a random SNR.
+"""
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+SAMPLING_RATE = 16000
+AUDIO_LENGTH = 2 ** 15
+TRAIN_ITEMS = 100000
+TEST_ITEMS = 1000
+NOISE_TYPES = ("white", "pink", "brown", "babble")
+# Spectral slope of colored noise, power falls off as 1 / f ^ exponent
+NOISE_EXPONENTS = {"white": 0, "pink": 1, "brown": 2}
+NUM_BABBLE_VOICES = 4
+SNR_RANGE_DB = (0, 20)
+PITCH_RANGE = (80, 300)
+# Centre frequency range for each formant, and formant bandwidth.
+FORMANT_RANGES = ((300, 900), (900, 2500), (2500, 3500))
+FORMANT_WIDTH = 200
+MAX_HARMONIC_FREQ = 4000
+SYLLABLE_RATE = 4  # Syllables per second
+CONTROL_HOP = 32
+
+
+class SyntheticSpeechDataset(Dataset):
+    """
+    A dataset of synthetic noisy speech, with the same items as NoisySpeechDataset.
+    The input is a 1D tensor of floats, the noisy speech.
+    The target is a 1D tensor of floats, the clean speech.
+    """
+
+    def __init__(
+        self,
+        train,
+        subsample=None,
+        num_items=None,
+        audio_length=AUDIO_LENGTH,
+        seed=0,
+        noise_types=NOISE_TYPES,
+    ):
+        """
+        subsample or num_items set the length of the dataset, which is otherwise
+        TRAIN_ITEMS or TEST_ITEMS. Training and test items differ for the same seed.
+        """
+        default_items = TRAIN_ITEMS if train else TEST_ITEMS
+        self.num_items = subsample or num_items or default_items
+        self.audio_length = audio_length
+        self.seed = seed
+        self.train = train
+        self.noise_types = noise_types
+        self.clean_only = False
+
+    def __len__(self):
+        """
+        How many samples there are in the dataset.
+        """
+        return self.num_items
+
+    def __getitem__(self, idx):
+        """
+        Get item by integer index, returns noisy, clean
+        """
+        if idx < 0 or idx >= self.num_items:
+            raise IndexError(f"Index {idx} out of range for {self.num_items} items")
+
+        rng = np.random.default_rng([self.seed, int(self.train), idx])
+        clean = synthesize_speech(rng, self.audio_length)
+        clean_t = torch.tensor(clean)
+        if self.clean_only:
+            return clean_t, clean_t
+
+        noise_type = self.noise_types[rng.integers(len(self.noise_types))]
+        noise = synthesize_noise(rng, self.audio_length, noise_type)
+        snr_db = rng.uniform(*SNR_RANGE_DB)
+        noise *= get_rms(clean) / get_rms(noise) / 10 ** (snr_db / 20)
+        noisy = np.clip(clean + noise, -1, 1).astype("float32")
+        return torch.tensor(noisy), clean_t
+
+
+def synthesize_speech(rng, length):
+    """
+    Returns float32 array of a single synthetic voice.
+    """
+    # Pitch glides around the speaker's base pitch.
+    pitch = rng.uniform(*PITCH_RANGE) * (1 + 0.15 * get_smooth_noise(rng, length, 3))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLING_RATE
+    # Harmonic amplitudes change slowly, so they're computed every CONTROL_HOP samples.
+    control_pitch = pitch[::CONTROL_HOP]
+    num_harmonics = int(MAX_HARMONIC_FREQ // PITCH_RANGE[0])
+    freqs = np.arange(1, num_harmonics + 1)[:, None] * control_pitch
+    # Harmonics fall off with frequency, except near a formant.
+    amplitudes = 1 / np.arange(1, num_harmonics + 1)[:, None]
+    for low, high in FORMANT_RANGES:
+        formant = rng.uniform(low, high) * (
+            1 + 0.1 * get_smooth_noise(rng, length, SYLLABLE_RATE)[::CONTROL_HOP]
+        )
+        amplitudes = amplitudes + np.exp(-(((freqs - formant) / FORMANT_WIDTH) ** 2))
+
+    amplitudes[freqs > MAX_HARMONIC_FREQ] = 0
+    amplitudes = np.repeat(amplitudes, CONTROL_HOP, axis=1)[:, :length]
+    offsets = rng.uniform(0, 2 * np.pi, (num_harmonics, 1))
+    harmonics = np.arange(1, num_harmonics + 1)[:, None]
+    # Float32 is precise enough here, and about twice as fast.
+    phases = (harmonics * phase + offsets).astype("float32")
+    speech = np.sum(amplitudes * np.sin(phases), axis=0)
+
+    # Syllables, with pauses where the envelope is below zero.
+    envelope = np.clip(get_smooth_noise(rng, length, SYLLABLE_RATE) + 0.3, 0, None)
+    speech *= envelope ** 2
+    peak = np.abs(speech).max()
+    if peak > 0:
+        speech *= rng.uniform(0.1, 0.5) / peak
+
+    return speech.astype("float32")
+
+
+def synthesize_noise(rng, length, noise_type):
+    """
+    Returns float32 array of colored noise, or babble.
+    """
+    if noise_type == "babble":
+        voices = [synthesize_speech(rng, length) for _ in range(NUM_BABBLE_VOICES)]
+        return np.sum(voices, axis=0)
+
+    white = rng.standard_normal(length)
+    exponent = NOISE_EXPONENTS[noise_type]
+    if exponent == 0:
+        return white.astype("float32")
+
+    spectrum = np.fft.rfft(white)
+    freqs = np.fft.rfftfreq(length)
+    freqs[0] = freqs[1]  # Avoid dividing by zero at DC
+    noise = np.fft.irfft(spectrum / freqs ** (exponent / 2), n=length)
+    return (noise / noise.std()).astype("float32")
+
+
+def get_smooth_noise(rng, length, rate):
+    """
+    Returns random values in [-1, 1], which change smoothly `rate` times per second.
+    """
+    num_points = int(length * rate / SAMPLING_RATE) + 2
+    points = rng.uniform(-1, 1, num_points)
+    positions = np.linspace(0, num_points - 1, length)
+    return np.interp(positions, np.arange(num_points), points)
+
+
+def get_rms(arr):
+    return max(np.sqrt(np.mean(arr ** 2)), 1e-8)
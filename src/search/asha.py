@@ -0,0 +1,54 @@
+"""
+Asynchronous successive halving (ASHA) for early stopping of hyperparameter trials.
+From "A System for Massively Parallel Hyperparameter Tuning" (Li et al. 2018)
+
+Each trial reports its validation metric at a series of "rungs": after `min_epochs`,
+then `min_epochs * eta`, `min_epochs * eta ** 2` epochs and so on. At each rung, a trial
+only carries on if it's in the top 1 / eta of all trials that have reached that rung so
+far. Trials never wait for each other, so workers are always busy.
+"""
+import math
+
+ETA = 3
+
+
+class ASHA:
+    """
+    rungs is a dict-like mapping of rung epochs to reported values,
+        eg. a multiprocessing Manager dict, shared by all trials
+    lock guards updates to rungs, eg. a multiprocessing Manager lock
+    mode is "min" if lower values are better, or "max" if higher values are better
+    """
+
+    def __init__(self, rungs, lock, min_epochs, max_epochs, eta=ETA, mode="min"):
+        assert mode in ("min", "max"), f"Unknown mode {mode}"
+        self.rungs = rungs
+        self.lock = lock
+        self.eta = eta
+        self.mode = mode
+        self.rung_epochs = []
+        rung_epoch = min_epochs
+        while rung_epoch < max_epochs:
+            self.rung_epochs.append(rung_epoch)
+            rung_epoch *= eta
+
+    def should_stop(self, num_epochs, value):
+        """
+        Report a trial's value after some number of epochs,
+        returns True if the trial should stop.
+        """
+        if num_epochs not in self.rung_epochs:
+            return False
+
+        with self.lock:
+            values = list(self.rungs.get(num_epochs, [])) + [value]
+            self.rungs[num_epochs] = values
+
+        is_reversed = self.mode == "max"
+        ranked = sorted(values, reverse=is_reversed)
+        num_promoted = math.ceil(len(values) / self.eta)
+        cutoff = ranked[num_promoted - 1]
+        if self.mode == "min":
+            return value > cutoff
+        else:
+            return value < cutoff
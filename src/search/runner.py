@@ -0,0 +1,186 @@
+"""
+Hyperparameter search, running trials in parallel on local GPUs or CPU cores.
+
+Each trial trains with hyperparams from the task's `sample_hyperparams` (random search).
+Trials which aren't promising are stopped early with ASHA, based on the mean validation
+loss of each epoch, logged by the Trainer, see `asha.py`. Each finished trial is
+appended to a JSONL results file, so one machine can run a whole sweep.
+
+    python -m src.search.runner --task scene_net_train --trials 32 --epochs 27
+"""
+import os
+import json
+import time
+import random
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import click
+import torch
+
+from .asha import ASHA, ETA
+
+RESULTS_DIR = "data/search"
+METRIC = "Mean Validation Loss"
+# Searchable tasks, with the module that has their `train` and `sample_hyperparams`
+SEARCH_TASKS = {
+    "scene_net_train": "src.tasks.acoustic_scenes.train",
+}
+
+
+@click.command()
+@click.option("--task", type=click.Choice(list(SEARCH_TASKS)), required=True)
+@click.option("--trials", default=16, help="Number of trials to run.")
+@click.option("--epochs", default=27, help="Max epochs per trial.")
+@click.option("--min-epochs", default=1, help="Epochs before the first ASHA rung.")
+@click.option("--workers", default=None, type=int, help="Defaults to GPU or CPU count.")
+@click.option("--cuda/--no-cuda", default=torch.cuda.is_available())
+@click.option("--subsample", default=None, type=int)
+@click.option("--seed", default=0)
+def search_cli(task, trials, epochs, min_epochs, workers, cuda, subsample, seed):
+    """
+    Run a hyperparameter search
+    """
+    results_path = os.path.join(RESULTS_DIR, f"{task}-{int(time.time())}.jsonl")
+    results = run_search(
+        SEARCH_TASKS[task],
+        results_path,
+        num_trials=trials,
+        max_epochs=epochs,
+        min_epochs=min_epochs,
+        num_workers=workers,
+        use_cuda=cuda,
+        subsample=subsample,
+        seed=seed,
+    )
+    print(f"\nBest trials, saved to {results_path}:")
+    for result in sorted(results, key=lambda r: r["best"])[:5]:
+        print(
+            json.dumps({k: result[k] for k in ("trial_id", "best", "epochs", "status")})
+        )
+        print("\t", json.dumps(result["hyperparams"]))
+
+
+def run_search(
+    module_name,
+    results_path,
+    num_trials,
+    max_epochs,
+    min_epochs=1,
+    num_workers=None,
+    use_cuda=False,
+    subsample=None,
+    seed=0,
+    eta=ETA,
+):
+    """
+    Run a random search with ASHA early stopping, returns a list of trial results.
+    Lower values of the validation metric are better.
+    """
+    module = importlib.import_module(module_name)
+    rng = random.Random(seed)
+    gpus = list(range(torch.cuda.device_count())) if use_cuda else []
+    num_workers = num_workers or len(gpus) or os.cpu_count()
+    num_threads = max(1, os.cpu_count() // num_workers)
+    print(f"Running {num_trials} trials on {num_workers} workers")
+
+    # CUDA can't be used in forked processes.
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        asha = ASHA(manager.dict(), manager.Lock(), min_epochs, max_epochs, eta=eta)
+        # Give each worker its own GPU, if there are enough.
+        devices = manager.Queue()
+        for idx in range(num_workers):
+            devices.put(gpus[idx % len(gpus)] if gpus else None)
+
+        results = []
+        pool = ProcessPoolExecutor(
+            num_workers,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(devices, num_threads),
+        )
+        with pool:
+            futures = []
+            for trial_id in range(num_trials):
+                hyperparams = module.sample_hyperparams(rng)
+                trial_args = (module_name, trial_id, hyperparams, asha)
+                trial_kwargs = {
+                    "max_epochs": max_epochs,
+                    "use_cuda": use_cuda,
+                    "subsample": subsample,
+                }
+                futures.append(pool.submit(run_trial, *trial_args, **trial_kwargs))
+
+            for future in as_completed(futures):
+                result = future.result()
+                print(f"Trial {result['trial_id']} {result['status']}: {result['best']}")
+                save_result(results_path, result)
+                results.append(result)
+
+    return results
+
+
+def init_worker(devices, num_threads):
+    device = devices.get()
+    if device is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(device)
+
+    torch.set_num_threads(num_threads)
+
+
+def run_trial(module_name, trial_id, hyperparams, asha, max_epochs, use_cuda, subsample):
+    """
+    Train one trial, reporting to ASHA after each epoch, returns the trial's result.
+    """
+    module = importlib.import_module(module_name)
+    history = []
+    is_stopped = False
+
+    def epoch_fn(epoch, training_info):
+        nonlocal is_stopped
+        if METRIC not in training_info:
+            return False
+
+        history.append({"epoch": epoch + 1, **training_info})
+        is_stopped = asha.should_stop(epoch + 1, training_info[METRIC])
+        return is_stopped
+
+    runtime = {"cuda": use_cuda}
+    training = {
+        "epochs": max_epochs,
+        "batch_size": hyperparams.get("batch_size"),
+        "subsample": subsample,
+    }
+    logging = {
+        "wandb": {"project_name": None, "run_name": None},
+        "checkpoint": {"save_name": None, "save_epochs": None},
+    }
+    start_time = time.time()
+    module.train(runtime, training, logging, hyperparams=hyperparams, epoch_fn=epoch_fn)
+    values = [h[METRIC] for h in history]
+    return {
+        "trial_id": trial_id,
+        "hyperparams": hyperparams,
+        "status": "stopped" if is_stopped else "completed",
+        "epochs": history[-1]["epoch"] if history else 0,
+        "best": min(values) if values else None,
+        "seconds": time.time() - start_time,
+        "history": history,
+    }
+
+
+def save_result(results_path, result):
+    os.makedirs(os.path.dirname(results_path) or ".", exist_ok=True)
+    with open(results_path, "a") as f:
+        f.write(json.dumps(result) + "\n")
+
+
+def load_results(results_path):
+    with open(results_path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    search_cli()
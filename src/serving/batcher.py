@@ -0,0 +1,201 @@
+"""
+Dynamic micro-batching for speech enhancement inference.
+
+Requests from many threads are put on a queue. A single worker thread takes the first
+waiting request, then keeps collecting requests until the batch is full or the first
+request has waited `max_wait_ms`. The batch is padded, run through the model in one go,
+and the results are handed back to each waiting request.
+
+Long audio is split into overlapping chunks, which are batched like any other request,
+and then joined back together with a linear crossfade.
+"""
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+
+MAX_BATCH_SIZE = 8
+MAX_WAIT_MS = 10
+PAD_MULTIPLE = 2 ** 12  # WaveUNet decimates 12 times
+CHUNK_LENGTH = 2 ** 15  # ~2s of data at 16kHz, same as training
+CHUNK_OVERLAP = 2 ** 12
+LATENCY_WINDOW = 1000  # Number of recent requests used for latency percentiles
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        model_fn,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_wait_ms=MAX_WAIT_MS,
+        pad_multiple=PAD_MULTIPLE,
+        chunk_length=CHUNK_LENGTH,
+        chunk_overlap=CHUNK_OVERLAP,
+    ):
+        """
+        model_fn maps a float tensor (batch_size, audio_length)
+        to an enhanced tensor of the same shape.
+        """
+        assert chunk_overlap < chunk_length
+        self.model_fn = model_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pad_multiple = pad_multiple
+        self.chunk_length = chunk_length
+        self.chunk_overlap = chunk_overlap
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.num_requests = 0
+        self.num_chunks = 0
+        self.num_batches = 0
+        self.num_errors = 0
+        self.queue_waits = deque(maxlen=LATENCY_WINDOW)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.is_running = True
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        self.is_running = False
+        self.queue.put(None)
+        self.worker.join()
+
+    def enhance(self, audio_arr):
+        """
+        Enhance a 1D array of audio, blocking until the result is ready.
+        """
+        if not len(audio_arr):
+            return np.zeros(0, dtype="float32")
+
+        start_time = time.time()
+        chunks = split_chunks(audio_arr, self.chunk_length, self.chunk_overlap)
+        futures = [(start, self._submit(chunk)) for start, chunk in chunks]
+        results = [(start, future.result()) for start, future in futures]
+        output_arr = join_chunks(results, len(audio_arr), self.chunk_overlap)
+        with self.lock:
+            self.num_requests += 1
+            self.latencies.append(time.time() - start_time)
+
+        return output_arr
+
+    def metrics(self):
+        """
+        Queue and latency metrics, for monitoring.
+        """
+        with self.lock:
+            latencies = np.array(self.latencies or [0])
+            queue_waits = np.array(self.queue_waits or [0])
+            return {
+                "queue_depth": self.queue.qsize(),
+                "requests": self.num_requests,
+                "chunks": self.num_chunks,
+                "batches": self.num_batches,
+                "errors": self.num_errors,
+                "mean_batch_size": self.num_chunks / max(self.num_batches, 1),
+                "queue_wait_p50_ms": 1000 * np.percentile(queue_waits, 50),
+                "queue_wait_p99_ms": 1000 * np.percentile(queue_waits, 99),
+                "latency_p50_ms": 1000 * np.percentile(latencies, 50),
+                "latency_p99_ms": 1000 * np.percentile(latencies, 99),
+            }
+
+    def _submit(self, chunk_arr):
+        future = Future()
+        self.queue.put((time.time(), chunk_arr, future))
+        return future
+
+    def _run(self):
+        while self.is_running:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            # Wait for more requests, until the batch is full or the deadline passes.
+            batch = [item]
+            deadline = item[0] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                if item is None:
+                    self.is_running = False
+                    break
+
+                batch.append(item)
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        now = time.time()
+        lengths = [len(chunk_arr) for _, chunk_arr, _ in batch]
+        padded_length = -(-max(lengths) // self.pad_multiple) * self.pad_multiple
+        batch_arr = np.zeros((len(batch), padded_length), dtype="float32")
+        for idx, (_, chunk_arr, _) in enumerate(batch):
+            batch_arr[idx, : lengths[idx]] = chunk_arr
+
+        try:
+            with torch.no_grad():
+                outputs = self.model_fn(torch.tensor(batch_arr))
+
+            outputs = outputs.cpu().numpy()
+        except Exception as e:
+            with self.lock:
+                self.num_errors += 1
+
+            for _, _, future in batch:
+                future.set_exception(e)
+
+            return
+
+        with self.lock:
+            self.num_batches += 1
+            self.num_chunks += len(batch)
+            for enqueue_time, _, _ in batch:
+                self.queue_waits.append(now - enqueue_time)
+
+        for idx, (_, _, future) in enumerate(batch):
+            future.set_result(outputs[idx, : lengths[idx]])
+
+
+def split_chunks(audio_arr, chunk_length, overlap):
+    """
+    Split audio into overlapping chunks, returns a list of (start index, chunk).
+    """
+    hop = chunk_length - overlap
+    chunks = []
+    start = 0
+    while True:
+        chunks.append((start, audio_arr[start : start + chunk_length]))
+        if start + chunk_length >= len(audio_arr):
+            return chunks
+
+        start += hop
+
+
+def join_chunks(chunks, length, overlap):
+    """
+    Join overlapping chunks back together, crossfading linearly where they overlap.
+    """
+    output_arr = np.zeros(length, dtype="float32")
+    weights = np.zeros(length, dtype="float32")
+    fade_in = np.linspace(0, 1, overlap + 2)[1:-1]
+    for start, chunk_arr in chunks:
+        end = start + len(chunk_arr)
+        chunk_weights = np.ones(len(chunk_arr), dtype="float32")
+        if start > 0:
+            chunk_weights[:overlap] = fade_in[: len(chunk_arr)]
+        if end < length:
+            chunk_weights[-overlap:] = fade_in[::-1]
+
+        output_arr[start:end] += chunk_arr * chunk_weights
+        weights[start:end] += chunk_weights
+
+    return output_arr / np.maximum(weights, 1e-8)
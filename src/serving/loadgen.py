@@ -0,0 +1,105 @@
+"""
+Load test the speech enhancement server, reporting latency percentiles and throughput.
+
+Test a running server:
+
+    python -m src.serving.loadgen --url http://localhost:8000
+
+Or start a server in-process, with an untrained WaveUNet on CPU:
+
+    python -m src.serving.loadgen --local
+"""
+import time
+import threading
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib import request
+from urllib.error import HTTPError
+
+import click
+import numpy as np
+
+from src.datasets import SyntheticSpeechDataset
+from src.tasks.waveunet.models.wave_u_net import WaveUNet
+
+from .batcher import MicroBatcher
+from .server import EnhanceServer, get_model_fn, write_wav, SAMPLING_RATE
+
+
+@click.command()
+@click.option("--url", default="http://localhost:8000")
+@click.option(
+    "--local", is_flag=True, help="Start a local server with an untrained model"
+)
+@click.option("--concurrency", default=8)
+@click.option("--requests", "num_requests", default=64)
+@click.option("--seconds", default=2.0, help="Length of each audio upload")
+def load_test_cli(url, local, concurrency, num_requests, seconds):
+    """
+    Run a load test against the speech enhancement server
+    """
+    server = None
+    if local:
+        batcher = MicroBatcher(get_model_fn(WaveUNet(), use_cuda=False))
+        server = EnhanceServer(("localhost", 0), batcher)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://localhost:{server.server_address[1]}"
+
+    # Synthetic noisy speech, so the request audio is realistic without any downloads.
+    dataset = SyntheticSpeechDataset(
+        train=False, num_items=1, audio_length=int(seconds * SAMPLING_RATE)
+    )
+    audio_arr = dataset[0][0].numpy()
+    wav_bytes = write_wav(audio_arr)
+    results = run_load_test(url, wav_bytes, concurrency, num_requests)
+    print_results(results, seconds)
+    with request.urlopen(f"{url}/metrics") as resp:
+        print("\nServer metrics:")
+        for key, value in json.loads(resp.read()).items():
+            print(f"{key: <30}{value:0.2f}")
+
+    if server:
+        server.shutdown()
+        server.batcher.stop()
+
+
+def run_load_test(url, wav_bytes, concurrency, num_requests):
+    """
+    Send requests from `concurrency` threads, returns request latencies and status codes.
+    """
+
+    def send(_):
+        req = request.Request(f"{url}/enhance", data=wav_bytes, method="POST")
+        start = time.time()
+        try:
+            with request.urlopen(req) as resp:
+                resp.read()
+                status = resp.status
+        except HTTPError as e:
+            status = e.code
+
+        return time.time() - start, status
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        responses = list(executor.map(send, range(num_requests)))
+
+    return {"duration": time.time() - start, "responses": responses}
+
+
+def print_results(results, seconds):
+    duration = results["duration"]
+    latencies = [latency for latency, status in results["responses"] if status == 200]
+    num_ok = len(latencies)
+    num_failed = len(results["responses"]) - num_ok
+    latencies = np.array(latencies or [0])
+    print(f"{'Requests OK': <30}{num_ok}")
+    print(f"{'Requests failed': <30}{num_failed}")
+    print(f"{'Latency p50 (ms)': <30}{1000 * np.percentile(latencies, 50):0.1f}")
+    print(f"{'Latency p99 (ms)': <30}{1000 * np.percentile(latencies, 99):0.1f}")
+    print(f"{'Throughput (requests/s)': <30}{num_ok / duration:0.2f}")
+    print(f"{'Throughput (audio s/s)': <30}{num_ok * seconds / duration:0.2f}")
+
+
+if __name__ == "__main__":
+    load_test_cli()
@@ -0,0 +1,189 @@
+"""
+HTTP server for speech enhancement.
+
+Loads a WaveUNet or SpectralUNet checkpoint once, then serves:
+
+    POST /enhance   16kHz mono .wav file in the request body, returns the enhanced .wav
+    GET  /metrics   queue and latency metrics, as JSON
+
+Concurrent requests are grouped into micro-batches, see `batcher.py`.
+
+    python -m src.serving.server --checkpoint wave-u-net-fl-up-learning-rate-1575794210.full.ckpt
+"""
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+import numpy as np
+import torch
+from scipy.io import wavfile
+
+from src.utils.checkpoint import load as load_checkpoint
+from src.tasks.spectral_u_net.model import SpectralUNet
+from src.tasks.spectral_u_net.streaming import StreamingSpectralUNet
+
+from .batcher import MicroBatcher, MAX_BATCH_SIZE, MAX_WAIT_MS
+
+SAMPLING_RATE = 16000
+MAX_CONCURRENCY = 32
+
+
+def get_model_fn(net, use_cuda):
+    """
+    Get a function which enhances a batch of audio (batch_size, audio_length)
+    """
+    net.eval()
+    if isinstance(net, SpectralUNet):
+        # Spectral nets enhance the whole batch in one pass, via STFT masking.
+        stream = StreamingSpectralUNet(net, use_cuda=use_cuda)
+
+        def enhance_spectral(batch_t):
+            return torch.tensor(stream.enhance_batch(batch_t.numpy()))
+
+        return enhance_spectral
+
+    def enhance_wave(batch_t):
+        batch_t = batch_t.cuda() if use_cuda else batch_t.cpu()
+        return net(batch_t)
+
+    return enhance_wave
+
+
+class EnhanceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batcher, max_concurrency=MAX_CONCURRENCY):
+        super().__init__(address, EnhanceRequestHandler)
+        self.batcher = batcher
+        self.max_concurrency = max_concurrency
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.num_rejected = 0
+
+    def metrics(self):
+        metrics = self.batcher.metrics()
+        metrics["rejected"] = self.num_rejected
+        metrics["max_concurrency"] = self.max_concurrency
+        return metrics
+
+
+class EnhanceRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body = json.dumps(self.server.metrics()).encode()
+        self._send(200, body, "application/json")
+
+    def do_POST(self):
+        if self.path != "/enhance":
+            self.send_error(404)
+            return
+
+        # Reject requests straight away when the server is at capacity.
+        if not self.server.slots.acquire(blocking=False):
+            with self.server.lock:
+                self.server.num_rejected += 1
+
+            self.send_error(503, "Server busy")
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                audio_arr = read_wav(self.rfile.read(length))
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+
+            try:
+                output_arr = self.server.batcher.enhance(audio_arr)
+            except Exception as e:
+                self.send_error(500, "Enhancement failed", str(e))
+                return
+
+            self._send(200, write_wav(output_arr), "audio/wav")
+        finally:
+            self.server.slots.release()
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def read_wav(wav_bytes):
+    sample_rate, audio_arr = wavfile.read(io.BytesIO(wav_bytes))
+    if sample_rate != SAMPLING_RATE:
+        raise ValueError(f"Audio must be sampled at {SAMPLING_RATE}Hz")
+    if len(audio_arr.shape) != 1:
+        raise ValueError("Audio must be mono")
+
+    # Integer PCM is scaled to [-1, 1], 8-bit PCM is unsigned.
+    if audio_arr.dtype == np.uint8:
+        return (audio_arr.astype("float32") - 128) / 128
+    if np.issubdtype(audio_arr.dtype, np.integer):
+        return audio_arr.astype("float32") / np.iinfo(audio_arr.dtype).max
+
+    return audio_arr.astype("float32")
+
+
+def write_wav(audio_arr):
+    wav_file = io.BytesIO()
+    wavfile.write(wav_file, SAMPLING_RATE, audio_arr.astype("float32"))
+    return wav_file.getvalue()
+
+
+def build_server(
+    checkpoint,
+    host,
+    port,
+    cuda=False,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_WAIT_MS,
+    max_concurrency=MAX_CONCURRENCY,
+):
+    """
+    Load a checkpoint from the checkpoint store and build a server for it.
+    """
+    net = load_checkpoint(checkpoint, use_cuda=cuda)
+    model_fn = get_model_fn(net, cuda)
+    batcher = MicroBatcher(
+        model_fn, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms
+    )
+    return EnhanceServer((host, port), batcher, max_concurrency=max_concurrency)
+
+
+@click.command()
+@click.option("--checkpoint", required=True)
+@click.option("--host", default="localhost")
+@click.option("--port", default=8000)
+@click.option("--cuda", is_flag=True)
+@click.option("--max-batch-size", default=MAX_BATCH_SIZE)
+@click.option("--max-wait-ms", default=MAX_WAIT_MS)
+@click.option("--max-concurrency", default=MAX_CONCURRENCY)
+def serve_cli(checkpoint, host, port, cuda, max_batch_size, max_wait_ms, max_concurrency):
+    """
+    Run speech enhancement server
+    """
+    server = build_server(
+        checkpoint, host, port, cuda, max_batch_size, max_wait_ms, max_concurrency
+    )
+    batcher = server.batcher
+    print(f"Serving {checkpoint} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        batcher.stop()
+
+
+if __name__ == "__main__":
+    serve_cli()
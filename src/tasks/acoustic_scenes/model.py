@@ -1,6 +1,7 @@
 import torch
 import torch.nn as nn
-from torch.utils.checkpoint import checkpoint
+
+from src.utils.recompute import run_layer
 
 # epoch |   batch | GPU memory  |   checkpoints
 # 15s       32      2GB             0
@@ -8,6 +9,7 @@ from torch.utils.checkpoint import checkpoint
 # 13s       128     4.7GB           0
 # X         256     OOM             0
 # X         128     4GB             conv layers
+# To fit larger batches into memory, see `set_recompute_policy`.
 
 NUM_LABELS = 15
 MIN_SAMPLES = 32767
@@ -38,6 +40,8 @@ class SceneNet(nn.Module):
     """
 
     feature_mode = False
+    # Indices of conv layers which are recomputed in the backward pass, to save memory.
+    recompute_layers = set()
 
     def __init__(self):
         super().__init__()
@@ -68,6 +72,23 @@ class SceneNet(nn.Module):
             for param in layer.parameters():
                 param.requires_grad = False
 
+    def get_feature_extractor(self, num_layers=NUM_SAMPLE_LAYERS):
+        """
+        Build a frozen feature extractor from the first `num_layers` conv layers,
+        for use as a feature loss network. See `FeatureExtractor`.
+        """
+        return FeatureExtractor(self.conv_layers[:num_layers])
+
+    def set_recompute_policy(self, policy, batch_size, num_samples=MIN_SAMPLES):
+        """
+        Choose which conv layers to recompute in the backward pass, see recompute.py.
+        """
+        device = next(self.parameters()).device
+        sample_input = torch.zeros(1, 1, num_samples, device=device)
+        self.recompute_layers = policy.plan(
+            self, self.conv_layers, sample_input, batch_size
+        )
+
     def forward(self, input_t):
         """
         Input has shape (batch_size, channels, audio,) 
@@ -87,7 +108,8 @@ class SceneNet(nn.Module):
         # torch.Size([256, 1, 32767+])
         acts = input_t
         for idx, conv_layer in enumerate(self.conv_layers):
-            acts, conv_acts = checkpoint(conv_layer, acts)
+            recompute = idx in self.recompute_layers
+            acts, conv_acts = run_layer(conv_layer, acts, recompute)
             if idx < NUM_SAMPLE_LAYERS and self.feature_mode:
                 # Store feature layers for feature loss.
                 self.feature_layers.append(conv_acts)
@@ -118,6 +140,34 @@ class SceneNet(nn.Module):
         return prediction_t
 
 
+class FeatureExtractor(nn.Module):
+    """
+    The first few conv layers of a SceneNet, which returns a list of each layer's
+    conv activations. Unlike feature mode, it holds no reference to the deeper convs,
+    so they can be freed, and stops after the last feature layer.
+    With 6 layers, the weights take 0.07MB rather than 1.3MB.
+    """
+
+    def __init__(self, conv_layers):
+        super().__init__()
+        self.conv_layers = nn.ModuleList(conv_layers)
+        for param in self.parameters():
+            param.requires_grad = False
+
+        self.eval()
+
+    def forward(self, input_t):
+        batch_size = input_t.shape[0]
+        acts = input_t.view(batch_size, 1, -1)
+        assert acts.shape[2] >= MIN_SAMPLES  # Receptive field minimum
+        features = []
+        for conv_layer in self.conv_layers:
+            acts, conv_acts = conv_layer(acts)
+            features.append(conv_acts)
+
+        return features
+
+
 class ConvLayer(nn.Module):
     """
     Single convolutional unit for the acoustic classifier network.
@@ -3,71 +3,100 @@ Train SceneNet on the noisy TUT acoustic scenes dataset
 to do acoustic scene classification.
 
 Batch size of 128 works well, ~200 epochs required.
+
+Hyperparameters are sampled randomly for each run, see `sample_hyperparams`.
+To search over them, run `python -m src.search.runner --task scene_net_train`.
 """
+import random
+
 import torch.nn as nn
 
 from src.utils.trainer import Trainer
+from src.utils.trackers import ConfusionMatrixTracker
+from src.utils.recompute import RecomputePolicy
 from src.datasets import SceneDataset as Dataset
 
-from .model import SceneNet
+from .model import SceneNet, NUM_LABELS
 
-# Checkpointing
-WANDB_PROJECT = "chime-scene-net"
-CHECKPOINT_NAME = "scene-net"
+cross_entropy_loss = nn.CrossEntropyLoss()
 
-# Training hyperparams
-import random
+
+def sample_hyperparams(rng=random):
+    """
+    Randomly sample training hyperparams.
+    Learning rate and weight decay are sampled on a log scale, with weight decay
+    always smaller than the learning rate.
+    """
+    lr_exp = rng.uniform(0.3, 0.6)
+    wd_exp = rng.uniform(lr_exp, 0.8)
+    return {
+        "learning_rate": from_exp(lr_exp),
+        "weight_decay": from_exp(wd_exp),
+        "adam_betas": (rng.triangular(0.4, 0.95, 0.8), rng.triangular(0.8, 0.999, 0.95)),
+        "batch_size": rng.choice([2 ** n for n in range(3, 8)]),
+    }
 
 
 def from_exp(val):
     return 10 ** (-10 * val)
 
 
-def to_exp(log_val):
-    return math.log(val, 10) / -10
-
-
-lr_exp = random.uniform(0.3, 0.6)
-wd_exp = random.uniform(lr_exp, 0.8)
-
-LEARNING_RATE = from_exp(lr_exp)
-WEIGHT_DECAY = from_exp(wd_exp)
-ADAM_BETAS = (random.triangular(0.4, 0.95, 0.8), random.triangular(0.8, 0.999, 0.95))
-BATCH_SIZE = random.choice([2 ** n for n in range(3, 8)])
-
-
-cross_entropy_loss = nn.CrossEntropyLoss()
-
-
-def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_epochs):
-    batch_size = BATCH_SIZE
-    trainer = Trainer(use_cuda, wandb_name)
-    trainer.setup_checkpoints(CHECKPOINT_NAME, checkpoint_epochs)
+def train(runtime, training, logging, hyperparams=None, epoch_fn=None):
+    """
+    Train SceneNet, then fine tune it with a lower learning rate.
+        hyperparams is a dict from `sample_hyperparams`, sampled here if not given
+        epoch_fn is called after each epoch, see Trainer.register_epoch_fn.
+            It's used by the hyperparam search, and turns off the fine tuning phase.
+    """
+    hyperparams = hyperparams or sample_hyperparams()
+    learning_rate = hyperparams["learning_rate"]
+    weight_decay = hyperparams["weight_decay"]
+    adam_betas = hyperparams["adam_betas"]
+    batch_size = hyperparams["batch_size"]
+    num_epochs = training["epochs"]
+    subsample = training["subsample"]
+    trainer = Trainer(**runtime)
+    trainer.setup_checkpoints(**logging["checkpoint"], task_name=__name__)
     trainer.setup_wandb(
-        WANDB_PROJECT,
-        wandb_name,
-        config={
+        **logging["wandb"],
+        run_info={
             "Batch Size": batch_size,
             "Epochs": num_epochs,
-            "Adam Betas": ADAM_BETAS,
-            "Learning Rate": LEARNING_RATE,
-            "Weight Decay": WEIGHT_DECAY,
+            "Adam Betas": adam_betas,
+            "Learning Rate": learning_rate,
+            "Weight Decay": weight_decay,
             "Fine Tuning": False,
         },
     )
     train_loader, test_loader = trainer.load_data_loaders(Dataset, batch_size, subsample)
     trainer.register_loss_fn(get_ce_loss)
     trainer.register_metric_fn(get_ce_metric, "Loss")
+    trainer.register_tracker(ConfusionMatrixTracker, num_classes=NUM_LABELS)
+    if epoch_fn:
+        trainer.register_epoch_fn(epoch_fn)
+
     trainer.input_shape = [32767]
     net = trainer.load_net(SceneNet)
+    if training.get("recompute_budget_gb") is not None:
+        budget = int(training["recompute_budget_gb"] * 2 ** 30)
+        net.set_recompute_policy(RecomputePolicy(budget), batch_size)
+
+    if training.get("ema_decay"):
+        trainer.use_ema(net, decay=training["ema_decay"])
+
     optimizer = trainer.load_optimizer(
-        net, learning_rate=LEARNING_RATE, adam_betas=ADAM_BETAS, weight_decay=WEIGHT_DECAY
+        net, learning_rate=learning_rate, adam_betas=adam_betas, weight_decay=weight_decay
     )
     trainer.train(net, num_epochs, optimizer, train_loader, test_loader)
+    if epoch_fn:
+        return
 
     # Do a fine tuning run with 1/10th learning rate for 1/3rd epochs.
     optimizer = trainer.load_optimizer(
-        net, learning_rate=LEARNING_RATE / 10, adam_betas=ADAM_BETAS, weight_decay=WEIGHT_DECAY / 10
+        net,
+        learning_rate=learning_rate / 10,
+        adam_betas=adam_betas,
+        weight_decay=weight_decay / 10,
     )
     num_epochs = num_epochs // 3
     trainer.train(net, num_epochs, optimizer, train_loader, test_loader)
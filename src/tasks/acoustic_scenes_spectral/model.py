@@ -60,6 +60,13 @@ class SpectralSceneNet(nn.Module):
 
         return self.eval()
 
+    def get_feature_extractor(self, num_layers):
+        """
+        Build a frozen feature extractor from the first `num_layers` conv layers,
+        for use as a feature loss network. See `FeatureExtractor`.
+        """
+        return FeatureExtractor(self.convs[:num_layers])
+
     def forward(self, input_t):
         """
         Input has shape (batch_size, channels, audio,) 
@@ -89,6 +96,37 @@ class SpectralSceneNet(nn.Module):
         return pred_t
 
 
+class FeatureExtractor(nn.Module):
+    """
+    The first few conv layers of a SpectralSceneNet, which returns a list of each layer's
+    conv activations. Unlike feature mode, it holds no reference to the deeper convs and
+    the classifier, so they can be freed, and stops after the last feature layer.
+    With 6 layers, the weights take 4.4MB rather than 365MB, of which the classifier
+    is 336MB.
+    """
+
+    def __init__(self, convs):
+        super().__init__()
+        self.convs = nn.ModuleList(convs)
+        self.max_pool = nn.MaxPool2d(kernel_size=2, stride=2)
+        for param in self.parameters():
+            param.requires_grad = False
+
+        self.eval()
+
+    def forward(self, input_t):
+        acts = input_t.view(-1, 1, 80, 256)
+        features = []
+        for idx, conv in enumerate(self.convs):
+            acts, conv_t = conv(acts)
+            features.append(conv_t)
+            _, _, is_pool = CONV_LAYERS[idx]
+            if is_pool and idx < len(self.convs) - 1:
+                acts = self.max_pool(acts)
+
+        return features
+
+
 class ConvLayer(nn.Module):
     """
     Single convolutional unit for the acoustic classifier network.
@@ -7,14 +7,10 @@ Batch size of 64-128 works well.
 import torch.nn as nn
 
 from src.utils.trainer import Trainer
+from src.utils.trackers import ConfusionMatrixTracker
 from src.datasets import SpectralSceneDataset as Dataset
 
-from .model import SpectralSceneNet
-
-# Checkpointing
-WANDB_PROJECT = "spectral-scene-net"
-CHECKPOINT_NAME = "spectral-scene-net"
-
+from .model import SpectralSceneNet, NUM_LABELS
 
 MIN_LR = 1e-4
 MAX_LR = 2e-4
@@ -25,13 +21,21 @@ WEIGHT_DECAY = 1e-3
 cross_entropy_loss = nn.CrossEntropyLoss()
 
 
-def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_epochs):
-    trainer = Trainer(use_cuda, wandb_name)
-    trainer.setup_checkpoints(CHECKPOINT_NAME, checkpoint_epochs)
+def train(runtime, training, logging):
+    num_epochs = training["epochs"]
+    subsample = training["subsample"]
+    trainer = Trainer(**runtime)
+    trainer.setup_checkpoints(**logging["checkpoint"], task_name=__name__)
+    trainer.register_loss_fn(get_ce_loss)
+    trainer.register_metric_fn(get_ce_metric, "Loss")
+    trainer.register_tracker(ConfusionMatrixTracker, num_classes=NUM_LABELS)
+    trainer.input_shape = [1, 80, 256]
+    trainer.output_shape = [15]
+    net = trainer.load_net(SpectralSceneNet)
+    batch_size = trainer.get_batch_size(training, net, task_name=__name__)
     trainer.setup_wandb(
-        WANDB_PROJECT,
-        wandb_name,
-        config={
+        **logging["wandb"],
+        run_info={
             "Batch Size": batch_size,
             "Epochs": num_epochs,
             "Adam Betas": ADAM_BETAS,
@@ -41,12 +45,9 @@ def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_ep
         },
     )
     train_loader, test_loader = trainer.load_data_loaders(Dataset, batch_size, subsample)
-    trainer.register_loss_fn(get_ce_loss)
-    trainer.register_metric_fn(get_ce_metric, "Loss")
-    trainer.register_metric_fn(get_accuracy_metric, "Accuracy")
-    trainer.input_shape = [1, 80, 256]
-    trainer.output_shape = [15]
-    net = trainer.load_net(SpectralSceneNet)
+    if training.get("ema_decay"):
+        trainer.use_ema(net, decay=training["ema_decay"])
+
     optimizer = trainer.load_optimizer(
         net, learning_rate=MIN_LR, adam_betas=ADAM_BETAS, weight_decay=WEIGHT_DECAY
     )
@@ -65,10 +66,3 @@ def get_ce_loss(inputs, outputs, targets):
 def get_ce_metric(inputs, outputs, targets):
     ce_t = cross_entropy_loss(outputs, targets)
     return ce_t.data.item()
-
-
-def get_accuracy_metric(inputs, outputs, targets):
-    predictions = outputs.argmax(dim=1)
-    num_correct = (predictions == targets).sum().data.item()
-    num_total = len(targets)
-    return num_correct / num_total
@@ -0,0 +1,242 @@
+"""
+Streaming inference for SpectralUNet.
+
+Incoming audio is framed with the window and hop of `spectral.audio_to_waveglow_spec`,
+which the SpectralUNet is trained on. Each new frame is turned into a log-mel frame and
+pushed onto a sliding window of mel frames, so overlapping frames are computed once and
+reused. Every few frames the SpectralUNet enhances the window, and the change it makes
+to the newest mel frames is applied as a mask to a linear STFT, framed separately with
+the same hop and a longer window, centred on the same samples.
+The masked frames are resynthesized with overlap-add.
+
+Whole clips can also be enhanced in a batch, with the same framing and masking, but
+with the SpectralUNet seeing each clip's whole spectrogram, see `enhance_batch`.
+"""
+import time
+
+import numpy as np
+import torch
+from scipy.signal import get_window
+
+from src.utils import spectral
+from src.tasks.spectral_u_net.model import NUM_ENCODER_LAYERS
+
+WINDOW_FRAMES = 256  # Number of frames the SpectralUNet sees at once
+UPDATE_FRAMES = 4  # Run the SpectralUNet every N new frames
+MEL_BINS = spectral.WAVEGLOW_BINS
+MEL_N_FFT = spectral.WAVEGLOW_SPEC_KWARGS["n_fft"]
+MEL_HOP = spectral.WAVEGLOW_SPEC_KWARGS["hop_length"]
+LOG_FLOOR = 1e-10
+FRAME_MULTIPLE = 2 ** NUM_ENCODER_LAYERS  # SpectralUNet decimates frames N times
+
+
+class StreamingSpectralUNet:
+    """
+    Enhance a stream of audio with a SpectralUNet, chunk by chunk.
+        window_ms is the window of the linear STFT which is masked, at least as long as
+            the mel window. The hop is the mel hop, so that the frames line up.
+    """
+
+    def __init__(
+        self,
+        net,
+        use_cuda=False,
+        window_ms=spectral.WIN_MS,
+        window_frames=WINDOW_FRAMES,
+        update_frames=UPDATE_FRAMES,
+    ):
+        self.net = net
+        self.use_cuda = use_cuda
+        self.n_fft = spectral.ms_to_steps(window_ms)
+        self.hop = MEL_HOP
+        self.window_frames = window_frames
+        self.update_frames = update_frames
+        assert self.n_fft >= MEL_N_FFT, "Window must be at least the mel window"
+        assert self.hop < self.n_fft
+        assert update_frames <= window_frames
+
+        # Same periodic Hann windows as scipy.signal.stft and librosa
+        self.window = get_window("hann", self.n_fft)
+        self.mel_window = get_window("hann", MEL_N_FFT)
+        # Mel frames are centred on the same samples as linear frames.
+        self.mel_offset = (self.n_fft - MEL_N_FFT) // 2
+
+        # Mel filterbank, and the transpose of the linear STFT's filterbank, normalized
+        # to map mel gains back to linear frequency bins.
+        self.mel_basis = spectral.get_mel_basis(MEL_N_FFT, MEL_BINS)
+        linear_mel_basis = spectral.get_mel_basis(self.n_fft, MEL_BINS)
+        weights = linear_mel_basis.sum(axis=0)
+        self.unmel_basis = (linear_mel_basis / np.maximum(weights, 1e-8)).T
+        self.unmapped_bins = weights < 1e-8
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all internal buffers, ready for a new audio stream.
+        """
+        self.input_buffer = np.zeros(self.n_fft, dtype="float32")
+        self.num_buffered = 0
+        self.mel_frames = np.full(
+            (MEL_BINS, self.window_frames), np.log(LOG_FLOOR), dtype="float32"
+        )
+        self.pending_frames = []
+        self.output_buffer = np.zeros(self.n_fft, dtype="float32")
+        # Overlap-add of the squared windows, to normalize the output. It isn't
+        # constant, as the hop needn't divide the window.
+        self.norm_buffer = np.zeros(self.n_fft, dtype="float32")
+        # Compute time tracking
+        self.processing_time = 0.0
+        self.num_processed = 0
+
+    @property
+    def delay(self):
+        """
+        Offset between the input and output streams, in samples:
+        output sample `i + delay` corresponds to input sample `i`.
+        """
+        return self.n_fft - self.hop
+
+    @property
+    def latency(self):
+        """
+        Worst case algorithmic latency, in samples: a sample is output once all the frames
+        which overlap it have been enhanced.
+        """
+        return self.n_fft + (self.update_frames - 1) * self.hop
+
+    @property
+    def latency_ms(self):
+        return 1000 * self.latency / spectral.SAMPLING_RATE
+
+    @property
+    def real_time_factor(self):
+        """
+        Compute time spent per second of audio processed, must be < 1 for live use.
+        """
+        if not self.num_processed:
+            return 0.0
+
+        return self.processing_time / (self.num_processed / spectral.SAMPLING_RATE)
+
+    def step(self, audio_arr):
+        """
+        Push a chunk of audio of any length, returns all enhanced audio
+        that is ready to be output, which may be empty.
+        """
+        start_time = time.time()
+        outputs = []
+        idx = 0
+        while idx < len(audio_arr):
+            # Fill up the input buffer until a new frame is ready.
+            num_new = min(self.hop - self.num_buffered, len(audio_arr) - idx)
+            self.input_buffer = np.roll(self.input_buffer, -num_new)
+            self.input_buffer[-num_new:] = audio_arr[idx : idx + num_new]
+            self.num_buffered += num_new
+            idx += num_new
+            if self.num_buffered == self.hop:
+                self.num_buffered = 0
+                self._push_frame()
+                if len(self.pending_frames) == self.update_frames:
+                    outputs.append(self._enhance_pending())
+
+        self.processing_time += time.time() - start_time
+        self.num_processed += len(audio_arr)
+        if outputs:
+            return np.concatenate(outputs)
+        else:
+            return np.zeros(0, dtype="float32")
+
+    def enhance_batch(self, batch_arr):
+        """
+        Enhance a batch of whole clips (batch_size, audio_length) at once, rather than
+        streaming them, returning audio of the same shape. The SpectralUNet is run once
+        on the batch of spectrograms, so that clips can be micro-batched for serving.
+        The stream's buffers are left untouched.
+        """
+        batch_size, length = batch_arr.shape
+        # Frames start as in a new stream, with a window of silence before the audio,
+        # and continue until every sample has been in a frame.
+        lead = self.n_fft - self.hop
+        num_frames = -(-(lead + length) // self.hop)
+        padded_arr = np.zeros((batch_size, (num_frames - 1) * self.hop + self.n_fft))
+        padded_arr[:, lead : lead + length] = batch_arr
+        frames = np.lib.stride_tricks.sliding_window_view(padded_arr, self.n_fft, axis=1)
+        frames = frames[:, :: self.hop][:, :num_frames]
+        spec = np.fft.rfft(frames * self.window)
+        mel_input = frames[:, :, self.mel_offset : self.mel_offset + MEL_N_FFT]
+        mel_spec = np.abs(np.fft.rfft(mel_input * self.mel_window)) @ self.mel_basis.T
+        noisy = np.log(np.maximum(mel_spec, LOG_FLOOR)).transpose(0, 2, 1)
+
+        # Pad the frames to a length which the SpectralUNet can decimate.
+        num_padded = -(-num_frames // FRAME_MULTIPLE) * FRAME_MULTIPLE
+        noisy_t = torch.full((batch_size, 1, MEL_BINS, num_padded), np.log(LOG_FLOOR))
+        noisy_t[:, 0, :, :num_frames] = torch.tensor(noisy)
+        noisy_t = noisy_t.cuda() if self.use_cuda else noisy_t.cpu()
+        with torch.no_grad():
+            enhanced_t = self.net(noisy_t)
+
+        enhanced = enhanced_t[:, 0, :, :num_frames].cpu().numpy()
+        linear_gain = self._get_linear_gain(enhanced, noisy)
+        frames = np.fft.irfft(spec * linear_gain.transpose(0, 2, 1), n=self.n_fft)
+        output_arr = np.zeros_like(padded_arr)
+        norm_arr = np.zeros(padded_arr.shape[1])
+        for idx in range(num_frames):
+            start = idx * self.hop
+            output_arr[:, start : start + self.n_fft] += frames[:, idx] * self.window
+            norm_arr[start : start + self.n_fft] += self.window ** 2
+
+        output_arr /= np.maximum(norm_arr, 1e-8)
+        return output_arr[:, lead : lead + length].astype("float32")
+
+    def _push_frame(self):
+        """
+        Compute the STFT and log-mel features for the newest frame.
+        The mel frame matches `spectral.audio_to_waveglow_spec`.
+        """
+        spec_frame = np.fft.rfft(self.input_buffer * self.window)
+        mel_input = self.input_buffer[self.mel_offset : self.mel_offset + MEL_N_FFT]
+        mel_frame = self.mel_basis @ np.abs(np.fft.rfft(mel_input * self.mel_window))
+        self.mel_frames = np.roll(self.mel_frames, -1, axis=1)
+        self.mel_frames[:, -1] = np.log(np.maximum(mel_frame, LOG_FLOOR))
+        self.pending_frames.append(spec_frame)
+
+    def _enhance_pending(self):
+        """
+        Enhance the mel window, then mask and resynthesize the pending STFT frames.
+        """
+        noisy_t = torch.tensor(self.mel_frames).view(1, 1, MEL_BINS, -1)
+        noisy_t = noisy_t.cuda() if self.use_cuda else noisy_t.cpu()
+        with torch.no_grad():
+            enhanced_t = self.net(noisy_t)
+
+        enhanced = enhanced_t.view(MEL_BINS, -1).cpu().numpy()
+        num_pending = len(self.pending_frames)
+        linear_gain = self._get_linear_gain(
+            enhanced[:, -num_pending:], self.mel_frames[:, -num_pending:]
+        )
+
+        outputs = []
+        for idx, spec_frame in enumerate(self.pending_frames):
+            frame = np.fft.irfft(spec_frame * linear_gain[:, idx], n=self.n_fft)
+            self.output_buffer += frame * self.window
+            self.norm_buffer += self.window ** 2
+            # The first hop of the buffer won't be overlapped by any later frames.
+            norm = np.maximum(self.norm_buffer[: self.hop], 1e-8)
+            outputs.append(self.output_buffer[: self.hop] / norm)
+            for buffer in [self.output_buffer, self.norm_buffer]:
+                buffer[: -self.hop] = buffer[self.hop :].copy()
+                buffer[-self.hop :] = 0
+
+        self.pending_frames = []
+        return np.concatenate(outputs).astype("float32")
+
+    def _get_linear_gain(self, enhanced, noisy):
+        """
+        Map the change the SpectralUNet made to log-mel frames (..., bins, frames)
+        to a mask over linear frequency bins.
+        """
+        log_gain = enhanced - noisy
+        mel_gain = np.exp(np.minimum(log_gain, 0))
+        linear_gain = self.unmel_basis @ mel_gain
+        linear_gain[..., self.unmapped_bins, :] = 1
+        return linear_gain
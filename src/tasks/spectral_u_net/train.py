@@ -8,10 +8,6 @@ from src.utils.trainer import Trainer
 
 from .model import SpectralUNet
 
-# Checkpointing
-WANDB_PROJECT = "spectral-u-net"
-CHECKPOINT_NAME = "spectral-u-net"
-
 # Training hyperparams
 MIN_LR = 2e-4
 MAX_LR = 1e-3
@@ -21,13 +17,21 @@ WEIGHT_DECAY = 1e-6
 mse = nn.MSELoss()
 
 
-def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_epochs):
-    trainer = Trainer(use_cuda, wandb_name)
-    trainer.setup_checkpoints(CHECKPOINT_NAME, checkpoint_epochs)
+def train(runtime, training, logging):
+    num_epochs = training["epochs"]
+    subsample = training["subsample"]
+    trainer = Trainer(**runtime)
+    trainer.setup_checkpoints(**logging["checkpoint"], task_name=__name__)
+    trainer.register_loss_fn(get_mse_loss)
+    trainer.register_metric_fn(get_mse_metric, "Loss")
+    trainer.input_shape = [1, 80, 256]
+    trainer.target_shape = [1, 80, 256]
+    trainer.output_shape = [1, 80, 256]
+    net = trainer.load_net(SpectralUNet)
+    batch_size = trainer.get_batch_size(training, net, task_name=__name__)
     trainer.setup_wandb(
-        WANDB_PROJECT,
-        wandb_name,
-        config={
+        **logging["wandb"],
+        run_info={
             "Batch Size": batch_size,
             "Epochs": num_epochs,
             "Adam Betas": ADAM_BETAS,
@@ -37,12 +41,9 @@ def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_ep
         },
     )
     train_loader, test_loader = trainer.load_data_loaders(Dataset, batch_size, subsample)
-    trainer.register_loss_fn(get_mse_loss)
-    trainer.register_metric_fn(get_mse_metric, "Loss")
-    trainer.input_shape = [1, 80, 256]
-    trainer.target_shape = [1, 80, 256]
-    trainer.output_shape = [1, 80, 256]
-    net = trainer.load_net(SpectralUNet)
+    if training.get("ema_decay"):
+        trainer.use_ema(net, decay=training["ema_decay"])
+
     optimizer = trainer.load_optimizer(
         net, learning_rate=MIN_LR, adam_betas=ADAM_BETAS, weight_decay=WEIGHT_DECAY
     )
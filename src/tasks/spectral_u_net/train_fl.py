@@ -23,11 +23,12 @@ mse = nn.MSELoss()
 
 def train(runtime, training, logging):
 
-    # Load feature loss net
-    loss_net = load_checkpoint(LOSS_NET_CHECKPOINT, use_cuda=runtime["cuda"])
-    loss_net.set_feature_mode(num_layers=6)
-    loss_net.eval()
-    feature_loss = AudioFeatureLoss(loss_net, use_cuda=runtime["cuda"])
+    # Load feature loss net, keeping only the layers used for features.
+    loss_net = load_checkpoint(LOSS_NET_CHECKPOINT, use_cuda=False, pin=True)
+    feature_net = loss_net.get_feature_extractor(num_layers=6)
+    feature_net = feature_net.cuda() if runtime["cuda"] else feature_net
+    del loss_net
+    feature_loss = AudioFeatureLoss(feature_net, use_cuda=runtime["cuda"])
 
     def get_feature_loss(inputs, outputs, targets):
         return feature_loss(inputs, outputs, targets)
@@ -36,11 +37,19 @@ def train(runtime, training, logging):
         loss_t = feature_loss(inputs, outputs, targets)
         return loss_t.data.item()
 
-    batch_size = training["batch_size"]
     epochs = training["epochs"]
     subsample = training["subsample"]
     trainer = Trainer(**runtime)
-    trainer.setup_checkpoints(**logging["checkpoint"])
+    trainer.setup_checkpoints(**logging["checkpoint"], task_name=__name__)
+    trainer.register_loss_fn(get_feature_loss)
+    trainer.register_metric_fn(get_mse_metric, "Loss")
+    trainer.register_metric_fn(get_feature_loss_metric, "Feature Loss")
+
+    trainer.input_shape = [1, 80, 256]
+    trainer.target_shape = [1, 80, 256]
+    trainer.output_shape = [1, 80, 256]
+    net = trainer.load_net(SpectralUNet)
+    batch_size = trainer.get_batch_size(training, net, task_name=__name__)
     trainer.setup_wandb(
         **logging["wandb"],
         run_info={
@@ -54,15 +63,8 @@ def train(runtime, training, logging):
     )
 
     train_loader, test_loader = trainer.load_data_loaders(Dataset, batch_size, subsample)
-
-    trainer.register_loss_fn(get_feature_loss)
-    trainer.register_metric_fn(get_mse_metric, "Loss")
-    trainer.register_metric_fn(get_feature_loss_metric, "Feature Loss")
-
-    trainer.input_shape = [1, 80, 256]
-    trainer.target_shape = [1, 80, 256]
-    trainer.output_shape = [1, 80, 256]
-    net = trainer.load_net(SpectralUNet)
+    if training.get("ema_decay"):
+        trainer.use_ema(net, decay=training["ema_decay"])
 
     optimizer = trainer.load_optimizer(
         net, learning_rate=MIN_LR, adam_betas=ADAM_BETAS, weight_decay=WEIGHT_DECAY
@@ -1,16 +1,16 @@
 import torch
 import torch.nn as nn
-from torch.utils.checkpoint import checkpoint_sequential
 
-from .layers.adaptive_batch_norm import AdaptiveBatchNorm1d
+from src.utils.layers.adaptive_batch_norm import AdaptiveBatchNorm1d
+from src.utils.recompute import run_layer
 
 # epoch / segments / samples / batch / GPU memory
 # 30s / 4 /500 / 32 / ~7GB
 # 16s / 5 /500 / 32 / ~4GB
 # 16s / 5 /500 / 48 / ~6GB
 # 16s / 6 /500 / 32 / ~6GB
+# Checkpoint segments are now chosen from a memory budget, see `set_recompute_policy`.
 
-GRAD_CHECKPOINT_SEGMENTS = 5
 NUM_INNER_CONVS = 12
 CHANNELS = 64
 
@@ -20,6 +20,9 @@ class SpeechDenoiseNet(nn.Module):
     Convolutional network used to denoise human speech in audio.
     """
 
+    # Indices of conv layers which are recomputed in the backward pass, to save memory.
+    recompute_layers = set()
+
     def __init__(self):
         super().__init__()
 
@@ -43,6 +46,14 @@ class SpeechDenoiseNet(nn.Module):
         self.convs = nn.Sequential(*conv_layers)
         self.tanh = nn.Tanh()
 
+    def set_recompute_policy(self, policy, batch_size, num_samples):
+        """
+        Choose which conv layers to recompute in the backward pass, see recompute.py.
+        """
+        device = next(self.parameters()).device
+        sample_input = torch.zeros(1, 1, num_samples, device=device)
+        self.recompute_layers = policy.plan(self, self.convs, sample_input, batch_size)
+
     def forward(self, input_t):
         """
         Input has shape (batch_size, 1, audio_length,) 
@@ -51,9 +62,10 @@ class SpeechDenoiseNet(nn.Module):
         batch_size = input_t.shape[0]
         assert input_t.shape[1] == 1
         audio_length = input_t.shape[2]
-        # Use gradient checkpointing to save GPU memory.
-        modules = [m for m in self.convs._modules.values()]
-        conv_t = checkpoint_sequential(modules, GRAD_CHECKPOINT_SEGMENTS, input_t)
+        conv_t = input_t
+        for idx, conv_layer in enumerate(self.convs):
+            conv_t = run_layer(conv_layer, conv_t, idx in self.recompute_layers)
+
         conv_t = conv_t.squeeze(dim=1)
         return self.tanh(conv_t)
 
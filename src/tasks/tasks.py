@@ -1,17 +1,26 @@
-from .waveunet.training.train_gan import train as waveunet_train_gan
-from .waveunet.training.train_mse import train as waveunet_train_mse
-from .waveunet.training.train_feat_loss import train as waveunet_train_fl
-from .spectral_u_net.train import train as spectral_unet_train
-from .spectral_u_net.train_fl import train as spectral_unet_fl
-from .acoustic_scenes.train import train as scene_net_train
-from .acoustic_scenes_spectral.train import train as scene_net_spectral_train
+"""
+Training tasks, which can be run with `python -m src`.
+
+Each task is registered by the dotted path of its training function, which is only
+imported when the task is run. That way starting up doesn't import every task's
+models, datasets and their dependencies.
+"""
+import importlib
 
 TASKS = {
-    "waveunet_train_gan": waveunet_train_gan,
-    "waveunet_train_mse": waveunet_train_mse,
-    "waveunet_train_fl": waveunet_train_fl,
-    "spectral_unet_train": spectral_unet_train,
-    "spectral_unet_fl": spectral_unet_fl,
-    "scene_net_train": scene_net_train,
-    "scene_net_spectral_train": scene_net_spectral_train,
+    "waveunet_train_gan": "src.tasks.waveunet.training.train_gan:train",
+    "waveunet_train_mse": "src.tasks.waveunet.training.train_mse:train",
+    "waveunet_train_fl": "src.tasks.waveunet.training.train_feat_loss:train",
+    "spectral_unet_train": "src.tasks.spectral_u_net.train:train",
+    "spectral_unet_fl": "src.tasks.spectral_u_net.train_fl:train",
+    "scene_net_train": "src.tasks.acoustic_scenes.train:train",
+    "scene_net_spectral_train": "src.tasks.acoustic_scenes_spectral.train:train",
 }
+
+
+def get_task(task_name):
+    """
+    Import and return the training function for a task.
+    """
+    module_name, fn_name = TASKS[task_name].split(":")
+    return getattr(importlib.import_module(module_name), fn_name)
@@ -0,0 +1,155 @@
+"""
+Streaming inference for a causal WaveUNet.
+
+Audio is fed in small hops (eg. 256 samples) and each hop is enhanced as soon as it
+arrives. Each layer keeps the tail of its previous input so that the convolutions,
+decimation and upsampling line up exactly with an offline pass over the whole signal.
+"""
+import time
+
+import torch
+
+SAMPLING_RATE = 16000
+HOP_LENGTH = 256  # 16ms of audio at 16kHz
+
+
+class StreamingWaveUNet:
+    """
+    Wraps a causal WaveUNet with per-layer state, so audio can be enhanced hop by hop.
+
+    The network itself has no lookahead, so the algorithmic latency is the hop size:
+    a sample is output at most `hop` samples after it was recorded.
+    """
+
+    def __init__(self, net, hop=HOP_LENGTH):
+        assert net.causal, "Streaming requires a WaveUNet built with causal=True"
+        self.net = net
+        self.hop = hop
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all internal buffers, ready for a new audio stream.
+        """
+        num_levels = len(self.net.encoders) + 1
+        # Past input samples for each convolution, keyed by layer.
+        self.conv_caches = {}
+        # Last output sample for each level, needed to upsample into the level above.
+        self.upsample_caches = [None] * num_levels
+        # Number of samples seen so far at each level of the U-net.
+        self.num_samples = [0] * num_levels
+        # Compute time tracking
+        self.processing_time = 0.0
+        self.num_processed = 0
+
+    @property
+    def latency(self):
+        """
+        Algorithmic latency, in samples.
+        """
+        return self.hop
+
+    @property
+    def latency_ms(self):
+        return 1000 * self.latency / SAMPLING_RATE
+
+    @property
+    def real_time_factor(self):
+        """
+        Compute time spent per second of audio processed, must be < 1 for live use.
+        """
+        if not self.num_processed:
+            return 0.0
+
+        return self.processing_time / (self.num_processed / SAMPLING_RATE)
+
+    def step(self, frame_t):
+        """
+        Enhance the next frame of audio.
+            frame_t is a tensor (batch_size, hop)
+            returns a tensor (batch_size, hop)
+        """
+        start_time = time.time()
+        with torch.no_grad():
+            output_t = self._step(frame_t)
+
+        self.processing_time += time.time() - start_time
+        self.num_processed += frame_t.shape[-1]
+        return output_t
+
+    def _step(self, frame_t):
+        batch_size = frame_t.shape[0]
+        input_t = frame_t.view(batch_size, 1, -1)
+
+        # Encoding
+        acts = input_t
+        starts = []
+        skip_connections = []
+        for level, encoder in enumerate(self.net.encoders):
+            starts.append(self._advance(level, acts))
+            acts = self._conv(encoder, acts)
+            skip_connections.append(acts)
+            # Decimate activations, keeping samples with an even index in the stream.
+            acts = acts[:, :, starts[level] % 2 :: 2]
+
+        middle_level = len(self.net.encoders)
+        self._advance(middle_level, acts)
+        acts = self._conv(self.net.middle, acts)
+
+        # Decoding
+        for idx, decoder in enumerate(self.net.decoders):
+            level = middle_level - idx - 1
+            skip = skip_connections[level]
+            acts = self._upsample(level + 1, acts, starts[level], skip.shape[2])
+            acts = torch.cat((acts, skip), dim=1)
+            acts = self._conv(decoder, acts)
+
+        acts = torch.cat((acts, input_t), dim=1)
+        output_t = self._conv(self.net.output, acts)
+        return output_t.squeeze(dim=1)
+
+    def _advance(self, level, acts):
+        """
+        Record new samples at a given level, returns the stream index of the first one.
+        """
+        start = self.num_samples[level]
+        self.num_samples[level] += acts.shape[2]
+        return start
+
+    def _conv(self, layer, input_t):
+        """
+        Run a ConvLayer over new samples, using cached samples from previous steps
+        as the left padding.
+        """
+        batch_size, _, num_new = input_t.shape
+        conv = layer.conv
+        if not num_new:
+            return input_t.new_zeros(batch_size, conv.out_channels, 0)
+
+        context = conv.kernel_size[0] - 1
+        if context:
+            cache = self.conv_caches.get(layer)
+            if cache is None:
+                cache = input_t.new_zeros(batch_size, conv.in_channels, context)
+
+            input_t = torch.cat((cache, input_t), dim=2)
+            self.conv_caches[layer] = input_t[:, :, -context:]
+
+        return layer.nonlinearity(conv(input_t))
+
+    def _upsample(self, deep_level, deep_acts, start, num_new):
+        """
+        Nearest neighbour upsampling of new samples from a deeper level.
+        Sample i of the upper level is sample i // 2 of the deeper level, which may have
+        been computed in a previous step if `start` is odd.
+        """
+        cache = self.upsample_caches[deep_level]
+        if deep_acts.shape[2]:
+            self.upsample_caches[deep_level] = deep_acts[:, :, -1:]
+
+        if start % 2:
+            deep_acts = torch.cat((cache, deep_acts), dim=2)
+
+        acts = deep_acts.repeat_interleave(2, dim=2)
+        offset = start % 2
+        return acts[:, :, offset : offset + num_new]
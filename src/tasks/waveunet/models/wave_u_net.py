@@ -1,5 +1,6 @@
 import torch
 from torch import nn
+from torch.nn import functional as F
 from torch.nn.utils import weight_norm
 
 
@@ -12,30 +13,45 @@ class WaveUNet(nn.Module):
     Convolutional neural net for speech enhancement
     Proposed in Improved Speech Enhancement with the Wave-U-Net (https://arxiv.org/pdf/1811.11307.pdf),
     which builds upon this paper (https://arxiv.org/pdf/1806.03185.pdf)
+
+    When `causal` is set, convolutions are padded on the left only and upsampling
+    repeats samples rather than interpolating, so that each output sample depends only
+    on current and past input samples. This is required for streaming inference.
     """
 
-    def __init__(self, num_channels=NUM_CHANNELS, num_layers=NUM_LAYERS):
+    # Default for models pickled before causal mode was added.
+    causal = False
+
+    def __init__(self, num_channels=NUM_CHANNELS, num_layers=NUM_LAYERS, causal=False):
         super().__init__()
         self.skips_enabled = True
+        self.causal = causal
         # Construct encoders
         self.encoders = nn.ModuleList()
-        layer = ConvLayer(1, num_channels, kernel=15)
+        layer = ConvLayer(1, num_channels, kernel=15, causal=causal)
         self.encoders.append(layer)
         for layer_idx in range(1, num_layers):
             in_channels = layer_idx * num_channels
             out_channels = (layer_idx + 1) * num_channels
-            layer = ConvLayer(in_channels, out_channels, kernel=15)
+            layer = ConvLayer(in_channels, out_channels, kernel=15, causal=causal)
             self.encoders.append(layer)
 
-        self.middle = ConvLayer(12 * num_channels, 13 * num_channels, kernel=1)
+        self.middle = ConvLayer(
+            num_layers * num_channels, (num_layers + 1) * num_channels, kernel=1
+        )
 
         # Construct decoders
-        self.upsample = nn.Upsample(scale_factor=2, mode="linear", align_corners=True)
+        if causal:
+            # Nearest neighbour upsampling only looks at past samples.
+            self.upsample = nn.Upsample(scale_factor=2, mode="nearest")
+        else:
+            self.upsample = nn.Upsample(scale_factor=2, mode="linear", align_corners=True)
+
         self.decoders = nn.ModuleList()
         for layer_idx in reversed(range(1, num_layers + 1)):
             in_channels = (2 * (layer_idx + 1) - 1) * num_channels
             out_channels = layer_idx * num_channels
-            layer = ConvLayer(in_channels, out_channels, kernel=15)
+            layer = ConvLayer(in_channels, out_channels, kernel=15, causal=causal)
             self.decoders.append(layer)
 
         # Extra dimension for input
@@ -85,6 +101,10 @@ class WaveUNet(nn.Module):
             # Concatenate upsampled input and skip connection from encoding stage.
             # Perform the concatenation in the feature map dimension.
             skip = skip_connections[idx]
+            if self.causal:
+                # Drop the trailing sample produced by upsampling an odd length.
+                acts = acts[:, :, : skip.shape[2]]
+
             acts = torch.cat((acts, skip), dim=1)
 
             acts = decoder(acts)
@@ -102,14 +122,21 @@ class ConvLayer(nn.Module):
     Single convolutional layer with nonlinear output
     """
 
-    def __init__(self, in_channels, out_channels, kernel, nonlinearity=nn.PReLU):
+    # Default for layers pickled before causal mode was added.
+    causal_padding = 0
+
+    def __init__(
+        self, in_channels, out_channels, kernel, nonlinearity=nn.PReLU, causal=False
+    ):
         super().__init__()
         self.nonlinearity = nonlinearity()
+        # Causal layers pad on the left only, and do it in forward().
+        self.causal_padding = kernel - 1 if causal else 0
         conv = nn.Conv1d(
             in_channels=in_channels,
             out_channels=out_channels,
             kernel_size=kernel,
-            padding=kernel // 2,  # Same padding
+            padding=0 if causal else kernel // 2,  # Same padding
             bias=True,
         )
         self.conv = weight_norm(conv)
@@ -120,5 +147,8 @@ class ConvLayer(nn.Module):
         """
         Compute output tensor from input tensor
         """
+        if self.causal_padding:
+            input_t = F.pad(input_t, [self.causal_padding, 0])
+
         acts = self.conv(input_t)
         return self.nonlinearity(acts)
@@ -13,10 +13,6 @@ from src.utils.trainer import Trainer
 from src.utils.checkpoint import load as load_checkpoint
 from ..models.wave_u_net import WaveUNet
 
-# Checkpointing
-WANDB_PROJECT = "wave-u-net"
-CHECKPOINT_NAME = "wave-u-net"
-
 # Loss net
 LOSS_NET_CHECKPOINT = "scene-net-scene-retrain-2-1575380038.full.ckpt"
 
@@ -29,14 +25,15 @@ WEIGHT_DECAY = 1e-4
 mse = nn.MSELoss()
 
 
-def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_epochs):
+def train(runtime, training, logging):
 
-    # Load loss net
-    loss_net = load_checkpoint(LOSS_NET_CHECKPOINT, use_cuda=use_cuda)
-    loss_net.set_feature_mode()
-    loss_net.eval()
+    # Load loss net, keeping only the layers used for features.
+    loss_net = load_checkpoint(LOSS_NET_CHECKPOINT, use_cuda=False, pin=True)
+    feature_net = loss_net.get_feature_extractor()
+    feature_net = feature_net.cuda() if runtime["cuda"] else feature_net
+    del loss_net
 
-    feature_loss = AudioFeatureLoss(loss_net, use_cuda=use_cuda)
+    feature_loss = AudioFeatureLoss(feature_net, use_cuda=runtime["cuda"])
 
     def get_feature_loss(inputs, outputs, targets):
         return feature_loss(inputs, outputs, targets)
@@ -45,12 +42,21 @@ def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_ep
         loss_t = feature_loss(inputs, outputs, targets)
         return loss_t.data.item()
 
-    trainer = Trainer(num_epochs, wandb_name)
-    trainer.setup_checkpoints(CHECKPOINT_NAME, checkpoint_epochs)
+    num_epochs = training["epochs"]
+    subsample = training["subsample"]
+    trainer = Trainer(**runtime)
+    trainer.setup_checkpoints(**logging["checkpoint"], task_name=__name__)
+    trainer.register_loss_fn(get_feature_loss)
+    trainer.register_metric_fn(get_mse_metric, "Loss")
+    trainer.register_metric_fn(get_feature_loss_metric, "Feature Loss")
+    trainer.input_shape = [2 ** 15]
+    trainer.target_shape = [2 ** 15]
+    trainer.output_shape = [2 ** 15]
+    net = trainer.load_net(WaveUNet)
+    batch_size = trainer.get_batch_size(training, net, task_name=__name__)
     trainer.setup_wandb(
-        WANDB_PROJECT,
-        wandb_name,
-        config={
+        **logging["wandb"],
+        run_info={
             "Batch Size": batch_size,
             "Epochs": num_epochs,
             "Adam Betas": ADAM_BETAS,
@@ -60,13 +66,9 @@ def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_ep
         },
     )
     train_loader, test_loader = trainer.load_data_loaders(Dataset, batch_size, subsample)
-    trainer.register_loss_fn(get_feature_loss)
-    trainer.register_metric_fn(get_mse_metric, "Loss")
-    trainer.register_metric_fn(get_feature_loss_metric, "Feature Loss")
-    trainer.input_shape = [2 ** 15]
-    trainer.target_shape = [2 ** 15]
-    trainer.output_shape = [2 ** 15]
-    net = trainer.load_net(WaveUNet)
+    if training.get("ema_decay"):
+        trainer.use_ema(net, decay=training["ema_decay"])
+
     optimizer = trainer.load_optimizer(
         net,
         learning_rate=LEARNING_RATE,
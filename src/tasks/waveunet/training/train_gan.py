@@ -5,8 +5,10 @@ Batch size of 32 uses approx 5GB of GPU memory.
 
 Uses NoGAN training schedule
 https://github.com/jantic/DeOldify#what-is-nogan
+
+The discriminator and generator are trained in the same step, which runs the generator
+once and updates the discriminator on its detached output, see Trainer.use_gan.
 """
-import torch
 import torch.nn as nn
 
 from src.datasets import NoisySpeechDataset
@@ -16,34 +18,39 @@ from src.utils.trainer import Trainer
 from ..models.wave_u_net import WaveUNet
 from ..models.mel_discriminator import MelDiscriminatorNet
 
-# Checkpointing
-WANDB_PROJECT = "wave-u-net"
-CHECKPOINT_NAME = "wave-u-net"
-
 # Training hyperparams
 LEARNING_RATE = 1e-4
 ADAM_BETAS = (0.5, 0.9)
 WEIGHT_DECAY = 1e-4
 DISC_WEIGHT = 1e-1
 DISC_LEARNING_RATE = 4 * LEARNING_RATE
+# Update the discriminator and generator every N steps, for a D:G update ratio.
+DISC_EVERY = 1
+GEN_EVERY = 1
 
 
 mse = nn.MSELoss()
 
 
-def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_epochs):
-    trainer = Trainer(num_epochs, wandb_name)
-    trainer.setup_checkpoints(CHECKPOINT_NAME, checkpoint_epochs)
+def train(runtime, training, logging):
+    # The probe step only trains one net, so it can't size the discriminator's steps.
+    assert training["batch_size"] != "auto", "GAN training needs a fixed batch size"
+    batch_size = training["batch_size"]
+    num_epochs = training["epochs"]
+    subsample = training["subsample"]
+    trainer = Trainer(**runtime)
+    trainer.setup_checkpoints(**logging["checkpoint"], task_name=__name__)
     trainer.setup_wandb(
-        WANDB_PROJECT,
-        wandb_name,
-        config={
+        **logging["wandb"],
+        run_info={
             "Batch Size": batch_size,
             "Epochs": num_epochs,
             "Adam Betas": ADAM_BETAS,
             "Learning Rate": LEARNING_RATE,
             "Disc Learning Rate": DISC_LEARNING_RATE,
             "Disc Weight": DISC_WEIGHT,
+            "Disc Every": DISC_EVERY,
+            "Gen Every": GEN_EVERY,
             "Weight Decay": WEIGHT_DECAY,
             "Fine Tuning": False,
         },
@@ -51,6 +58,9 @@ def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_ep
 
     # Construct generator network
     gen_net = trainer.load_net(WaveUNet)
+    if training.get("ema_decay"):
+        trainer.use_ema(gen_net, decay=training["ema_decay"])
+
     gen_optimizer = trainer.load_optimizer(
         gen_net,
         learning_rate=LEARNING_RATE,
@@ -72,8 +82,6 @@ def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_ep
     )
 
     # First, train generator using MSE loss
-    disc_net.freeze()
-    gen_net.unfreeze()
     trainer.register_loss_fn(get_mse_loss)
     trainer.register_metric_fn(get_mse_metric, "Loss")
     trainer.input_shape = [2 ** 15]
@@ -81,26 +89,18 @@ def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_ep
     trainer.output_shape = [2 ** 15]
     trainer.train(gen_net, num_epochs, gen_optimizer, train_loader, test_loader)
 
-    # Next, train GAN using the output of the generator
+    # Next, train the discriminator on the output of the generator
     def get_disc_loss(_, fake_audio, real_audio):
         """
         We want to compare the inputs (real audio) with the generated outout (fake audio)
         """
         return disc_loss.for_discriminator(real_audio, fake_audio)
 
-    def get_disc_metric(_, fake_audio, real_audio):
-        loss_t = disc_loss.for_discriminator(real_audio, fake_audio)
-        return loss_t.data.item()
-
-    disc_net.unfreeze()
-    gen_net.freeze()
-    trainer.loss_fns = []
-    trainer.metric_fns = []
-    trainer.register_loss_fn(get_disc_loss)
-    trainer.register_metric_fn(get_disc_metric, "Discriminator Loss")
-    trainer.train(gen_net, num_epochs, disc_optimizer, train_loader, test_loader)
+    trainer.use_gan(disc_net, disc_optimizer, get_disc_loss, gen_every=None)
+    trainer.train(gen_net, num_epochs, gen_optimizer, train_loader, test_loader)
 
-    # Finally, train the generator using the discriminator and MSE loss
+    # Finally, train the generator and discriminator together,
+    # with the discriminator and MSE loss for the generator.
     def get_gen_loss(_, fake_audio, real_audio):
         return disc_loss.for_generator(real_audio, fake_audio)
 
@@ -108,14 +108,15 @@ def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_ep
         loss_t = disc_loss.for_generator(real_audio, fake_audio)
         return loss_t.data.item()
 
-    disc_net.freeze()
-    gen_net.unfreeze()
-    trainer.loss_fns = []
-    trainer.metric_fns = []
-    trainer.register_loss_fn(get_mse_loss)
     trainer.register_loss_fn(get_gen_loss, weight=DISC_WEIGHT)
-    trainer.register_metric_fn(get_mse_metric, "Loss")
     trainer.register_metric_fn(get_gen_metric, "Generator Loss")
+    trainer.use_gan(
+        disc_net,
+        disc_optimizer,
+        get_disc_loss,
+        disc_every=DISC_EVERY,
+        gen_every=GEN_EVERY,
+    )
     trainer.train(gen_net, num_epochs, gen_optimizer, train_loader, test_loader)
 
 
@@ -9,33 +9,43 @@ From "Improved Speech Enhancement with the Wave-U-Net"
 - Early stopping when no improvements on validation set for 20 epochs
 - Fine tuning done with 1e-1 x LR and double batch size
 
+Set `training.mix_librispeech` to also train on noisy LibriSpeech: batches are then
+mixed from both datasets, in proportion to their sizes, see MultiSourceLoader.
 """
+import functools
+
 import torch.nn as nn
 
-from src.datasets import NoisySpeechDataset as Dataset
+from src.datasets import NoisySpeechDataset, NoisyLibreSpeechDataset, NoisyScenesDataset
 from src.utils.trainer import Trainer
 
 from ..models.wave_u_net import WaveUNet
 
-# Checkpointing
-WANDB_PROJECT = "wave-u-net"
-CHECKPOINT_NAME = "wave-u-net"
-
 # Training hyperparams
 LEARNING_RATE = 1e-4
 ADAM_BETAS = (0.5, 0.9)
 WEIGHT_DECAY = 1e-5
+EARLY_STOPPING_PATIENCE = 20
 
 mse = nn.MSELoss()
 
 
-def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_epochs):
-    trainer = Trainer(use_cuda, wandb_name)
-    trainer.setup_checkpoints(CHECKPOINT_NAME, checkpoint_epochs)
+def train(runtime, training, logging):
+    num_epochs = training["epochs"]
+    subsample = training["subsample"]
+    trainer = Trainer(**runtime)
+    trainer.setup_checkpoints(**logging["checkpoint"], task_name=__name__)
+    trainer.register_loss_fn(get_mse_loss)
+    trainer.register_metric_fn(get_mse_metric, "Loss")
+    trainer.use_early_stopping("Loss", patience=EARLY_STOPPING_PATIENCE)
+    trainer.input_shape = [2 ** 15]
+    trainer.target_shape = [2 ** 15]
+    trainer.output_shape = [2 ** 15]
+    net = trainer.load_net(WaveUNet)
+    batch_size = trainer.get_batch_size(training, net, task_name=__name__)
     trainer.setup_wandb(
-        WANDB_PROJECT,
-        wandb_name,
-        config={
+        **logging["wandb"],
+        run_info={
             "Batch Size": batch_size,
             "Epochs": num_epochs,
             "Adam Betas": ADAM_BETAS,
@@ -44,13 +54,22 @@ def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_ep
             "Fine Tuning": False,
         },
     )
-    train_loader, test_loader = trainer.load_data_loaders(Dataset, batch_size, subsample)
-    trainer.register_loss_fn(get_mse_loss)
-    trainer.register_metric_fn(get_mse_metric, "Loss")
-    trainer.input_shape = [2 ** 15]
-    trainer.target_shape = [2 ** 15]
-    trainer.output_shape = [2 ** 15]
-    net = trainer.load_net(WaveUNet)
+    mix_librispeech = training.get("mix_librispeech")
+    if mix_librispeech:
+        # Noise from acoustic scenes is shared by the LibriSpeech train and test sets.
+        noise_data = NoisyScenesDataset(subsample=subsample)
+        librispeech = functools.partial(NoisyLibreSpeechDataset, noise_data)
+        datasets = {"vctk": NoisySpeechDataset, "librispeech": librispeech}
+        train_loader, test_loader = trainer.load_multi_source_data_loaders(
+            datasets, batch_size, subsample
+        )
+    else:
+        train_loader, test_loader = trainer.load_data_loaders(
+            NoisySpeechDataset, batch_size, subsample
+        )
+
+    if training.get("ema_decay"):
+        trainer.use_ema(net, decay=training["ema_decay"])
 
     opt_kwargs = {
         "adam_betas": ADAM_BETAS,
@@ -79,6 +98,8 @@ def train(num_epochs, use_cuda, batch_size, wandb_name, subsample, checkpoint_ep
     trainer.test_set.clean_only = False
     trainer.train_set.clean_only = False
     trainer.train(net, num_epochs, optimizer, train_loader, test_loader)
+    if mix_librispeech:
+        train_loader.close()
 
 
 def get_mse_loss(inputs, outputs, targets):
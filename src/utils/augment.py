@@ -1,7 +1,6 @@
 import random
 
 import numpy as np
-from scipy import signal
 
 SAMPLING_FREQ = 16000
 
@@ -42,6 +41,8 @@ def mask_freq_band(input_arr, mask_size=None, mask_start=None):
     Randomly removes freqency band
     from input array using band stop filter
     """
+    from scipy import signal
+
     mask_size = mask_size = mask_size if mask_size else random.uniform(2000, 4000)
     mask_start = mask_start = mask_start if mask_start else random.uniform(500, 2500)
     freq_range = [mask_start, mask_start + mask_size]
@@ -54,6 +55,8 @@ def mask_high_freq(input_arr, mask_freq=None):
     Randomly removes high frequency signal
     from input array using low pass filter
     """
+    from scipy import signal
+
     mask_freq = mask_freq if mask_freq else random.uniform(1500, 4000)
     b, a = signal.butter(10, mask_freq, "low", fs=SAMPLING_FREQ)
     return signal.lfilter(b, a, input_arr)
@@ -64,6 +67,8 @@ def mask_low_freq(input_arr, mask_freq=None):
     Randomly removes high frequency signal
     from input array using low pass filter
     """
+    from scipy import signal
+
     mask_freq = mask_freq if mask_freq else random.uniform(500, 1500)
     b, a = signal.butter(10, mask_freq, "high", fs=SAMPLING_FREQ)
     return signal.lfilter(b, a, input_arr)
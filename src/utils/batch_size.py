@@ -0,0 +1,223 @@
+"""
+Automatic batch size, the largest batch size which fits into a memory budget.
+
+Training steps of the model are run on batches of zeros, doubling the batch size until a
+step doesn't fit, then a binary search finds the largest batch size which does.
+On GPU, a step is measured with PyTorch's peak memory stats, and running out of memory
+is caught. On CPU, a step is measured as the parameters, their gradients and the
+activations saved for the backward pass. Either way, memory for the optimizer state,
+which a probe step doesn't allocate, is added.
+
+Probing takes a while, so batch sizes are cached in a local file, by task, model hash,
+hardware and configured budget. The default budget isn't part of the key, as on CPU it
+depends on the memory which is free at the time. Trainer uses this when the config has
+`batch_size: auto`.
+"""
+import os
+import json
+import hashlib
+import platform
+
+import torch
+
+from src.utils.checkpoint import CHECKPOINT_DIR
+from src.utils.recompute import get_bytes
+
+CACHE_PATH = os.path.join(CHECKPOINT_DIR, "batch_sizes.json")
+MAX_BATCH_SIZE = 4096
+# Share of memory used by default, leaving space for data loading and fragmentation.
+DEVICE_MEMORY_FRACTION = 0.9
+HOST_MEMORY_FRACTION = 0.5
+# Adam keeps two running averages for each parameter.
+OPTIMIZER_STATES = 2
+GB = 2 ** 30
+
+
+def get_batch_size(task_name, net, step_fn, device, memory_budget=None, cache_path=None):
+    """
+    Returns the largest batch size for which a training step fits into memory,
+    from the cache if it has been found before.
+        step_fn(batch_size) runs the forward and backward pass of a training step
+        memory_budget is in bytes, defaults to a share of the device or host memory
+        cache_path defaults to CACHE_PATH
+    """
+    cache_path = cache_path or CACHE_PATH
+    device = torch.device(device)
+    hardware = get_hardware_name(device)
+    budget_name = "default" if memory_budget is None else str(int(memory_budget))
+    key = "/".join([task_name, get_model_hash(net), hardware, budget_name])
+    cache = load_cache(cache_path)
+    if key in cache:
+        batch_size = cache[key]["batch_size"]
+        print(f"Using cached batch size {batch_size} for {task_name} on {hardware}")
+        return batch_size
+
+    if memory_budget is None:
+        memory_budget = get_memory_budget(device)
+
+    print(f"Finding batch size for {task_name} in {memory_budget / GB:.2f}GB...")
+    batch_size = find_max_batch_size(net, step_fn, device, memory_budget)
+    print(f"Using batch size {batch_size}")
+    cache[key] = {
+        "batch_size": batch_size,
+        "task": task_name,
+        "hardware": hardware,
+        "memory_budget_gb": memory_budget / GB,
+    }
+    save_cache(cache_path, cache)
+    return batch_size
+
+
+def find_max_batch_size(
+    net, step_fn, device, memory_budget, max_batch_size=MAX_BATCH_SIZE
+):
+    """
+    Binary search for the largest batch size, up to max_batch_size, which fits.
+    """
+
+    def fits(batch_size):
+        step_bytes = measure_step(net, step_fn, batch_size, device)
+        return step_bytes is not None and step_bytes <= memory_budget
+
+    if not fits(1):
+        raise ValueError(f"A batch of 1 doesn't fit into {memory_budget / GB:.2f}GB")
+
+    # Double the batch size to find an upper bound, then bisect.
+    low, high = 1, None
+    while high is None:
+        if low >= max_batch_size:
+            return max_batch_size
+
+        batch_size = min(2 * low, max_batch_size)
+        if fits(batch_size):
+            low = batch_size
+        else:
+            high = batch_size
+
+    while high - low > 1:
+        batch_size = (low + high) // 2
+        if fits(batch_size):
+            low = batch_size
+        else:
+            high = batch_size
+
+    return low
+
+
+def measure_step(net, step_fn, batch_size, device):
+    """
+    Returns the peak bytes of memory used by a training step of `batch_size`, with the
+    optimizer state, or None if it ran out of memory.
+    Buffers, like batch norm running stats, are restored and gradients are cleared.
+    """
+    device = torch.device(device)
+    params = [p for p in net.parameters() if p.requires_grad]
+    optimizer_bytes = OPTIMIZER_STATES * sum(get_bytes(p) for p in params)
+    buffers = [buffer.clone() for buffer in net.buffers()]
+    try:
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+            torch.cuda.empty_cache()
+            torch.cuda.reset_peak_memory_stats(device)
+            step_fn(batch_size)
+            torch.cuda.synchronize(device)
+            step_bytes = torch.cuda.max_memory_allocated(device)
+        else:
+            saved_bytes = measure_saved_bytes(step_fn, batch_size)
+            param_bytes = sum(get_bytes(p) for p in net.parameters())
+            step_bytes = param_bytes + sum(get_bytes(p) for p in params) + saved_bytes
+    except RuntimeError as e:
+        if not is_out_of_memory(e):
+            raise
+
+        print(f"Batch size {batch_size} ran out of memory")
+        return None
+    finally:
+        net.zero_grad(set_to_none=True)
+        with torch.no_grad():
+            for buffer, saved_buffer in zip(net.buffers(), buffers):
+                buffer.copy_(saved_buffer)
+
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
+
+    return step_bytes + optimizer_bytes
+
+
+def measure_saved_bytes(step_fn, batch_size):
+    """
+    Run a training step, returning the bytes of activations saved for the backward pass.
+    Tensors which share storage are only counted once.
+    """
+    storages = {}
+
+    def pack(tensor):
+        if not isinstance(tensor, torch.nn.Parameter):
+            storage = tensor.untyped_storage()
+            storages[storage.data_ptr()] = storage.nbytes()
+
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+        step_fn(batch_size)
+
+    return sum(storages.values())
+
+
+def is_out_of_memory(error):
+    return isinstance(error, torch.cuda.OutOfMemoryError) or (
+        "out of memory" in str(error) or "can't allocate memory" in str(error)
+    )
+
+
+def get_memory_budget(device):
+    """
+    Default budget in bytes: a share of the GPU's memory, or of the available host memory.
+    """
+    if device.type == "cuda":
+        total_bytes = torch.cuda.get_device_properties(device).total_memory
+        return int(DEVICE_MEMORY_FRACTION * total_bytes)
+
+    available_bytes = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    return int(HOST_MEMORY_FRACTION * available_bytes)
+
+
+def get_hardware_name(device):
+    """
+    Describes the device, eg. "Tesla V100-SXM2-16GB 15.8GB" or "x86_64 8 CPUs 31.3GB".
+    """
+    if device.type == "cuda":
+        props = torch.cuda.get_device_properties(device)
+        return f"{props.name} {props.total_memory / GB:.1f}GB"
+
+    total_bytes = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    return f"{platform.machine()} {os.cpu_count()} CPUs {total_bytes / GB:.1f}GB"
+
+
+def get_model_hash(net):
+    """
+    Hash of the model's layers and parameters, including whether they're frozen.
+    """
+    params = [
+        f"{name}:{tuple(p.shape)}:{p.dtype}:{p.requires_grad}"
+        for name, p in net.named_parameters()
+    ]
+    description = "\n".join([repr(net)] + params)
+    return hashlib.sha1(description.encode()).hexdigest()[:16]
+
+
+def load_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return {}
+
+    with open(cache_path, "r") as f:
+        return json.load(f)
+
+
+def save_cache(cache_path, cache):
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    with open(cache_path, "w") as f:
+        json.dump(cache, f, indent=2)
@@ -1,23 +1,45 @@
 import os
+import copy
 import time
+import queue
+import itertools
+import threading
+import functools
+import subprocess
 
 import torch
-import wandb
 
 from . import s3
+from . import tensor_file
+from .checkpoint_store import CheckpointStore
 
 CHECKPOINT_DIR = "checkpoints"
+MAX_IN_FLIGHT = 2  # Max number of checkpoints being written or uploaded at once
 
+# Model checkpoints are kept in a content-addressed store, see checkpoint_store.py
+store = CheckpointStore(CHECKPOINT_DIR)
 
-def load(checkpoint_filename, net=None, use_cuda=True):
+
+def load(checkpoint_filename, net=None, use_cuda=True, pin=False):
+    """
+    Load a model checkpoint from the checkpoint store, downloading it if required.
+    Pinned checkpoints are never evicted from the local cache.
+    Flat tensor (.safetensors) checkpoints are memory-mapped and loaded straight onto
+    the target device, see tensor_file.py
+    """
     print(f"Loading model from {checkpoint_filename}")
-    checkpoint_path = os.path.join(CHECKPOINT_DIR, checkpoint_filename)
-    if not os.path.exists(checkpoint_path):
-        s3.download_file(checkpoint_path, checkpoint_path)
+    checkpoint_path = store.get(checkpoint_filename)
+    if pin:
+        store.pin(checkpoint_filename)
+
+    if checkpoint_filename.endswith(tensor_file.SUFFIX):
+        device = "cuda" if use_cuda else "cpu"
+        return tensor_file.load_module(checkpoint_path, device, net=net)
 
     map_location = None if use_cuda else torch.device("cpu")
     if checkpoint_filename.endswith("full.ckpt"):
-        net = torch.load(checkpoint_path, map_location=map_location)
+        # Full checkpoints pickle the model class, not just tensors.
+        net = torch.load(checkpoint_path, map_location=map_location, weights_only=False)
     else:
         assert net, "A model is required for loading a state dict checkpoint."
         state_dict = torch.load(checkpoint_path, map_location=map_location)
@@ -30,18 +52,11 @@ def save(net, prefix, name=None, use_wandb=False):
     """
     Save full model checkpoint to disk
     """
-    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
     checkpoint_filename = get_checkpoint_filename(prefix, name, suffix="full.ckpt")
     print(f"\nSaving checkpoint model as {checkpoint_filename}... ", end="")
-    checkpoint_path = os.path.join(CHECKPOINT_DIR, checkpoint_filename)
-    torch.save(net, checkpoint_path)
-    s3.upload_file(CHECKPOINT_DIR, checkpoint_path)
+    checkpoint_path = store.save(net, checkpoint_filename)
+    upload_stored(checkpoint_filename, checkpoint_path, use_wandb)
     print(f"done\n")
-    if use_wandb:
-        # Upload model to wandb
-        print(f"Uploading {checkpoint_path} to W&B")
-        wandb.save(checkpoint_path)
-
     return checkpoint_path
 
 
@@ -49,19 +64,123 @@ def save_state_dict(net, prefix, name=None, use_wandb=False):
     """
     Save model state dict checkpoint to disk
     """
-    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
     checkpoint_filename = get_checkpoint_filename(prefix, name, suffix="ckpt")
     print(f"\nSaving checkpoint state dict as {checkpoint_filename}... ", end="")
+    checkpoint_path = store.save(net.state_dict(), checkpoint_filename)
+    upload_stored(checkpoint_filename, checkpoint_path, use_wandb)
+    print(f"done\n")
+    return checkpoint_path
+
+
+def write(obj, checkpoint_filename):
+    """
+    Write a file to the checkpoint dir, outside of the checkpoint store.
+    The file is written under a temporary name and then renamed,
+    so a crash never leaves a half-written checkpoint behind.
+    """
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
     checkpoint_path = os.path.join(CHECKPOINT_DIR, checkpoint_filename)
-    torch.save(net.state_dict(), checkpoint_path)
+    tmp_path = f"{checkpoint_path}.tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, checkpoint_path)
+    return checkpoint_path
+
+
+def upload(checkpoint_path, use_wandb=False):
+    """
+    Upload a checkpoint to S3, and optionally W&B
+    """
     s3.upload_file(CHECKPOINT_DIR, checkpoint_path)
-    print(f"done\n")
     if use_wandb:
         # Upload model to wandb
         print(f"Uploading {checkpoint_path} to W&B")
+        import wandb
+
         wandb.save(checkpoint_path)
 
-    return checkpoint_path
+
+def upload_stored(checkpoint_filename, checkpoint_path, use_wandb=False):
+    """
+    Upload a checkpoint from the checkpoint store to S3, and optionally W&B
+    """
+    store.upload(checkpoint_filename)
+    if use_wandb:
+        print(f"Uploading {checkpoint_filename} to W&B")
+        import wandb
+
+        wandb.save(checkpoint_path)
+
+
+def load_training_state(prefix, run_id, phase=0, task_name=None):
+    """
+    Load the latest training state saved by a run, from disk or S3.
+    Returns None if the run hasn't saved any training state yet.
+    """
+    checkpoint_filename = get_training_state_filename(prefix, run_id, phase, task_name)
+    checkpoint_path = os.path.join(CHECKPOINT_DIR, checkpoint_filename)
+    if not os.path.exists(checkpoint_path):
+        try:
+            s3.download_file(checkpoint_path, checkpoint_path)
+        except subprocess.CalledProcessError:
+            return None
+
+    if not os.path.exists(checkpoint_path):
+        return None
+
+    print(f"Loading training state from {checkpoint_filename}")
+    return torch.load(checkpoint_path, map_location="cpu", weights_only=False)
+
+
+def get_training_state_filename(prefix, run_id, phase, task_name=None):
+    """
+    Training state has no timestamp: each save replaces the last one,
+    so the latest state of a run can always be found by its run id. The task name
+    keeps apart the states of tasks which save checkpoints under the same prefix.
+    Scripts which call Trainer.train more than once save a state for each phase.
+    """
+    name = "-".join(part for part in [prefix, task_name, run_id] if part)
+    return f"{name}.phase-{phase}.state.ckpt"
+
+
+def to_cpu(obj):
+    """
+    Copy all tensors in a nested structure of dicts, lists and tuples into CPU memory.
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    elif isinstance(obj, dict):
+        return {key: to_cpu(value) for key, value in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(value) for value in obj)
+    else:
+        return copy.deepcopy(obj)
+
+
+def copy_to_cpu(net):
+    """
+    Deep copy a model into CPU memory. Its parameters and buffers are copied straight
+    to the CPU, so no second copy of the model is made on the GPU.
+    """
+    memo = {}
+    for tensor in itertools.chain(net.parameters(), net.buffers()):
+        cpu_tensor = tensor.detach().to("cpu", copy=True)
+        if isinstance(tensor, torch.nn.Parameter):
+            cpu_tensor = torch.nn.Parameter(cpu_tensor, tensor.requires_grad)
+
+        memo[id(tensor)] = cpu_tensor
+
+    return copy.deepcopy(net, memo)
+
+
+def get_best_checkpoint_filename(prefix, name, phase):
+    """
+    The best checkpoint has no timestamp, so each new best replaces the last one.
+    Each training phase keeps its own best checkpoint.
+    """
+    if name:
+        return f"{prefix}-{name}.phase-{phase}.best.full.ckpt"
+    else:
+        return f"{prefix}.phase-{phase}.best.full.ckpt"
 
 
 def get_checkpoint_filename(prefix, name, suffix):
@@ -69,3 +188,111 @@ def get_checkpoint_filename(prefix, name, suffix):
         return f"{prefix}-{name}-{int(time.time())}.{suffix}"
     else:
         return f"{prefix}-{int(time.time())}.{suffix}"
+
+
+class CheckpointWriter:
+    """
+    Saves full model checkpoints in the background, so training doesn't wait on the disk
+    or the network.
+
+    Calling `save` copies the model weights into CPU memory and returns straight away.
+    A writer thread then writes the checkpoint to disk, and an uploader thread uploads it.
+    If `max_in_flight` checkpoints are already being written or uploaded, `save` blocks
+    until one of them is done. Call `flush` to wait for all checkpoints to finish.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT):
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.write_queue = queue.Queue()
+        self.upload_queue = queue.Queue()
+        self.errors = []
+        # CPU copies of each saved net, which snapshots are loaded into before writing.
+        self.templates = {}
+        threading.Thread(target=self._write_loop, daemon=True).start()
+        threading.Thread(target=self._upload_loop, daemon=True).start()
+
+    def save(self, net, prefix, name=None, use_wandb=False, best=False, phase=0):
+        """
+        Snapshot the model and queue it to be saved, returns the checkpoint name.
+            best saves the model as the phase's best checkpoint, replacing the last best
+        """
+        self._raise_errors()
+        self.slots.acquire()
+        if best:
+            checkpoint_filename = get_best_checkpoint_filename(prefix, name, phase)
+        else:
+            checkpoint_filename = get_checkpoint_filename(prefix, name, "full.ckpt")
+
+        print(f"\nQueueing checkpoint model as {checkpoint_filename}\n")
+        state_dict = to_cpu(net.state_dict())
+        template = self._get_template(net)
+        self.write_queue.put((template, state_dict, checkpoint_filename, use_wandb))
+        return checkpoint_filename
+
+    def save_training_state(
+        self, state, prefix, run_id, phase=0, task_name=None, use_wandb=False
+    ):
+        """
+        Snapshot the training state and queue it to be saved, returns the checkpoint path.
+            state is a dict of tensors and plain Python values, see Trainer.get_training_state
+        """
+        self._raise_errors()
+        self.slots.acquire()
+        checkpoint_filename = get_training_state_filename(
+            prefix, run_id, phase, task_name
+        )
+        self.write_queue.put((None, to_cpu(state), checkpoint_filename, use_wandb))
+        return os.path.join(CHECKPOINT_DIR, checkpoint_filename)
+
+    def flush(self):
+        """
+        Wait for all queued checkpoints to be written and uploaded.
+        """
+        self.write_queue.join()
+        self.upload_queue.join()
+        self._raise_errors()
+
+    def _get_template(self, net):
+        key = id(net)
+        if key not in self.templates:
+            self.templates[key] = copy_to_cpu(net)
+
+        return self.templates[key]
+
+    def _write_loop(self):
+        while True:
+            template, state, checkpoint_filename, use_wandb = self.write_queue.get()
+            try:
+                if template is None:
+                    # Training state is replaced every epoch, so it isn't kept in the store.
+                    checkpoint_path = write(state, checkpoint_filename)
+                    upload_fn = functools.partial(upload, checkpoint_path, use_wandb)
+                else:
+                    template.load_state_dict(state)
+                    checkpoint_path = store.save(template, checkpoint_filename)
+                    upload_fn = functools.partial(
+                        upload_stored, checkpoint_filename, checkpoint_path, use_wandb
+                    )
+
+                self.upload_queue.put(upload_fn)
+            except Exception as e:
+                self.errors.append(e)
+                self.slots.release()
+            finally:
+                self.write_queue.task_done()
+
+    def _upload_loop(self):
+        while True:
+            upload_fn = self.upload_queue.get()
+            try:
+                upload_fn()
+            except Exception as e:
+                self.errors.append(e)
+            finally:
+                self.slots.release()
+                self.upload_queue.task_done()
+
+    def _raise_errors(self):
+        if self.errors:
+            error = self.errors.pop(0)
+            raise RuntimeError("Failed to save checkpoint") from error
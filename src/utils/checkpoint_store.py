@@ -0,0 +1,297 @@
+"""
+Content-addressed checkpoint store, with a size-bounded local cache.
+
+Each checkpoint file is stored once, named by the SHA-256 hash of its contents:
+
+    checkpoints/objects/<hash>     the checkpoint file
+    checkpoints/refs/<name>        a text file holding the hash for a friendly name
+    checkpoints/manifest.json      local index: names -> hashes, object sizes and usage
+
+S3 mirrors the objects and refs folders. Saving the same weights under a new name only
+adds a ref, and a checkpoint is only downloaded if its object isn't already cached.
+When the cache grows past `max_bytes`, the least recently used objects are deleted,
+except for those which are pinned. Objects which haven't been uploaded are only deleted
+once no uploaded object is left to evict. Names saved in the old layout
+(checkpoints/<name>, on disk or S3) are moved into the store the first time they are
+requested, and are uploaded by the next explicit upload.
+
+The manifest is guarded by a lock file, so that several processes, eg. the workers of a
+hyperparameter search, can share a store.
+"""
+import os
+import json
+import time
+import fcntl
+import hashlib
+import threading
+import contextlib
+import subprocess
+
+import torch
+
+from . import s3
+
+MAX_CACHE_BYTES = 20 * 2 ** 30  # 20GB
+HASH_CHUNK_BYTES = 2 ** 20
+
+
+class CheckpointStore:
+    def __init__(self, root, s3_dir=None, max_bytes=MAX_CACHE_BYTES):
+        self.root = root
+        self.s3_dir = s3_dir or root
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(root, "objects")
+        self.refs_dir = os.path.join(root, "refs")
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.lock_path = os.path.join(root, "manifest.lock")
+        self.lock = threading.RLock()
+        self.lock_depth = 0
+        self.lock_file = None
+
+    def save(self, obj, name):
+        """
+        Save an object with torch.save and add it to the store, returns the object path.
+        """
+        tmp_path = self._get_tmp_path()
+        # Saving to a file handle, rather than a path, means that the same object always
+        # produces the same bytes: torch otherwise records the filename in the archive.
+        with open(tmp_path, "wb") as f:
+            torch.save(obj, f)
+
+        return self.put(tmp_path, name)
+
+    def put(self, path, name):
+        """
+        Move a file into the store under the given name, returns the object path.
+        """
+        os.makedirs(self.objects_dir, exist_ok=True)
+        checkpoint_hash = get_file_hash(path)
+        object_path = self.get_object_path(checkpoint_hash)
+        with self._locked():
+            manifest = self._read_manifest()
+            if checkpoint_hash in manifest["objects"]:
+                os.remove(path)  # Already stored
+            else:
+                os.replace(path, object_path)
+                manifest["objects"][checkpoint_hash] = {
+                    "size": os.path.getsize(object_path),
+                    "uploaded": False,
+                }
+
+            self._set_ref(manifest, name, checkpoint_hash)
+            self._touch(manifest, checkpoint_hash)
+            self._evict(manifest, keep=checkpoint_hash)
+            self._write_manifest(manifest)
+
+        return object_path
+
+    def get(self, name):
+        """
+        Get the local path of a named checkpoint, downloading it if it isn't cached.
+        """
+        with self._locked():
+            manifest = self._read_manifest()
+            if name not in manifest["names"]:
+                self._fetch_ref(name)
+                manifest = self._read_manifest()
+
+            checkpoint_hash = manifest["names"][name]
+            object_path = self.get_object_path(checkpoint_hash)
+            if checkpoint_hash not in manifest["objects"]:
+                print(f"Downloading checkpoint {name}")
+                tmp_path = self._get_tmp_path()
+                s3_path = os.path.join(self.s3_dir, "objects", checkpoint_hash)
+                s3.download_file(s3_path, tmp_path)
+                assert get_file_hash(tmp_path) == checkpoint_hash, f"Corrupt {name}"
+                os.replace(tmp_path, object_path)
+                manifest["objects"][checkpoint_hash] = {
+                    "size": os.path.getsize(object_path),
+                    "uploaded": True,
+                }
+
+            self._touch(manifest, checkpoint_hash)
+            self._evict(manifest, keep=checkpoint_hash)
+            self._write_manifest(manifest)
+
+        return object_path
+
+    def upload(self, name):
+        """
+        Upload a named checkpoint to S3. Objects which are already on S3 are skipped.
+        """
+        with self._locked():
+            manifest = self._read_manifest()
+            checkpoint_hash = manifest["names"][name]
+            is_uploaded = manifest["objects"][checkpoint_hash]["uploaded"]
+
+        if not is_uploaded:
+            object_path = self.get_object_path(checkpoint_hash)
+            s3.upload_file(os.path.join(self.s3_dir, "objects"), object_path)
+
+        s3.upload_file(os.path.join(self.s3_dir, "refs"), self.get_ref_path(name))
+        with self._locked():
+            manifest = self._read_manifest()
+            if checkpoint_hash in manifest["objects"]:
+                manifest["objects"][checkpoint_hash]["uploaded"] = True
+                self._write_manifest(manifest)
+
+    def pin(self, name):
+        """
+        Never evict the named checkpoint from the local cache.
+        """
+        with self._locked():
+            manifest = self._read_manifest()
+            if name not in manifest["pinned"]:
+                manifest["pinned"].append(name)
+                self._write_manifest(manifest)
+
+    def unpin(self, name):
+        with self._locked():
+            manifest = self._read_manifest()
+            if name in manifest["pinned"]:
+                manifest["pinned"].remove(name)
+                self._write_manifest(manifest)
+
+    def get_object_path(self, checkpoint_hash):
+        return os.path.join(self.objects_dir, checkpoint_hash)
+
+    def get_ref_path(self, name):
+        return os.path.join(self.refs_dir, name)
+
+    def get_cache_size(self):
+        with self._locked():
+            manifest = self._read_manifest()
+
+        return sum(o["size"] for o in manifest["objects"].values())
+
+    def _fetch_ref(self, name):
+        """
+        Add a name which isn't in the manifest to the manifest.
+        Local refs and checkpoints in the old checkpoints/<name> layout are used first,
+        so that cached checkpoints load without S3. Otherwise tries S3 refs, then the
+        old layout on S3.
+        """
+        os.makedirs(self.refs_dir, exist_ok=True)
+        ref_path = self.get_ref_path(name)
+        legacy_path = os.path.join(self.root, name)
+        if not os.path.exists(ref_path) and not os.path.exists(legacy_path):
+            try:
+                s3.download_file(os.path.join(self.s3_dir, "refs", name), ref_path)
+            except subprocess.CalledProcessError:
+                pass
+
+        if os.path.exists(ref_path):
+            with open(ref_path, "r") as f:
+                checkpoint_hash = f.read().strip()
+
+            manifest = self._read_manifest()
+            manifest["names"][name] = checkpoint_hash
+            self._write_manifest(manifest)
+            return
+
+        if not os.path.exists(legacy_path):
+            s3.download_file(os.path.join(self.s3_dir, name), legacy_path)
+
+        print(f"Moving checkpoint {name} into the checkpoint store")
+        self.put(legacy_path, name)
+
+    def _set_ref(self, manifest, name, checkpoint_hash):
+        old_hash = manifest["names"].get(name)
+        manifest["names"][name] = checkpoint_hash
+        tmp_path = self._get_tmp_path()
+        with open(tmp_path, "w") as f:
+            f.write(checkpoint_hash)
+
+        os.replace(tmp_path, self.get_ref_path(name))
+        if old_hash and old_hash != checkpoint_hash:
+            # The old object may not be needed any more.
+            if old_hash not in manifest["names"].values():
+                self._delete_object(manifest, old_hash)
+
+    def _touch(self, manifest, checkpoint_hash):
+        manifest["objects"][checkpoint_hash]["last_used"] = time.time()
+
+    def _evict(self, manifest, keep):
+        """
+        Delete least recently used objects until the cache fits in max_bytes.
+        Uploaded objects are evicted first, as they can be downloaded again.
+        """
+        pinned = {manifest["names"].get(name) for name in manifest["pinned"]}
+        objects = manifest["objects"]
+        cache_size = sum(o["size"] for o in objects.values())
+        by_last_used = sorted(objects, key=lambda h: objects[h].get("last_used", 0))
+        by_last_used.sort(key=lambda h: not objects[h]["uploaded"])
+        for checkpoint_hash in by_last_used:
+            if cache_size <= self.max_bytes:
+                break
+
+            if checkpoint_hash == keep or checkpoint_hash in pinned:
+                continue
+
+            if not objects[checkpoint_hash]["uploaded"]:
+                print(f"Warning: checkpoint {checkpoint_hash} was never uploaded to S3")
+
+            cache_size -= objects[checkpoint_hash]["size"]
+            self._delete_object(manifest, checkpoint_hash)
+
+    def _delete_object(self, manifest, checkpoint_hash):
+        print(f"Evicting checkpoint {checkpoint_hash} from local cache")
+        del manifest["objects"][checkpoint_hash]
+        object_path = self.get_object_path(checkpoint_hash)
+        if os.path.exists(object_path):
+            os.remove(object_path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Hold the manifest lock, across threads and processes. The lock is reentrant
+        within a process, as the lock file is only locked by the outermost call.
+        """
+        with self.lock:
+            if self.lock_depth == 0:
+                os.makedirs(self.root, exist_ok=True)
+                self.lock_file = open(self.lock_path, "a")
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+
+            self.lock_depth += 1
+            try:
+                yield
+            finally:
+                self.lock_depth -= 1
+                if self.lock_depth == 0:
+                    fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+                    self.lock_file.close()
+                    self.lock_file = None
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"names": {}, "objects": {}, "pinned": []}
+
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        tmp_path = self._get_tmp_path()
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        os.replace(tmp_path, self.manifest_path)
+
+    def _get_tmp_path(self):
+        for dirname in (self.objects_dir, self.refs_dir):
+            os.makedirs(dirname, exist_ok=True)
+
+        thread_id = threading.get_ident()
+        return os.path.join(self.root, f".tmp-{os.getpid()}-{thread_id}-{time.time()}")
+
+
+def get_file_hash(path):
+    """
+    SHA-256 hash of a file's contents.
+    """
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
@@ -1,25 +1,251 @@
-class CombinedDataLoader:
+"""
+Mix batches from several datasets, eg. VCTK and LibriSpeech noisy speech.
+"""
+import time
+import queue
+import random
+import threading
+
+from torch.utils.data import ConcatDataset
+
+PREFETCH_BATCHES = 2
+
+
+class MultiSourceLoader:
     """
-    Combines two data loaders, alternating between the two
+    Mixes batches from several data loaders. The source of each batch is picked at
+    random, in proportion to the source's weight.
+
+    Each source is read by its own thread, which keeps up to `prefetch` batches ready in
+    a queue. A source which runs out of batches starts again from the beginning, and
+    sources carry on where they left off in the next epoch, so no data is skipped.
+    The threads only run while iterating, so that no thread is left running when
+    other data loaders fork their workers, eg. for validation. Sources' loaders are
+    only started from the iterating thread, as a loader forked from a prefetching
+    thread can copy locks held by the training loop, and deadlock its workers.
+
+        loaders is a dict of data loaders by source name
+        weights is a dict of weights by source name, defaults to the number of batches
+            in each loader, so that each epoch sees about all of the data once
+        num_batches is the number of batches in an epoch, defaults to the total number
+            of batches in all loaders
+        infinite iterates forever, rather than in epochs
+        seed seeds the choice of sources, for reproducible mixes
     """
 
-    def __init__(self, loader_a, loader_b):
-        self.loader_a = loader_a
-        self.loader_b = loader_b
+    def __init__(
+        self,
+        loaders,
+        weights=None,
+        num_batches=None,
+        infinite=False,
+        prefetch=PREFETCH_BATCHES,
+        seed=None,
+    ):
+        self.loaders = loaders
+        self.names = list(loaders)
+        weights = weights or {name: len(loader) for name, loader in loaders.items()}
+        assert set(weights) == set(self.names), "Need a weight for each source"
+        self.weights = [weights[name] for name in self.names]
+        self.infinite = infinite
+        self.num_batches = None
+        if not infinite:
+            num_loader_batches = sum(len(loader) for loader in loaders.values())
+            self.num_batches = num_batches or num_loader_batches
 
-    @property
-    def is_loader_a(self):
-        return self.count % 2 == 0
+        self.prefetch = prefetch
+        self.rng = random.Random(seed)
+        self.queues = {name: queue.Queue(prefetch) for name in self.names}
+        # Each source's batch iterator, and a batch loaded but not yet queued, which
+        # are kept between epochs.
+        self.batch_iters = {name: None for name in self.names}
+        self.pending = {name: None for name in self.names}
+        # Whether a source's iterator has yielded nothing yet, to tell an empty source,
+        # and whether the source has run out, with its last batch queued.
+        self.is_fresh = {name: False for name in self.names}
+        self.has_run_out = {name: False for name in self.names}
+        self.threads = {}
+        self.stop_event = threading.Event()
+        self.stats = {name: SourceStats() for name in self.names}
 
     def __len__(self):
-        return min([2 * len(self.loader_a), 2 * len(self.loader_b)])
+        if self.infinite:
+            raise TypeError("An infinite loader has no length")
+
+        return self.num_batches
 
     def __iter__(self):
-        self.count = -1
-        self.iter_a = self.loader_a.__iter__()
-        self.iter_b = self.loader_b.__iter__()
-        return self
-
-    def __next__(self):
-        self.count += 1
-        return next(self.iter_a) if self.is_loader_a else next(self.iter_b)
+        self._start()
+        try:
+            count = 0
+            while self.infinite or count < self.num_batches:
+                name = self.rng.choices(self.names, weights=self.weights)[0]
+                yield self._get_batch(name)
+                count += 1
+        finally:
+            self._stop()
+
+    def get_stats(self):
+        """
+        Returns a dict of stats by source name:
+            batches and samples read from the source
+            samples_per_s is samples read per second of iterating
+            load_samples_per_s is samples loaded per second of the loader's time
+            wait_s is time spent waiting for the source's batches
+        """
+        return {name: stats.to_dict() for name, stats in self.stats.items()}
+
+    def close(self):
+        """
+        Stop the prefetching threads, and release the sources' batch iterators.
+        """
+        self._stop()
+        self.batch_iters = {name: None for name in self.names}
+
+    def _start(self):
+        self._stop()
+        self.stop_event.clear()
+        for name in self.names:
+            if self.stats[name].start_time is None:
+                self.stats[name].start_time = time.time()
+
+            # A source which ran out is started again once its queue is read.
+            if not self.has_run_out[name]:
+                self._start_source(name)
+
+    def _start_source(self, name):
+        self.has_run_out[name] = False
+        if self.batch_iters[name] is None:
+            self.batch_iters[name] = iter(self.loaders[name])
+            self.is_fresh[name] = True
+
+        thread = threading.Thread(target=self._prefetch_loop, args=(name,))
+        thread.daemon = True
+        thread.start()
+        self.threads[name] = thread
+
+    def _stop(self):
+        self.stop_event.set()
+        for thread in self.threads.values():
+            thread.join()
+
+        self.threads = {}
+
+    def _get_batch(self, name):
+        stats = self.stats[name]
+        start_time = time.time()
+        batch, error = self.queues[name].get()
+        stats.wait_s += time.time() - start_time
+        if error is not None:
+            raise RuntimeError(f"Failed to load batch from {name}") from error
+
+        if batch is None:
+            # The source ran out of batches, so start it again.
+            if name in self.threads:
+                self.threads[name].join()
+
+            self._start_source(name)
+            return self._get_batch(name)
+
+        stats.batches += 1
+        stats.samples += get_batch_size(batch)
+        return batch
+
+    def _prefetch_loop(self, name):
+        """
+        Queue the source's batches, until stopped, or the source runs out of batches,
+        which is queued as a batch of None.
+        """
+        while not self.stop_event.is_set():
+            # A batch that couldn't be queued before stopping is queued next epoch.
+            if self.pending[name] is None:
+                self.pending[name] = self._load_batch(name)
+
+            if not self._put(name, self.pending[name]):
+                return
+
+            batch, error = self.pending[name]
+            self.pending[name] = None
+            if error is not None:
+                return
+
+            if batch is None:
+                self.has_run_out[name] = True
+                return
+
+    def _load_batch(self, name):
+        """
+        Returns the source's next batch and None, None and an error, or None and None
+        when the source has run out of batches.
+        """
+        stats = self.stats[name]
+        start_time = time.time()
+        try:
+            batch = next(self.batch_iters[name])
+        except StopIteration:
+            self.batch_iters[name] = None
+            if self.is_fresh[name]:
+                return None, ValueError(f"Source {name} is empty")
+
+            return None, None
+        except Exception as e:
+            return None, e
+
+        self.is_fresh[name] = False
+        stats.load_s += time.time() - start_time
+        stats.loaded_samples += get_batch_size(batch)
+        return batch, None
+
+    def _put(self, name, item):
+        """
+        Queue an item, returns False if stopped while waiting for space in the queue.
+        """
+        while not self.stop_event.is_set():
+            try:
+                self.queues[name].put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+
+class MultiSourceDataset(ConcatDataset):
+    """
+    The datasets of each source, concatenated. Setting `clean_only` sets it on every
+    dataset, eg. to train on clean speech as an autoencoder.
+    """
+
+    @property
+    def clean_only(self):
+        return all(dataset.clean_only for dataset in self.datasets)
+
+    @clean_only.setter
+    def clean_only(self, clean_only):
+        for dataset in self.datasets:
+            dataset.clean_only = clean_only
+
+
+class SourceStats:
+    def __init__(self):
+        self.batches = 0
+        self.samples = 0
+        self.loaded_samples = 0
+        self.wait_s = 0
+        self.load_s = 0
+        self.start_time = None
+
+    def to_dict(self):
+        elapsed_s = time.time() - self.start_time if self.start_time else 0
+        return {
+            "batches": self.batches,
+            "samples": self.samples,
+            "samples_per_s": self.samples / elapsed_s if elapsed_s else 0,
+            "load_samples_per_s": self.loaded_samples / self.load_s if self.load_s else 0,
+            "wait_s": self.wait_s,
+        }
+
+
+def get_batch_size(batch):
+    first = batch[0] if isinstance(batch, (list, tuple)) else batch
+    return len(first)
@@ -1,50 +1,322 @@
+"""
+Memory profiling for training runs, on CPU or GPU.
+
+`MemoryProfiler` records the peak host memory (RSS) and device memory of each phase of
+a run, eg. each epoch's training and validation, along with a timeline of samples.
+Host memory is sampled by a background thread, device memory uses PyTorch's peak
+memory stats, so no device memory is reported on CPU.
+
+`LayerMemoryHooks` records the size of the activations output by each layer of a
+model, eg. the outputs of WaveUNet's encoders, which are kept as skip connections, or
+of SceneNet's conv layers, which are its feature layers.
+
+    profiler = MemoryProfiler("cuda")
+    with profiler.phase("train"), LayerMemoryHooks(net) as layer_hooks:
+        train(net)
+
+    print(profiler.format_table())
+    print(layer_hooks.format_table())
+    profiler.save_timeline("memory.json")
+
+Trainer profiles training when `runtime.memory_profile` is set in config.yaml.
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import threading
+import contextlib
+
 import torch
+from torch import nn
+
+SAMPLE_INTERVAL_S = 0.05
+MB = 2 ** 20
+STATM_PATH = "/proc/self/statm"
+
+warned_peak_rss = False
+
+
+class MemoryProfiler:
+    """
+    Records peak host and device memory for named phases of a run.
+    A phase can be entered more than once, eg. for each training phase's epochs.
+    """
+
+    def __init__(self, device="cpu", sample_interval_s=SAMPLE_INTERVAL_S):
+        self.device = torch.device(device)
+        self.sample_interval_s = sample_interval_s
+        # A record for each time a phase was entered, in order.
+        self.phases = []
+        # Samples of (seconds since the first phase, phase name, host bytes, device bytes)
+        self.timeline = []
+        self.start_time = None
+        # Phases which are currently entered, innermost last.
+        self.active = []
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context which records the peak memory used while it's entered.
+        Phases can be nested, eg. a validation phase within an epoch.
+        """
+        if self.start_time is None:
+            self.start_time = time.time()
+
+        if self.device.type == "cuda":
+            # Peak stats are reset for each phase, so save the peaks of outer phases.
+            self._update_device_peaks()
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+        record = {
+            "name": name,
+            "start_s": time.time() - self.start_time,
+            "duration_s": None,
+            "host_start_bytes": get_rss_bytes(),
+            "host_peak_bytes": 0,
+            "device_start_bytes": self.get_device_bytes(),
+            "device_peak_bytes": None,
+        }
+        with self.lock:
+            self.phases.append(record)
+            self.active.append(record)
+
+        self._sample()
+        # Outer phases are already being sampled.
+        stop_event = threading.Event()
+        thread = None
+        if len(self.active) == 1:
+            thread = threading.Thread(target=self._sample_loop, args=(stop_event,))
+            thread.daemon = True
+            thread.start()
+
+        try:
+            yield record
+        finally:
+            stop_event.set()
+            if thread:
+                thread.join()
+
+            self._sample()
+            if self.device.type == "cuda":
+                self._update_device_peaks()
+
+            record["duration_s"] = time.time() - self.start_time - record["start_s"]
+            with self.lock:
+                self.active.remove(record)
+
+    def get_device_bytes(self):
+        if self.device.type != "cuda":
+            return None
+
+        return torch.cuda.memory_allocated(self.device)
+
+    def get_summary(self):
+        """
+        Returns the peak memory of each phase name, over every time it was entered,
+        as a dict of {name: {"count", "duration_s", "host_peak_mb", "device_peak_mb"}}.
+        """
+        summary = {}
+        for record in self.phases:
+            if record["duration_s"] is None:
+                continue
+
+            phase = summary.setdefault(
+                record["name"],
+                {"count": 0, "duration_s": 0, "host_peak_mb": 0, "device_peak_mb": None},
+            )
+            phase["count"] += 1
+            phase["duration_s"] += record["duration_s"]
+            host_mb = record["host_peak_bytes"] / MB
+            phase["host_peak_mb"] = max(phase["host_peak_mb"], host_mb)
+            if record["device_peak_bytes"] is not None:
+                device_mb = record["device_peak_bytes"] / MB
+                phase["device_peak_mb"] = max(phase["device_peak_mb"] or 0, device_mb)
+
+        return summary
+
+    def format_table(self):
+        """
+        Returns a table of peak memory by phase name.
+        """
+        row = "{: <32}{: >8}{: >12}{: >16}{: >16}"
+        lines = [
+            row.format("Phase", "Count", "Time (s)", "Host peak (MB)", "Device (MB)")
+        ]
+        for name, phase in self.get_summary().items():
+            device_mb = phase["device_peak_mb"]
+            lines.append(
+                row.format(
+                    name,
+                    phase["count"],
+                    f"{phase['duration_s']:.1f}",
+                    f"{phase['host_peak_mb']:.0f}",
+                    "-" if device_mb is None else f"{device_mb:.0f}",
+                )
+            )
+
+        return "\n".join(lines)
+
+    def save_timeline(self, path):
+        """
+        Save the phases and memory samples to a JSON file, eg. for plotting.
+        """
+        with self.lock:
+            timeline = [
+                {
+                    "time_s": time_s,
+                    "phase": name,
+                    "host_mb": host_bytes / MB,
+                    "device_mb": None if device_bytes is None else device_bytes / MB,
+                }
+                for time_s, name, host_bytes, device_bytes in self.timeline
+            ]
+
+        report = {
+            "device": str(self.device),
+            "summary": self.get_summary(),
+            "phases": self.phases,
+            "timeline": timeline,
+        }
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    def _sample_loop(self, stop_event):
+        while not stop_event.wait(self.sample_interval_s):
+            self._sample()
+
+    def _sample(self):
+        host_bytes = get_rss_bytes()
+        device_bytes = self.get_device_bytes()
+        with self.lock:
+            if not self.active:
+                return
+
+            for record in self.active:
+                record["host_peak_bytes"] = max(record["host_peak_bytes"], host_bytes)
+
+            time_s = time.time() - self.start_time
+            name = self.active[-1]["name"]
+            self.timeline.append((time_s, name, host_bytes, device_bytes))
+
+    def _update_device_peaks(self):
+        torch.cuda.synchronize(self.device)
+        peak_bytes = torch.cuda.max_memory_allocated(self.device)
+        for record in self.active:
+            record["device_peak_bytes"] = max(
+                record["device_peak_bytes"] or 0, peak_bytes
+            )
+
+
+class LayerMemoryHooks:
+    """
+    Context which hooks the layers of a model to record the size of their outputs.
+    Layers are the model's children, with the layers of a ModuleList listed separately,
+    eg. "encoders.0" to "encoders.11" for WaveUNet, or "conv_1" to "conv_15" for SceneNet.
+    """
+
+    def __init__(self, net):
+        self.layers = get_layers(net)
+        # Output size by layer name, for the last forward pass, and at most.
+        self.shapes = {}
+        self.last_bytes = {}
+        self.peak_bytes = {}
+        self.handles = []
+
+    def __enter__(self):
+        for name, layer in self.layers:
+            self.handles.append(layer.register_forward_hook(self._get_hook(name)))
 
+        return self
 
-class MemoryTracker:
-    def __init__(self):
-        self.memory = 0
+    def __exit__(self, *args):
+        for handle in self.handles:
+            handle.remove()
 
-    def track_change(self, s):
-        gbs = get_gpu_memory_gb()
-        change = gbs - self.memory
-        change_s = f"+{change:0.1f}" if change >= 0 else f"{change:0.1f}"
-        print(f"{change_s} {gbs:0.1f} GB {s}")
-        self.memory = gbs
+        self.handles = []
 
+    def get_summary(self):
+        """
+        Returns a list of (layer name, output shapes, last MB, peak MB), in model order.
+        """
+        return [
+            (
+                name,
+                self.shapes[name],
+                self.last_bytes[name] / MB,
+                self.peak_bytes[name] / MB,
+            )
+            for name, _ in self.layers
+            if name in self.shapes
+        ]
 
-tracker = MemoryTracker()
+    def format_table(self):
+        """
+        Returns a table of activation sizes by layer, with the total over all layers.
+        """
+        row = "{: <20}{: <36}{: >12}{: >12}"
+        lines = [row.format("Layer", "Output shape", "Last (MB)", "Peak (MB)")]
+        total_mb = 0
+        for name, shapes, last_mb, peak_mb in self.get_summary():
+            shape = ", ".join(str(list(s)) for s in shapes)
+            lines.append(row.format(name, shape, f"{last_mb:.2f}", f"{peak_mb:.2f}"))
+            total_mb += last_mb
 
+        lines.append(row.format("Total", "", f"{total_mb:.2f}", ""))
+        return "\n".join(lines)
 
-def print_gpu_memory_gb(s=""):
-    tracker.track_change(s)
-    # gbs = get_gpu_memory_gb()
-    # print(f"{gbs:0.1f} GB {s}")
+    def _get_hook(self, name):
+        def hook(module, inputs, outputs):
+            tensors = get_tensors(outputs)
+            num_bytes = sum(t.numel() * t.element_size() for t in tensors)
+            self.shapes[name] = [tuple(t.shape) for t in tensors]
+            self.last_bytes[name] = num_bytes
+            self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), num_bytes)
 
+        return hook
 
-def print_max_gpu_memory_gb(s=""):
-    gbs = get_max_gpu_memory_gb()
-    print(f"{gbs:0.1f} GB (max) {s}")
 
+def get_layers(net):
+    """
+    Returns a list of (name, layer) for the children of `net`, expanding ModuleLists.
+    """
+    layers = []
+    for name, child in net.named_children():
+        if isinstance(child, nn.ModuleList):
+            layers += [(f"{name}.{idx}", layer) for idx, layer in enumerate(child)]
+        else:
+            layers.append((name, child))
 
-def print_tensor_size(t, s=""):
-    gbs = get_tensor_size_gb(t)
-    print(f"{gbs:0.1f} GB {s}")
+    return layers
 
 
-def print_tensor_list_size(ts, s=""):
-    gbs = sum([get_tensor_size_gb(t) for t in ts])
-    print(f"{gbs:0.1f} GB {s}")
+def get_tensors(outputs):
+    if torch.is_tensor(outputs):
+        return [outputs]
 
+    if isinstance(outputs, (list, tuple)):
+        return [t for output in outputs for t in get_tensors(output)]
 
-def get_tensor_size_gb(t):
-    bs = t.element_size() * t.nelement()
-    return bs / 1024 ** 3
+    return []
 
 
-def get_gpu_memory_gb():
-    return torch.cuda.memory_allocated() / 1024 ** 3
+def get_rss_bytes():
+    """
+    Current resident memory of this process, on Linux. Without /proc, eg. on macOS,
+    this is the peak resident memory so far instead, which never goes down.
+    """
+    if os.path.exists(STATM_PATH):
+        with open(STATM_PATH, "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
 
+    global warned_peak_rss
+    if not warned_peak_rss:
+        print("Warning: /proc isn't available, host memory is the peak RSS so far")
+        warned_peak_rss = True
 
-def get_max_gpu_memory_gb():
-    return torch.cuda.max_memory_allocated() / 1024 ** 3
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports max RSS in bytes, Linux in KB.
+    return max_rss if sys.platform == "darwin" else max_rss * 2 ** 10
@@ -0,0 +1,88 @@
+"""
+Exponential moving average (EMA) of model weights.
+
+The averaged weights are usually a better model than the raw weights at the end of
+training, at no extra training cost. The average is updated with fused multi-tensor
+(`torch._foreach_*`) ops, so there is no Python loop over parameters on each step.
+"""
+import contextlib
+
+import torch
+
+EMA_DECAY = 0.999
+
+
+class WeightEMA:
+    """
+    Keeps an exponential moving average of a model's parameters.
+        update_every updates the average every N optimizer steps, with the decay
+            compounded, so the average covers the same number of steps.
+        use_stream runs updates on a separate CUDA stream, so they overlap with the
+            next forward and backward pass. Call `wait` before the next optimizer step.
+    Buffers, like batch norm running stats, are not averaged.
+    """
+
+    def __init__(self, net, decay=EMA_DECAY, update_every=1, use_stream=False):
+        self.decay = decay
+        self.update_every = update_every
+        self.num_steps = 0
+        self.params = [p for p in net.parameters() if p.requires_grad]
+        self.ema_params = [p.detach().clone() for p in self.params]
+        use_stream = use_stream and self.params and self.params[0].is_cuda
+        self.stream = torch.cuda.Stream() if use_stream else None
+
+    def update(self):
+        """
+        Update the average with the current weights, call after each optimizer step.
+        """
+        self.num_steps += 1
+        if self.num_steps % self.update_every:
+            return
+
+        decay = self.decay ** self.update_every
+        if self.stream:
+            self.stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(self.stream):
+                self._update(decay)
+        else:
+            self._update(decay)
+
+    def wait(self):
+        """
+        Wait for any update running on the EMA stream to finish.
+        """
+        if self.stream:
+            torch.cuda.current_stream().wait_stream(self.stream)
+
+    @contextlib.contextmanager
+    def average_weights(self):
+        """
+        Temporarily swap the averaged weights into the model, eg. for validation.
+        """
+        self.wait()
+        self._swap()
+        try:
+            yield
+        finally:
+            self._swap()
+
+    def state_dict(self):
+        return {"num_steps": self.num_steps, "ema_params": self.ema_params}
+
+    def load_state_dict(self, state_dict):
+        self.num_steps = state_dict["num_steps"]
+        with torch.no_grad():
+            torch._foreach_copy_(self.ema_params, state_dict["ema_params"])
+
+    def _update(self, decay):
+        with torch.no_grad():
+            params = [p.detach() for p in self.params]
+            torch._foreach_mul_(self.ema_params, decay)
+            torch._foreach_add_(self.ema_params, params, alpha=1 - decay)
+
+    def _swap(self):
+        """
+        Swap model and averaged weights without copying: only tensor storage is swapped.
+        """
+        for idx, param in enumerate(self.params):
+            param.data, self.ema_params[idx] = self.ema_params[idx], param.data
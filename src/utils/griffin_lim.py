@@ -0,0 +1,143 @@
+"""
+Batched Griffin-Lim phase reconstruction in PyTorch.
+
+A faster alternative to `spectral.log_mel_spec_to_audio`, which runs librosa's
+`mel_to_audio` on one clip at a time. This implementation:
+
+- inverts the mel filterbank with a cached pseudo-inverse matrix
+- runs a whole batch of spectrograms at once, on the GPU if available
+- uses the "fast Griffin-Lim" momentum update (Perraudin et al. 2013)
+- can warm-start from the phase of the noisy input, rather than random phase
+- stops early once the spectral convergence stops improving
+"""
+from functools import lru_cache
+
+import numpy as np
+import torch
+
+from src.utils import spectral
+
+N_ITER = 32
+MOMENTUM = 0.99
+TOLERANCE = 1e-3
+
+
+@lru_cache(maxsize=None)
+def get_mel_inverse(n_fft, n_mels, device="cpu"):
+    """
+    Get the pseudo-inverse of the mel filterbank, shape (1 + n_fft // 2, n_mels).
+    """
+    mel_basis = spectral.get_mel_basis(n_fft, n_mels)
+    mel_inverse = np.linalg.pinv(mel_basis).astype("float32")
+    return torch.tensor(mel_inverse, device=device)
+
+
+def log_mel_spec_to_audio(log_spec_t, spec_kwargs=spectral.LIBROSA_SPEC_KWARGS, **kwargs):
+    """
+    Estimate audio signals from a batch of log-mel spectrograms (batch, n_mels, frames).
+    Returns a tensor (batch, audio_length) and the number of iterations run.
+    See `griffin_lim` for keyword arguments.
+    """
+    mel_spec_t = torch.exp(log_spec_t)
+    mag_t = mel_to_magnitude(mel_spec_t, spec_kwargs)
+    return griffin_lim(mag_t, spec_kwargs, **kwargs)
+
+
+def mel_to_magnitude(mel_spec_t, spec_kwargs=spectral.LIBROSA_SPEC_KWARGS):
+    """
+    Approximate linear STFT magnitudes (batch, freqs, frames)
+    from mel spectrograms (batch, n_mels, frames).
+    """
+    n_mels = mel_spec_t.shape[1]
+    mel_inverse = get_mel_inverse(spec_kwargs["n_fft"], n_mels, str(mel_spec_t.device))
+    power_t = torch.matmul(mel_inverse, mel_spec_t).clamp(min=0)
+    return power_t ** (1.0 / spec_kwargs["power"])
+
+
+def griffin_lim(
+    mag_t,
+    spec_kwargs=spectral.LIBROSA_SPEC_KWARGS,
+    n_iter=N_ITER,
+    momentum=MOMENTUM,
+    init_audio=None,
+    tol=TOLERANCE,
+    length=None,
+):
+    """
+    Estimate audio signals from a batch of STFT magnitudes (batch, freqs, frames).
+        init_audio is an optional tensor (batch, audio_length), eg. the noisy input,
+            whose phase is used as the starting point, instead of random phase.
+        tol stops iterating once the spectral convergence of every sample in the batch
+            improves by less than this amount. Set to 0 to always run n_iter iterations.
+    Returns a tensor (batch, audio_length) and the number of iterations run.
+    """
+    if init_audio is not None and length is None:
+        length = init_audio.shape[-1]
+
+    stft, istft = _get_stft_fns(spec_kwargs, mag_t.device, length)
+    if init_audio is None:
+        phase_t = 2 * np.pi * torch.rand_like(mag_t)
+        angles_t = torch.polar(torch.ones_like(mag_t), phase_t)
+    else:
+        init_spec_t = stft(init_audio.to(mag_t.device))
+        assert init_spec_t.shape == mag_t.shape, "Initial audio has the wrong length"
+        angles_t = init_spec_t / init_spec_t.abs().clamp(min=1e-16)
+
+    mag_norm_t = torch.linalg.norm(mag_t, dim=(1, 2)).clamp(min=1e-16)
+    prev_rebuilt_t = torch.zeros_like(angles_t)
+    prev_convergence_t = None
+    num_iters = 0
+    for _ in range(n_iter):
+        num_iters += 1
+        # Project onto the set of consistent spectrograms
+        rebuilt_t = stft(istft(mag_t * angles_t))
+        # Apply momentum, then keep only the phase
+        angles_t = rebuilt_t - (momentum / (1 + momentum)) * prev_rebuilt_t
+        angles_t = angles_t / angles_t.abs().clamp(min=1e-16)
+        prev_rebuilt_t = rebuilt_t
+
+        # Check for convergence
+        error_t = torch.linalg.norm(rebuilt_t.abs() - mag_t, dim=(1, 2))
+        convergence_t = error_t / mag_norm_t
+        if prev_convergence_t is not None and tol:
+            if torch.all(prev_convergence_t - convergence_t < tol):
+                break
+
+        prev_convergence_t = convergence_t
+
+    audio_t = istft(mag_t * angles_t)
+    return audio_t, num_iters
+
+
+def spectral_convergence(audio_t, mag_t, spec_kwargs=spectral.LIBROSA_SPEC_KWARGS):
+    """
+    Spectral convergence of a batch of audio signals against target magnitudes.
+    Returns a tensor (batch,), where 0 is a perfect match.
+    """
+    stft, _ = _get_stft_fns(spec_kwargs, mag_t.device, None)
+    error_t = torch.linalg.norm(stft(audio_t).abs() - mag_t, dim=(1, 2))
+    return error_t / torch.linalg.norm(mag_t, dim=(1, 2)).clamp(min=1e-16)
+
+
+def _get_stft_fns(spec_kwargs, device, length):
+    """
+    Build torch STFT / ISTFT functions which match librosa's settings.
+    """
+    assert spec_kwargs["window"] == "hann"
+    window_t = torch.hann_window(spec_kwargs["win_length"], device=device)
+    stft_kwargs = {
+        "n_fft": spec_kwargs["n_fft"],
+        "hop_length": spec_kwargs["hop_length"],
+        "win_length": spec_kwargs["win_length"],
+        "window": window_t,
+        "center": spec_kwargs["center"],
+    }
+
+    def stft(audio_t):
+        pad_mode = spec_kwargs["pad_mode"]
+        return torch.stft(audio_t, pad_mode=pad_mode, return_complex=True, **stft_kwargs)
+
+    def istft(spec_t):
+        return torch.istft(spec_t, length=length, **stft_kwargs)
+
+    return stft, istft
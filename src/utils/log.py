@@ -1,6 +1,3 @@
-import wandb
-
-
 def log_training_info(info, use_wandb=False):
     print("")
     for k, v in info.items():
@@ -8,4 +5,6 @@ def log_training_info(info, use_wandb=False):
         print(s)
 
     if use_wandb:
+        import wandb
+
         wandb.log(info)
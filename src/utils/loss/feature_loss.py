@@ -13,12 +13,22 @@ class AudioFeatureLoss:
     def __init__(self, loss_net, use_cuda=True):
         """
         Store loss net for use in calculating feature vectors.
-        Loss net must accept a tensor (batch_size, 1, audio_length)
-        And expose property `feature_layers` - which returns a list of weight vectors.
+        Loss net must accept a tensor (batch_size, 1, audio_length),
+        and return a list of feature tensors, eg. `SceneNet.get_feature_extractor()`.
+        Loss nets in the older feature mode, which return nothing and expose
+        a `feature_layers` list instead, are also supported.
         """
         self.loss_net = loss_net
         self.use_cuda = use_cuda
 
+    def get_features(self, input_t):
+        features = self.loss_net(input_t)
+        if features is None:
+            # Loss net is in feature mode.
+            features = self.loss_net.feature_layers
+
+        return features
+
     def get_feature_loss(self, predicted_audio, target_audio):
         assert predicted_audio.shape == target_audio.shape
         batch_size = predicted_audio.shape[0]
@@ -26,15 +36,15 @@ class AudioFeatureLoss:
         target_input = target_audio.view(batch_size, 1, -1)
 
         # Make predictions, get feature layers.
-        self.loss_net(predict_input)
-        pred_feature_layers = self.loss_net.feature_layers
-
-        self.loss_net(target_input)
-        target_feature_layers = self.loss_net.feature_layers
+        pred_feature_layers = self.get_features(predict_input)
+        # Target features don't need gradients, so don't keep their activations.
+        with torch.no_grad():
+            target_feature_layers = self.get_features(target_input)
 
         # Sum up l1 losses over all feature layers.
-        loss = torch.tensor([0.0], requires_grad=True)
-        loss = loss.cuda() if self.use_cuda else loss
+        # The sum doesn't start from a leaf tensor which requires grad,
+        # so that this can run inside a compiled training step.
+        loss = torch.zeros(1, device=predicted_audio.device)
         for idx in range(len(pred_feature_layers)):
             predicted_feature = pred_feature_layers[idx]
             target_feature = target_feature_layers[idx]
@@ -6,14 +6,36 @@ class LeastSquaresLoss:
     Least squares loss for GAN training.
     """
 
+    # The generator loss only scores fake audio, so real audio isn't run.
+    generator_uses_real = False
+
     def __init__(self, disc_net):
         self.disc_net = disc_net
 
     def for_generator(self, real_audio, fake_audio):
         disc_fake = self.disc_net(fake_audio)
-        return torch.mean((disc_fake - 1) ** 2)
+        return self.get_generator_loss(None, disc_fake)
 
     def for_discriminator(self, real_audio, fake_audio):
-        disc_real = self.disc_net(real_audio)
-        disc_fake = self.disc_net(fake_audio)
+        disc_real, disc_fake = run_discriminator(self.disc_net, real_audio, fake_audio)
+        return self.get_discriminator_loss(disc_real, disc_fake)
+
+    def get_generator_loss(self, disc_real, disc_fake):
+        return torch.mean((disc_fake - 1) ** 2)
+
+    def get_discriminator_loss(self, disc_real, disc_fake):
         return torch.mean((disc_real - 1) ** 2) + torch.mean(disc_fake ** 2)
+
+
+def run_discriminator(disc_net, real_audio, fake_audio):
+    """
+    Run the discriminator on real and fake audio in a single pass, by concatenating
+    them along the batch dimension. Returns the outputs for real and fake audio.
+    The discriminator mustn't mix samples within a batch, eg. with batch norm.
+    """
+    batch_size = real_audio.shape[0]
+    audio = torch.cat(
+        [real_audio.reshape(batch_size, 1, -1), fake_audio.reshape(batch_size, 1, -1)]
+    )
+    disc_real, disc_fake = torch.split(disc_net(audio), batch_size)
+    return disc_real, disc_fake
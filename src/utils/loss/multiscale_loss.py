@@ -6,26 +6,87 @@ class MultiScaleLoss:
     """
     Applies multi-scale loss function, as done in MelGAN
     Inspired by https://github.com/seungwonpark/melgan/blob/master/model/multiscale.py
+
+    The discriminator scores the audio at each scale: as is, then downsampled by 2, 4...
+    Real and fake audio are concatenated along the batch dimension and downsampled
+    together, so each scale is a single discriminator pass, rather than one for real
+    and one for fake audio. The discriminators mustn't mix samples within a batch,
+    eg. with batch norm.
+        loss_fn is a GAN loss which scores discriminator outputs, eg. LeastSquaresLoss
+        disc_nets is a discriminator for each scale, by default the loss_fn's
+            discriminator is used at every scale
+        concurrent runs each scale's discriminator on its own CUDA stream, so that the
+            smaller scales can overlap on the GPU. On CPU, scales run in turn.
     """
 
-    def __init__(self, loss_fn, num_scales=2):
+    def __init__(self, loss_fn, num_scales=2, disc_nets=None, concurrent=False):
         self.loss_fn = loss_fn
         self.downsample = nn.AvgPool1d(kernel_size=4, stride=2, padding=2)
         self.num_scales = num_scales
+        self.disc_nets = disc_nets or [loss_fn.disc_net] * (num_scales + 1)
+        assert len(self.disc_nets) == num_scales + 1, "Need a discriminator per scale"
+        self.concurrent = concurrent
+        self.streams = None
 
     def for_generator(self, real_audio, fake_audio):
-        return self._get_loss(real_audio, fake_audio, self.loss_fn.for_generator)
+        return self._get_loss(
+            real_audio,
+            fake_audio,
+            self.loss_fn.get_generator_loss,
+            use_real=self.loss_fn.generator_uses_real,
+        )
 
     def for_discriminator(self, real_audio, fake_audio):
-        return self._get_loss(real_audio, fake_audio, self.loss_fn.for_discriminator)
+        return self._get_loss(
+            real_audio, fake_audio, self.loss_fn.get_discriminator_loss, use_real=True
+        )
+
+    def _get_loss(self, real_audio, fake_audio, get_loss, use_real):
+        batch_size = fake_audio.shape[0]
+        # A batch of real then fake audio, or just fake audio.
+        audio = [fake_audio.reshape(batch_size, 1, -1)]
+        if use_real:
+            audio.insert(0, real_audio.reshape(batch_size, 1, -1))
+
+        scales = [torch.cat(audio)]
+        for _ in range(self.num_scales):
+            scales.append(self.downsample(scales[-1]))
 
-    def _get_loss(self, real_audio, fake_audio, loss_fn):
         loss = 0
-        real = real_audio
-        fake = fake_audio
-        for _ in range(self.num_scales + 1):
-            loss += loss_fn(real, fake)
-            real = self.downsample(real)
-            fake = self.downsample(fake)
+        for disc_t in self._run_discriminators(scales):
+            if use_real:
+                disc_real, disc_fake = torch.split(disc_t, batch_size)
+            else:
+                disc_real, disc_fake = None, disc_t
+
+            loss += get_loss(disc_real, disc_fake)
 
         return loss / (self.num_scales + 1)
+
+    def _run_discriminators(self, scales):
+        """
+        Returns each scale's discriminator output.
+        """
+        if not (self.concurrent and scales[0].is_cuda):
+            return [disc_net(t) for disc_net, t in zip(self.disc_nets, scales)]
+
+        if self.streams is None:
+            self.streams = [torch.cuda.Stream(scales[0].device) for _ in scales]
+
+        # Each stream waits for its input, then the current stream waits for them all.
+        # Tensors are marked as used on the other stream, so they aren't freed early.
+        current_stream = torch.cuda.current_stream(scales[0].device)
+        outputs = []
+        for disc_net, input_t, stream in zip(self.disc_nets, scales, self.streams):
+            stream.wait_stream(current_stream)
+            input_t.record_stream(stream)
+            with torch.cuda.stream(stream):
+                output_t = disc_net(input_t)
+
+            output_t.record_stream(current_stream)
+            outputs.append(output_t)
+
+        for stream in self.streams:
+            current_stream.wait_stream(stream)
+
+        return outputs
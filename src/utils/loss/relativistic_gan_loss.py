@@ -1,6 +1,8 @@
 import torch
 from torch import nn
 
+from .least_squares_loss import run_discriminator
+
 
 class RelativisticAverageStandardGANLoss:
     """
@@ -10,28 +12,34 @@ class RelativisticAverageStandardGANLoss:
     I don't really get it, this is script kiddie territory ;)
     """
 
+    generator_uses_real = True
+
     def __init__(self, disc_net):
         self.disc_net = disc_net
         self.loss_fn = nn.BCEWithLogitsLoss()
 
     def for_generator(self, real_audio, fake_audio):
-        batch_size = real_audio.shape[0]
+        disc_real, disc_fake = run_discriminator(self.disc_net, real_audio, fake_audio)
+        return self.get_generator_loss(disc_real, disc_fake)
+
+    def for_discriminator(self, real_audio, fake_audio):
+        disc_real, disc_fake = run_discriminator(self.disc_net, real_audio, fake_audio)
+        return self.get_discriminator_loss(disc_real, disc_fake)
+
+    def get_generator_loss(self, disc_real, disc_fake):
+        batch_size = disc_real.shape[0]
         zeros = torch.zeros([batch_size, 1], dtype=torch.float32).cuda()
         ones = torch.ones([batch_size, 1], dtype=torch.float32).cuda()
-        disc_real = self.disc_net(real_audio)
-        disc_fake = self.disc_net(fake_audio)
         mean_disc_fake = torch.mean(disc_fake)
         mean_disc_real = torch.mean(disc_real)
         a = self.loss_fn(disc_real - mean_disc_fake, zeros)
         b = self.loss_fn(disc_fake - mean_disc_real, ones)
         return a + b
 
-    def for_discriminator(self, real_audio, fake_audio):
-        batch_size = real_audio.shape[0]
+    def get_discriminator_loss(self, disc_real, disc_fake):
+        batch_size = disc_real.shape[0]
         zeros = torch.zeros([batch_size, 1], dtype=torch.float32).cuda()
         ones = torch.ones([batch_size, 1], dtype=torch.float32).cuda()
-        disc_real = self.disc_net(real_audio)
-        disc_fake = self.disc_net(fake_audio)
         mean_disc_fake = torch.mean(disc_fake)
         mean_disc_real = torch.mean(disc_real)
         a = self.loss_fn(disc_real - mean_disc_fake, ones)
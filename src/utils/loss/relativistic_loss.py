@@ -1,5 +1,7 @@
 import torch
 
+from .least_squares_loss import run_discriminator
+
 
 class RelativisticLoss:
     """
@@ -9,25 +11,25 @@ class RelativisticLoss:
     I don't really get it, this is script kiddie territory ;)
     """
 
+    generator_uses_real = True
+
     def __init__(self, disc_net):
         self.disc_net = disc_net
 
     def for_generator(self, real_audio, fake_audio):
-        disc_real = self.disc_net(real_audio)
-        disc_fake = self.disc_net(fake_audio)
-        return self._relativistic_least_square_loss_for_gen(disc_real, disc_fake)
+        disc_real, disc_fake = run_discriminator(self.disc_net, real_audio, fake_audio)
+        return self.get_generator_loss(disc_real, disc_fake)
 
     def for_discriminator(self, real_audio, fake_audio):
-        disc_real = self.disc_net(real_audio)
-        disc_fake = self.disc_net(fake_audio)
-        return self._relativistic_least_square_loss_for_disc(disc_real, disc_fake)
+        disc_real, disc_fake = run_discriminator(self.disc_net, real_audio, fake_audio)
+        return self.get_discriminator_loss(disc_real, disc_fake)
 
-    def _relativistic_least_square_loss_for_gen(self, disc_real, disc_fake):
+    def get_generator_loss(self, disc_real, disc_fake):
         a = torch.mean((disc_real - torch.mean(disc_fake) + 1) ** 2)
         b = torch.mean((disc_fake - torch.mean(disc_real) - 1) ** 2)
         return a + b
 
-    def _relativistic_least_square_loss_for_disc(self, disc_real, disc_fake):
+    def get_discriminator_loss(self, disc_real, disc_fake):
         a = torch.mean((disc_real - torch.mean(disc_fake) - 1) ** 2)
         b = torch.mean((disc_fake - torch.mean(disc_real) + 1) ** 2)
         return a + b
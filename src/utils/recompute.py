@@ -0,0 +1,122 @@
+"""
+Selective activation recomputation (gradient checkpointing).
+
+Checkpointing a layer frees its activations after the forward pass and recomputes them
+in the backward pass, trading compute for memory. Rather than checkpointing every layer,
+a `RecomputePolicy` picks just enough layers to fit the activations of a training batch
+into a memory budget. The size of each layer's activations is measured with a single
+sample, then scaled up to the batch size.
+"""
+import torch
+from torch.utils.checkpoint import checkpoint
+
+
+class RecomputePolicy:
+    """
+    Chooses which layers of a model to recompute in the backward pass.
+        memory_budget is the most memory, in bytes, to spend on activations saved for the
+            backward pass. None turns recomputation off, 0 recomputes every layer.
+    """
+
+    def __init__(self, memory_budget=None):
+        self.memory_budget = memory_budget
+
+    def plan(self, net, layers, sample_input, batch_size):
+        """
+        Returns the set of indices of `layers` which should be recomputed,
+        for training `net` on batches of `batch_size` samples like `sample_input`.
+        """
+        if self.memory_budget is None:
+            return set()
+
+        if self.memory_budget == 0:
+            return set(range(len(layers)))
+
+        sizes = [
+            (batch_size * saved, batch_size * inputs)
+            for saved, inputs in measure_layers(net, layers, sample_input)
+        ]
+        total_bytes = sum(saved for saved, _ in sizes)
+        # Recompute the layers which free the most memory first.
+        # A recomputed layer still keeps its input for the backward pass.
+        savings = [(saved - inputs, idx) for idx, (saved, inputs) in enumerate(sizes)]
+        recompute = set()
+        for saving, idx in sorted(savings, reverse=True):
+            if total_bytes <= self.memory_budget or saving <= 0:
+                break
+
+            recompute.add(idx)
+            total_bytes -= saving
+
+        print(
+            f"Recomputing {len(recompute)} / {len(layers)} layers, "
+            f"{total_bytes / 2 ** 30:.2f}GB of activations for batch size {batch_size}"
+        )
+        return recompute
+
+
+def measure_layers(net, layers, sample_input):
+    """
+    Measure the memory used by each layer for a forward pass of a single sample.
+    Returns a list of (bytes saved for the backward pass, bytes of layer input).
+    """
+    sizes = [[0, 0] for _ in layers]
+    current = [None]
+
+    def pre_hook(idx):
+        def hook(module, inputs):
+            current[0] = idx
+            sizes[idx][1] = sum(get_bytes(t) for t in inputs if torch.is_tensor(t))
+
+        return hook
+
+    def pack(tensor):
+        # Parameters aren't freed by recomputation, so only count activations.
+        if current[0] is not None and not isinstance(tensor, torch.nn.Parameter):
+            sizes[current[0]][0] += get_bytes(tensor)
+
+        return tensor
+
+    def post_hook(module, inputs, outputs):
+        current[0] = None
+
+    handles = []
+    for idx, layer in enumerate(layers):
+        handles.append(layer.register_forward_pre_hook(pre_hook(idx)))
+        handles.append(layer.register_forward_hook(post_hook))
+
+    # Run without recomputation, so that every layer's activations are saved.
+    # Buffers, like batch norm running stats, are restored afterwards.
+    recompute_layers = net.recompute_layers
+    net.recompute_layers = set()
+    buffers = [buffer.clone() for buffer in net.buffers()]
+    sample_input = sample_input.detach().requires_grad_(True)
+    try:
+        with torch.enable_grad(), torch.autograd.graph.saved_tensors_hooks(
+            pack, lambda t: t
+        ):
+            net(sample_input)
+    finally:
+        net.recompute_layers = recompute_layers
+        with torch.no_grad():
+            for buffer, saved_buffer in zip(net.buffers(), buffers):
+                buffer.copy_(saved_buffer)
+
+        for handle in handles:
+            handle.remove()
+
+    return [tuple(size) for size in sizes]
+
+
+def run_layer(layer, input_t, recompute):
+    """
+    Run a layer, recomputing its activations in the backward pass if `recompute` is set.
+    """
+    if recompute and torch.is_grad_enabled():
+        return checkpoint(layer, input_t, use_reentrant=False)
+
+    return layer(input_t)
+
+
+def get_bytes(tensor):
+    return tensor.numel() * tensor.element_size()
@@ -1,8 +1,10 @@
+from functools import lru_cache
+
 import torch
 import numpy as np
-from scipy import signal
-from librosa.feature import melspectrogram
-from librosa.feature.inverse import mel_to_audio
+
+# librosa and scipy.signal take over a second to import,
+# so they're imported by the functions which use them.
 
 SAMPLING_RATE = 16000
 HOP_MS = 16
@@ -17,6 +19,8 @@ def audio_to_spec(audio_arr, window_ms=WIN_MS, hop_ms=HOP_MS):
     channel 0 is frequency magnitude
     channel 1 is phase
     """
+    from scipy import signal
+
     num_segment = ms_to_steps(window_ms)
     num_overlap = num_segment - ms_to_steps(hop_ms)
     _, _, spectral_frames = signal.stft(
@@ -31,6 +35,8 @@ def spec_to_audio(spectral_frames, window_ms=WIN_MS, hop_ms=HOP_MS):
     """
     Reverse audio_to_spec
     """
+    from scipy import signal
+
     mag, phase = spectral_frames
     spectral_frames = mag + 1j * phase
     num_segment = ms_to_steps(window_ms)
@@ -48,11 +54,24 @@ def ms_to_steps(ms):
     return int((1e-3 * ms) * SAMPLING_RATE)
 
 
+@lru_cache(maxsize=None)
+def get_mel_basis(n_fft, n_mels):
+    """
+    Get mel filterbank matrix with shape (n_mels, 1 + n_fft // 2).
+    Cached, because it is slow to build and used on every frame when streaming.
+    """
+    from librosa.filters import mel as mel_filters
+
+    return mel_filters(sr=SAMPLING_RATE, n_fft=n_fft, n_mels=n_mels)
+
+
 def audio_to_log_mel_spec(audio_arr):
     """
     Get mel-filtered power spectrogram from audio signal. 
     """
-    spec = melspectrogram(audio_arr, n_mels=4 * WIN_MS, **LIBROSA_SPEC_KWARGS)
+    from librosa.feature import melspectrogram
+
+    spec = melspectrogram(y=audio_arr, n_mels=4 * WIN_MS, **LIBROSA_SPEC_KWARGS)
     return np.log(clamp(spec, 1e-10))
 
 
@@ -60,9 +79,12 @@ def log_mel_spec_to_audio(log_spec):
     """
     Estimate audio signal from log-mel spectrogram
     using Griffin-Lim algorithm.
+    See `src.utils.griffin_lim` for a faster, batched version.
     """
+    from librosa.feature.inverse import mel_to_audio
+
     spec = np.exp(log_spec)
-    return mel_to_audio(spec, n_iter=32, **LIBROSA_SPEC_KWARGS)
+    return mel_to_audio(M=spec, n_iter=32, **LIBROSA_SPEC_KWARGS)
 
 
 def clamp(arr, floor):
@@ -77,29 +99,34 @@ def audio_to_waveglow_spec(audio_arr):
     """
     Convert audio to log-magnitude mel-spectrogram compatible with WaveGlow vocoder.
     """
-    mel_spec = melspectrogram(audio_arr, **WAVEGLOW_SPEC_KWARGS)
+    from librosa.feature import melspectrogram
+
+    mel_spec = melspectrogram(y=audio_arr, **WAVEGLOW_SPEC_KWARGS)
     return np.log(clamp(mel_spec, 1e-10))
 
 
 def waveglow_spec_to_audio(spec_t, waveglow):
+    """
+    Convert a batch of WaveGlow spectrograms (batch, bins, frames)
+    into an array of audio (batch, samples).
+    """
     assert len(spec_t.shape) == 3, "Incorrect shape"
-    assert spec_t.shape[0] == 1, "Only one sample at a time"
     assert spec_t.shape[1] == WAVEGLOW_BINS, "Incorrect number of bins"
     with torch.no_grad():
         audio_t = waveglow.infer(spec_t)
 
-    return audio_t[0].data.cpu().numpy()
+    return audio_t.data.cpu().numpy()
 
 
 def load_waveglow(use_cuda=False):
     """
     Load WaveGlow vocoder model
     https://github.com/NVIDIA/waveglow
+    The model is shared across the process, and cached on disk after the first download.
     """
-    waveglow = torch.hub.load(WAVEGLOW_GITHUB, WAVEGLOW_MODEL_NAME)
-    waveglow = waveglow.remove_weightnorm(waveglow)
-    waveglow = waveglow.cuda() if use_cuda else waveglow.cpu()
-    return waveglow.eval()
+    from src.utils.vocoder import registry, WAVEGLOW
+
+    return registry.get(WAVEGLOW, use_cuda=use_cuda)
 
 
 LIBROSA_SPEC_KWARGS = {
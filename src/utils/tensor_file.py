@@ -0,0 +1,217 @@
+"""
+Flat tensor checkpoint files, using the safetensors layout:
+
+    8 bytes         little-endian length N of the header
+    N bytes         JSON header: {name: {"dtype", "shape", "data_offsets"}, "__metadata__"}
+    rest of file    raw tensor data
+
+Unlike pickled `full.ckpt` files, loading doesn't depend on module import paths and
+doesn't deserialize anything up front: the file is memory-mapped and each tensor is a
+view onto the mapping, so only the pages which are used get read from disk.
+Tensors are copied straight from the mapping onto the target device.
+
+The model class and its constructor kwargs are stored in the metadata, so that a model
+can be built without the original checkpoint. To convert an existing checkpoint:
+
+    python -m src.utils.tensor_file wave-u-net-fl-up-learning-rate-1575794210.full.ckpt
+"""
+import os
+import json
+import struct
+import tempfile
+import importlib
+import contextlib
+
+import click
+import numpy as np
+import torch
+
+HEADER_LENGTH_BYTES = 8
+ALIGN_BYTES = 8
+SUFFIX = "safetensors"
+
+DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+DTYPE_NAMES = {dtype: name for name, dtype in DTYPES.items()}
+# numpy has no bfloat16, so these are mapped as int16 and then viewed as bfloat16
+NUMPY_DTYPES = {torch.bfloat16: np.int16}
+# Weight initialisation functions which are skipped when building a model to load into.
+INIT_FNS = [
+    "uniform_",
+    "normal_",
+    "trunc_normal_",
+    "constant_",
+    "ones_",
+    "zeros_",
+    "xavier_uniform_",
+    "xavier_normal_",
+    "kaiming_uniform_",
+    "kaiming_normal_",
+    "orthogonal_",
+]
+
+
+def save(tensors, path, metadata=None):
+    """
+    Write a dict of tensors to a flat tensor file.
+        metadata is an optional dict of strings
+    """
+    header = {}
+    offset = 0
+    arrays = []
+    for name, tensor in tensors.items():
+        tensor = tensor.detach().cpu().contiguous()
+        num_bytes = tensor.numel() * tensor.element_size()
+        header[name] = {
+            "dtype": DTYPE_NAMES[tensor.dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [offset, offset + num_bytes],
+        }
+        arrays.append(tensor.view(-1).view(torch.uint8).numpy())
+        offset += num_bytes
+
+    if metadata:
+        header["__metadata__"] = metadata
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    # Pad the header so that the tensor data is aligned.
+    padding = -(HEADER_LENGTH_BYTES + len(header_bytes)) % ALIGN_BYTES
+    header_bytes += b" " * padding
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for array in arrays:
+            f.write(array.tobytes())
+
+
+class TensorFile:
+    """
+    Lazily loads tensors from a memory-mapped flat tensor file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header_length = struct.unpack("<Q", f.read(HEADER_LENGTH_BYTES))[0]
+            header = json.loads(f.read(header_length))
+
+        self.metadata = header.pop("__metadata__", {})
+        self.header = header
+        self.data_start = HEADER_LENGTH_BYTES + header_length
+        # Copy-on-write mapping, so tensors are writable without changing the file.
+        self.buffer = np.memmap(path, dtype=np.uint8, mode="c")
+
+    def keys(self):
+        return list(self.header.keys())
+
+    def get(self, name, device="cpu"):
+        """
+        Get a tensor by name. CPU tensors are views onto the file mapping,
+        tensors on other devices are copied directly from the mapping.
+        """
+        info = self.header[name]
+        dtype = DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        data = self.buffer[self.data_start + start : self.data_start + end]
+        numpy_dtype = NUMPY_DTYPES.get(dtype)
+        if numpy_dtype:
+            tensor = torch.from_numpy(data.view(numpy_dtype)).view(dtype)
+        else:
+            tensor = torch.from_numpy(data).view(dtype)
+
+        tensor = tensor.view(info["shape"])
+        return tensor if str(device) == "cpu" else tensor.to(device, non_blocking=True)
+
+    def get_state_dict(self, device="cpu"):
+        return {name: self.get(name, device) for name in self.keys()}
+
+
+def save_module(net, path, kwargs=None):
+    """
+    Save a model's state dict, along with its class and constructor kwargs.
+    """
+    net_class = type(net)
+    metadata = {
+        "class": f"{net_class.__module__}:{net_class.__qualname__}",
+        "kwargs": json.dumps(kwargs or {}),
+    }
+    save(net.state_dict(), path, metadata)
+
+
+def load_module(path, device="cpu", net=None):
+    """
+    Load a model from a flat tensor file. If no model is given, a new one is built
+    from the class and kwargs stored in the file.
+    """
+    tensor_file = TensorFile(path)
+    state_dict = tensor_file.get_state_dict(device)
+    if net:
+        net.load_state_dict(state_dict)
+        return net.to(device)
+
+    module_name, class_name = tensor_file.metadata["class"].split(":")
+    net_class = getattr(importlib.import_module(module_name), class_name)
+    kwargs = json.loads(tensor_file.metadata["kwargs"])
+    # Build the model without initialising its weights,
+    # then use the loaded tensors as its parameters.
+    with skip_init():
+        net = net_class(**kwargs)
+
+    net.load_state_dict(state_dict, assign=True)
+    return net.to(device)
+
+
+@contextlib.contextmanager
+def skip_init():
+    """
+    Turn torch.nn.init functions into no-ops, for building models which are about to
+    have their weights replaced.
+    """
+    init_fns = {name: getattr(torch.nn.init, name) for name in INIT_FNS}
+    for name in INIT_FNS:
+        setattr(torch.nn.init, name, _skip_init_fn)
+
+    try:
+        yield
+    finally:
+        for name, init_fn in init_fns.items():
+            setattr(torch.nn.init, name, init_fn)
+
+
+def _skip_init_fn(tensor, *args, **kwargs):
+    return tensor
+
+
+@click.command()
+@click.argument("checkpoint_filename")
+@click.option("--kwargs", default="{}", help="Model constructor kwargs, as JSON")
+def convert_cli(checkpoint_filename, kwargs):
+    """
+    Convert a full.ckpt checkpoint into a flat tensor checkpoint in the checkpoint store.
+    """
+    from src.utils import checkpoint
+
+    assert checkpoint_filename.endswith("full.ckpt"), "Expected a full.ckpt checkpoint"
+    net = checkpoint.load(checkpoint_filename, use_cuda=False)
+    new_filename = checkpoint_filename.replace("full.ckpt", SUFFIX)
+    tmp_dir = tempfile.mkdtemp(dir=checkpoint.CHECKPOINT_DIR)
+    tmp_path = os.path.join(tmp_dir, new_filename)
+    save_module(net, tmp_path, json.loads(kwargs))
+    checkpoint.store.put(tmp_path, new_filename)
+    os.rmdir(tmp_dir)
+    checkpoint.store.upload(new_filename)
+    print(f"Saved {new_filename}")
+
+
+if __name__ == "__main__":
+    convert_cli()
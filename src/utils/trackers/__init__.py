@@ -1,3 +1,5 @@
-from .accuracy_tracker import AccuracyTracker
+from .accuracy_tracker import AccuracyTracker, HammingLossTracker
+from .confusion_matrix import ConfusionMatrixTracker, MultiLabelConfusionTracker
 from .moving_average import MovingAverage
 from .progress_bar import ProgressBar
+from .early_stopping import EarlyStopping
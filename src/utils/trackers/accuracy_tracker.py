@@ -16,7 +16,8 @@ class AccuracyTracker:
         """
         predicted_labels = predictions.argmax(dim=1)
         successful_predictions = predicted_labels == labels
-        self.num_success += successful_predictions.sum().item()
+        # Summed on the device, so there's no sync until the value is read.
+        self.num_success = self.num_success + successful_predictions.sum()
 
     @property
     def value(self):
@@ -24,7 +25,7 @@ class AccuracyTracker:
         0 is worst - none of the samples were correctly classified
         1 is best - all of of the samples were correctly classified
         """
-        return self.num_success / float(self.num_total)
+        return float(self.num_success) / float(self.num_total)
 
 
 class HammingLossTracker:
@@ -46,12 +47,9 @@ class HammingLossTracker:
         Labels is a tensor (batch_size, num_classes) containing a 1 for present and 0 for absent
         """
         # Convert probabilities into predictions
-        preds = predictions.clone()
-        threshold = 0.5
-        preds[preds >= threshold] = 1
-        preds[preds < threshold] = 0
-        failed_predictions = preds != labels
-        self.num_wrong += failed_predictions.sum().item()
+        preds = predictions >= 0.5
+        failed_predictions = preds != labels.bool()
+        self.num_wrong = self.num_wrong + failed_predictions.sum()
 
     @property
     def value(self):
@@ -59,4 +57,4 @@ class HammingLossTracker:
         0 is best - every class, for every label was correct
         1 is worst - every class, for every label was wrong
         """
-        return self.num_wrong / float(self.num_total)
+        return float(self.num_wrong) / float(self.num_total)
@@ -0,0 +1,151 @@
+"""
+Classification metrics from confusion matrices, which are kept on the model's device.
+
+Updating a tracker only queues device ops, so training never waits on the GPU for a
+metric. The counts are copied to the host once, when the metrics are read at the end
+of an epoch. In distributed training, the counts are summed over every process first.
+"""
+import torch
+import torch.distributed as dist
+
+
+class ConfusionTracker:
+    """
+    Base class for trackers which count predictions into a tensor of `shape`.
+    """
+
+    def __init__(self, shape, device="cpu"):
+        """
+        device must be the device of the predictions, so that every process has counts
+        to sum in distributed training, even if it saw no batches.
+        """
+        self.shape = shape
+        self.device = torch.device(device)
+        self.reset()
+
+    def reset(self):
+        self.counts = torch.zeros(self.shape, dtype=torch.long, device=self.device)
+        self.synced_counts = None
+
+    def add_counts(self, indices):
+        """
+        Add one to the flat index of each count in `indices`.
+        """
+        ones = torch.ones_like(indices, dtype=torch.long)
+        self.counts.view(-1).scatter_add_(0, indices.view(-1), ones.view(-1))
+        self.synced_counts = None
+
+    def sync(self):
+        """
+        Returns the counts on the host, summed over all processes if distributed.
+        """
+        if self.synced_counts is None:
+            counts = self.counts
+            if dist.is_available() and dist.is_initialized():
+                counts = counts.clone()
+                dist.all_reduce(counts)
+
+            self.synced_counts = counts.cpu()
+
+        return self.synced_counts
+
+
+class ConfusionMatrixTracker(ConfusionTracker):
+    """
+    Confusion matrix for multi-class classification, eg. SceneDataset's 15 labels.
+    Rows are the true class, columns are the predicted class.
+    """
+
+    def __init__(self, num_classes, device="cpu"):
+        super().__init__((num_classes, num_classes), device)
+        self.num_classes = num_classes
+
+    def update(self, predictions, labels):
+        """
+        Predictions is a tensor (batch_size, num_classes) with a score for each class
+        Labels is a tensor (batch_size,) containing the correct class label indexes
+        """
+        predicted_labels = predictions.detach().argmax(dim=1)
+        self.add_counts(labels * self.num_classes + predicted_labels)
+
+    @property
+    def matrix(self):
+        return self.sync()
+
+    @property
+    def accuracy(self):
+        matrix = self.sync()
+        return matrix.trace().item() / max(matrix.sum().item(), 1)
+
+    @property
+    def f1(self):
+        """
+        Per-class F1 scores, a tensor (num_classes,)
+        """
+        matrix = self.sync().double()
+        true_positives = matrix.diag()
+        num_predicted = matrix.sum(dim=0)
+        num_actual = matrix.sum(dim=1)
+        return get_f1(true_positives, num_predicted, num_actual)
+
+    def get_metrics(self):
+        return {"Accuracy": self.accuracy, "Macro F1": self.f1.mean().item()}
+
+
+class MultiLabelConfusionTracker(ConfusionTracker):
+    """
+    A 2x2 confusion matrix for each label in multi-label classification,
+    eg. ChimeDataset's 8 labels. For each label, rows are whether the label is present
+    and columns are whether it was predicted: [[TN, FP], [FN, TP]].
+        threshold is the score at which a label is predicted as present
+    """
+
+    def __init__(self, num_labels, threshold=0.5, device="cpu"):
+        super().__init__((num_labels, 2, 2), device)
+        self.num_labels = num_labels
+        self.threshold = threshold
+
+    def update(self, predictions, labels):
+        """
+        Predictions is a tensor (batch_size, num_labels) with a probability for each label
+        Labels is a tensor (batch_size, num_labels), 1 for present and 0 for absent labels
+        """
+        predicted = (predictions.detach() >= self.threshold).long()
+        actual = labels.detach().long()
+        label_idxs = torch.arange(self.num_labels, device=predicted.device)
+        self.add_counts(label_idxs * 4 + actual * 2 + predicted)
+
+    @property
+    def matrix(self):
+        return self.sync()
+
+    @property
+    def hamming_loss(self):
+        """
+        The share of labels, over every sample, which were wrong.
+        """
+        matrix = self.sync()
+        num_wrong = matrix[:, 0, 1].sum() + matrix[:, 1, 0].sum()
+        return num_wrong.item() / max(matrix.sum().item(), 1)
+
+    @property
+    def f1(self):
+        """
+        Per-label F1 scores, a tensor (num_labels,)
+        """
+        matrix = self.sync().double()
+        true_positives = matrix[:, 1, 1]
+        num_predicted = matrix[:, :, 1].sum(dim=1)
+        num_actual = matrix[:, 1, :].sum(dim=1)
+        return get_f1(true_positives, num_predicted, num_actual)
+
+    def get_metrics(self):
+        return {"Hamming Loss": self.hamming_loss, "Macro F1": self.f1.mean().item()}
+
+
+def get_f1(true_positives, num_predicted, num_actual):
+    """
+    F1 score for each class, 0 for classes which were never predicted or present.
+    """
+    total = num_predicted + num_actual
+    return torch.where(total > 0, 2 * true_positives / total.clamp(min=1), total * 0)
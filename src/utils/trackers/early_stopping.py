@@ -0,0 +1,51 @@
+class EarlyStopping:
+    """
+    Tracks the best value of a validation metric, and decides when to stop training
+    because the metric hasn't improved for `patience` epochs.
+        mode is "min" if lower values are better, or "max" if higher values are better
+        min_delta is the smallest change which counts as an improvement
+    """
+
+    def __init__(self, patience, mode="min", min_delta=0.0):
+        assert mode in ("min", "max"), f"Unknown mode {mode}"
+        self.patience = patience
+        self.mode = mode
+        self.min_delta = min_delta
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the best value, eg. for a new training phase.
+        """
+        self.best_value = None
+        self.best_epoch = None
+
+    def update(self, value, epoch):
+        """
+        Record the metric value for an epoch, returns True if it's the best so far.
+        """
+        if self.best_value is None:
+            is_best = True
+        elif self.mode == "min":
+            is_best = value < self.best_value - self.min_delta
+        else:
+            is_best = value > self.best_value + self.min_delta
+
+        if is_best:
+            self.best_value = value
+            self.best_epoch = epoch
+
+        return is_best
+
+    def should_stop(self, epoch):
+        if self.best_epoch is None:
+            return False
+
+        return epoch - self.best_epoch >= self.patience
+
+    def state_dict(self):
+        return {"best_value": self.best_value, "best_epoch": self.best_epoch}
+
+    def load_state_dict(self, state_dict):
+        self.best_value = state_dict["best_value"]
+        self.best_epoch = state_dict["best_epoch"]
@@ -1,30 +1,73 @@
+import time
+import uuid
+import random
+import itertools
+import contextlib
 import pprint as pprint
+
+import numpy as np
 import torch
 import torch.optim as optim
 import torch.nn as nn
 from tqdm import tqdm
 from torch.utils.data import DataLoader
-import wandb
 
-from src.utils import checkpoint
-from src.utils.trackers import MovingAverage
+from src.utils import checkpoint, batch_size as batch_size_tuner
+from src.utils.ema import WeightEMA, EMA_DECAY
+from src.utils.data_load import MultiSourceLoader, MultiSourceDataset
+from src.utils.trackers import MovingAverage, EarlyStopping
 from src.utils.log import log_training_info
+from src.utils.debug.memory import MemoryProfiler, LayerMemoryHooks
 
+# Run id used to resume training when none is set, so a relaunched config resumes itself.
+DEFAULT_RUN_ID = "default"
 
 class Trainer:
-    def __init__(self, cuda):
+    def __init__(self, cuda, compile_net=False, memory_profile=None):
         print("Initialising trainer...")
         # Training / runtime
         self.use_cuda = cuda
         self.scheduler = None
+        self.ema = None
+        self.compiled_step = None
+        # GAN training, see use_gan
+        self.disc_net = None
+        self.disc_optimizer = None
+        self.disc_loss_fn = None
+        self.disc_every = 1
+        self.gen_every = 1
+        self.disc_tracker = None
+        if compile_net:
+            self.use_compile()
+
+        # Memory profiling, saved to the memory_profile JSON file, see debug/memory.py
+        self.memory_profile_path = memory_profile
+        self.memory_profiler = None
+        self.layer_memory = None
+        if memory_profile:
+            self.memory_profiler = MemoryProfiler("cuda" if cuda else "cpu")
 
         # Checkpointing
         self.checkpoint_epochs = None
         self.checkpoint_name = None
+        self.checkpoint_writer = None
+        self.resume = False
+        self.run_id = None
+        self.task_name = None
+        # Number of times train has been called, for scripts with several training phases.
+        self.phase = 0
 
         # Loss and metric tracking
         self.loss_fns = []
         self.metric_fns = []
+        self.trackers = []
+
+        # Validation and early stopping
+        self.validate_every = 1
+        self.validation_batches = None
+        self.early_stopping = None
+        self.early_stopping_metric = None
+        self.epoch_fns = []
 
         # Weight and Bias Logging
         self.wandb_name = None
@@ -46,14 +89,71 @@ class Trainer:
         self.use_wandb = bool(run_name)
         if self.use_wandb:
             print("Initializing W&B...")
+            import wandb  # Slow to import, so only when it's used.
+
             wandb.init(name=run_name, project=project_name, config=run_info)
         else:
             print("Skipping W&B init.")
 
-    def setup_checkpoints(self, save_name, save_epochs):
+    def setup_checkpoints(
+        self, save_name, save_epochs, resume=True, run_id=None, task_name=None
+    ):
+        """
+        Save checkpoints with the given name every `save_epochs` epochs, and at the end.
+        The full training state is also saved every epoch, by task and run id: if
+        `resume` is set, training picks up from the latest state saved by the same run,
+        eg. after a spot instance is interrupted, and skips phases it already finished.
+            run_id defaults to DEFAULT_RUN_ID if resuming, so that relaunching the same
+                config resumes the same run, otherwise to a new random id
+            task_name is the task's module name
+        """
         print("Setting up model checkpointing")
         self.checkpoint_name = save_name
         self.checkpoint_epochs = save_epochs
+        self.resume = resume
+        self.task_name = task_name
+        self.run_id = run_id
+        if save_name:
+            if not run_id and resume:
+                self.run_id = DEFAULT_RUN_ID
+                print(f"Using run id {self.run_id}, set a run_id to keep runs apart")
+            elif not run_id:
+                self.run_id = uuid.uuid4().hex[:8]
+                print(f"Starting run {self.run_id}, set this run_id to resume it")
+
+            # Save checkpoints in the background, so the GPU isn't waiting on uploads.
+            self.checkpoint_writer = checkpoint.CheckpointWriter()
+
+    def get_batch_size(self, training, net, task_name):
+        """
+        Returns the training config's batch size. If it's "auto", returns the largest
+        batch size for which a training step of `net` fits into memory, see
+        batch_size.py, so the loss functions and shapes must already be set up.
+            training is the training config, with an optional batch_memory_budget_gb
+            task_name is used to cache the batch size, eg. the task's module name
+        """
+        if training["batch_size"] != "auto":
+            return training["batch_size"]
+
+        budget_gb = training.get("batch_memory_budget_gb")
+        memory_budget = int(budget_gb * 2 ** 30) if budget_gb else None
+        device = "cuda" if self.use_cuda else "cpu"
+
+        def run_probe_step(batch_size):
+            inputs = torch.zeros([batch_size] + self.input_shape, device=device)
+            if self.target_shape:
+                targets = torch.zeros([batch_size] + self.target_shape, device=device)
+            else:
+                # Class labels
+                targets = torch.zeros(batch_size, dtype=torch.long, device=device)
+
+            net.train()
+            _, loss = self.get_loss(net, inputs, targets)
+            loss.backward()
+
+        return batch_size_tuner.get_batch_size(
+            task_name, net, run_probe_step, device, memory_budget
+        )
 
     def load_data_loaders(self, dataset, batch_size, subsample, **kwargs):
         print("Setting up datasets...")
@@ -63,6 +163,34 @@ class Trainer:
         test_loader = self.load_data_loader(self.test_set, batch_size)
         return train_loader, test_loader
 
+    def load_multi_source_data_loaders(
+        self, datasets, batch_size, subsample, weights=None, **kwargs
+    ):
+        """
+        Load training data mixed from several datasets, see MultiSourceLoader.
+            datasets is a dict of dataset classes by source name
+            weights is a dict of weights for each source's share of training batches
+        Validation runs over all of the validation sets.
+        """
+        print("Setting up datasets...")
+        train_sets = {
+            name: dataset(train=True, subsample=subsample, **kwargs)
+            for name, dataset in datasets.items()
+        }
+        test_sets = [
+            dataset(train=False, subsample=subsample, **kwargs)
+            for dataset in datasets.values()
+        ]
+        self.train_set = MultiSourceDataset(list(train_sets.values()))
+        self.test_set = MultiSourceDataset(test_sets)
+        train_loaders = {
+            name: self.load_data_loader(train_set, batch_size)
+            for name, train_set in train_sets.items()
+        }
+        train_loader = MultiSourceLoader(train_loaders, weights)
+        test_loader = self.load_data_loader(self.test_set, batch_size)
+        return train_loader, test_loader
+
     def load_data_loader(self, dataset, batch_size):
         return DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=3)
 
@@ -101,18 +229,390 @@ class Trainer:
             optimizer, epochs=epochs, steps_per_epoch=steps_per_epoch, max_lr=max_lr,
         )
 
+    def use_ema(self, net, decay=EMA_DECAY, update_every=1, use_stream=False):
+        """
+        Keep an exponential moving average of the model weights, see ema.py.
+        The averaged weights are used for validation and checkpoints.
+        """
+        print(f"Using EMA of weights with decay {decay}, every {update_every} steps")
+        self.ema = WeightEMA(net, decay, update_every=update_every, use_stream=use_stream)
+
+    def eval_weights(self):
+        """
+        Context for validating or saving the model, which swaps in EMA weights if used.
+        """
+        return self.ema.average_weights() if self.ema else contextlib.nullcontext()
+
+    def use_compile(self, mode=None):
+        """
+        Compile the training step - the model's forward pass and the loss functions -
+        with torch.compile. Python loops over layers and loss functions are traced into
+        a single graph, and AOTAutograd compiles the matching backward pass.
+            mode is a torch.compile mode, eg. "reduce-overhead" or "max-autotune"
+        The first step of each new input shape is slow while the graph compiles.
+        If compilation fails, training falls back to eager mode.
+        """
+        print(f"Compiling training step with mode {mode or 'default'}")
+        self.compiled_step = torch.compile(self.get_loss, mode=mode)
+        self.is_step_compiled = False
+
+    def use_gan(self, disc_net, disc_optimizer, disc_loss_fn, disc_every=1, gen_every=1):
+        """
+        Train the net as the generator of a GAN. Each training step runs the generator
+        once, updates the discriminator on its detached outputs, then updates the
+        generator with the registered loss functions, which can use the updated
+        discriminator, eg. LeastSquaresLoss.for_generator.
+            disc_loss_fn(inputs, outputs, targets) returns the discriminator's loss
+            disc_every updates the discriminator every N steps
+            gen_every updates the generator every N steps, or never if None,
+                eg. to pretrain the discriminator
+        """
+        gen_rate = f"every {gen_every} steps" if gen_every else "never"
+        print(f"Using GAN, discriminator every {disc_every} steps, generator {gen_rate}")
+        self.disc_net = disc_net
+        self.disc_optimizer = disc_optimizer
+        self.disc_loss_fn = disc_loss_fn
+        self.disc_every = disc_every
+        self.gen_every = gen_every
+        self.disc_tracker = MovingAverage(decay=0.8)
+
+    def use_early_stopping(
+        self, metric, patience, mode="min", validate_every=1, validation_batches=None
+    ):
+        """
+        Stop training once a validation metric hasn't improved for `patience` epochs,
+        and save the best model as a checkpoint.
+            metric is the name of a registered metric function, eg. "Loss"
+            mode is "min" if lower values are better, or "max" if higher values are better
+            validate_every runs validation every N epochs, rather than every epoch
+            validation_batches validates on N random batches, rather than the whole set
+        """
+        print(f"Using early stopping on validation {metric} with patience {patience}")
+        self.early_stopping_metric = metric
+        self.early_stopping = EarlyStopping(patience, mode)
+        self.validate_every = validate_every
+        self.validation_batches = validation_batches
+
+    def register_epoch_fn(self, fn):
+        """
+        Register a function which is called after each epoch with the epoch index and
+        the logged metrics. If it returns True, training stops.
+        """
+        self.epoch_fns.append(fn)
+
     def register_loss_fn(self, fn, weight=1):
         self.loss_fns.append([fn, weight])
 
     def register_metric_fn(self, fn, name):
         test_tracker = MovingAverage(decay=0.8)
         train_tracker = MovingAverage(decay=0.8)
-        self.metric_fns.append([fn, name.capitalize(), train_tracker, test_tracker])
+        self.metric_fns.append([fn, name, train_tracker, test_tracker])
+
+    def register_tracker(self, tracker_class, **kwargs):
+        """
+        Register a tracker which counts predictions over each epoch on the device,
+        eg. ConfusionMatrixTracker. Its metrics are only read once, after the epoch.
+        """
+        device = "cuda" if self.use_cuda else "cpu"
+        train_tracker = tracker_class(device=device, **kwargs)
+        test_tracker = tracker_class(device=device, **kwargs)
+        self.trackers.append([train_tracker, test_tracker])
+
+    @contextlib.contextmanager
+    def profile_memory(self, name, net=None):
+        """
+        Record the peak memory used in the context, if memory profiling is on, and the
+        size of the activations of each of the net's layers, if given.
+        """
+        if not self.memory_profiler:
+            yield
+            return
+
+        layer_hooks = LayerMemoryHooks(net) if net else contextlib.nullcontext()
+        with self.memory_profiler.phase(name), layer_hooks:
+            yield
+
+        if net:
+            self.layer_memory = layer_hooks
+
+    def save_memory_profile(self):
+        print("\nPeak memory by phase:\n")
+        print(self.memory_profiler.format_table())
+        if self.layer_memory:
+            print("\nActivations by layer, in the last training epoch:\n")
+            print(self.layer_memory.format_table())
+
+        self.memory_profiler.save_timeline(self.memory_profile_path)
+        print(f"\nSaved memory profile to {self.memory_profile_path}")
+
+    def get_training_state(self, net, optimizer, epoch, done=False):
+        """
+        Everything needed to resume training at the start of the given epoch.
+            done marks the state of a finished phase, which isn't trained again
+        """
+        return {
+            "epoch": epoch,
+            "done": done,
+            "net": net.state_dict(),
+            "optimizer": optimizer.state_dict(),
+            "scheduler": self.scheduler.state_dict() if self.scheduler else None,
+            "ema": self.ema.state_dict() if self.ema else None,
+            "early_stopping": (
+                self.early_stopping.state_dict() if self.early_stopping else None
+            ),
+            "disc_net": self.disc_net.state_dict() if self.disc_net else None,
+            "disc_optimizer": (
+                self.disc_optimizer.state_dict() if self.disc_net else None
+            ),
+            "metrics": {
+                name: [train_tracker.value, test_tracker.value]
+                for _, name, train_tracker, test_tracker in self.metric_fns
+            },
+            "rng": {
+                "python": random.getstate(),
+                "numpy": np.random.get_state(),
+                "torch": torch.get_rng_state(),
+                "cuda": torch.cuda.get_rng_state_all() if self.use_cuda else None,
+            },
+        }
+
+    def load_training_state(self, net, optimizer, state):
+        """
+        Restore a state saved by `get_training_state`, returns the epoch to start from.
+        """
+        net.load_state_dict(state["net"])
+        optimizer.load_state_dict(state["optimizer"])
+        if self.scheduler and state["scheduler"]:
+            self.scheduler.load_state_dict(state["scheduler"])
+
+        if self.ema and state.get("ema"):
+            self.ema.load_state_dict(state["ema"])
+
+        if self.early_stopping and state.get("early_stopping"):
+            self.early_stopping.load_state_dict(state["early_stopping"])
+
+        if self.disc_net and state.get("disc_net"):
+            self.disc_net.load_state_dict(state["disc_net"])
+            self.disc_optimizer.load_state_dict(state["disc_optimizer"])
+
+        for _, name, train_tracker, test_tracker in self.metric_fns:
+            if name in state["metrics"]:
+                train_tracker.value, test_tracker.value = state["metrics"][name]
+
+        rng = state["rng"]
+        random.setstate(rng["python"])
+        np.random.set_state(rng["numpy"])
+        torch.set_rng_state(rng["torch"])
+        if self.use_cuda and rng["cuda"]:
+            torch.cuda.set_rng_state_all(rng["cuda"])
+
+        return state["epoch"]
+
+    def get_loss(self, net, inputs, targets):
+        """
+        Get a prediction from the model and the weighted sum of the loss functions.
+        """
+        outputs = net(inputs)
+        return outputs, self.sum_losses(inputs, outputs, targets)
+
+    def sum_losses(self, inputs, outputs, targets):
+        """
+        Weighted sum of the loss functions.
+        """
+        # Not a leaf tensor which requires grad: torch.compile can't trace those.
+        loss = torch.zeros(1, device=inputs.device)
+        for loss_fn, weight in self.loss_fns:
+            loss = loss + weight * loss_fn(inputs, outputs, targets)
+
+        return loss
+
+    def run_step(self, net, inputs, targets):
+        """
+        Get the model outputs and loss for a training step, compiled if requested.
+        """
+        if not self.compiled_step:
+            return self.get_loss(net, inputs, targets)
+
+        start_time = time.time()
+        try:
+            outputs, loss = self.compiled_step(net, inputs, targets)
+        except torch._dynamo.exc.TorchDynamoException as e:
+            print(f"Compiling training step failed, falling back to eager mode:\n{e}")
+            self.compiled_step = None
+            return self.get_loss(net, inputs, targets)
+
+        if not self.is_step_compiled:
+            self.is_step_compiled = True
+            print(f"Compiled training step in {time.time() - start_time:.1f}s")
+
+        return outputs, loss
+
+    def run_gan_step(self, net, inputs, targets, step):
+        """
+        Get the generator outputs and loss for a GAN training step, see use_gan.
+        The discriminator is updated in between, on the same outputs.
+        Returns None for the loss if the generator isn't updated in this step.
+        """
+        is_gen_step = self.gen_every is not None and step % self.gen_every == 0
+        with torch.set_grad_enabled(is_gen_step):
+            outputs = net(inputs)
+
+        if step % self.disc_every == 0:
+            self.disc_optimizer.zero_grad()
+            disc_loss = self.disc_loss_fn(inputs, outputs.detach(), targets)
+            disc_loss.backward()
+            self.disc_optimizer.step()
+            self.disc_tracker.update(disc_loss.item())
+
+        if not is_gen_step:
+            return outputs, None
+
+        # Only the generator is updated, so skip the discriminator's weight gradients.
+        disc_params = list(self.disc_net.parameters())
+        requires_grad = [param.requires_grad for param in disc_params]
+        self.disc_net.requires_grad_(False)
+        try:
+            loss = self.sum_losses(inputs, outputs, targets)
+        finally:
+            for param, param_requires_grad in zip(disc_params, requires_grad):
+                param.requires_grad_(param_requires_grad)
+
+        return outputs, loss
+
+    def validate(self, net, test_loader):
+        """
+        Run the model over the validation set, updating the validation metric trackers.
+        Returns a dict of each metric's mean over the validation set, by name.
+        """
+        net.eval()
+        totals = {name: 0.0 for _, name, _, _ in self.metric_fns}
+        count = 0
+        batches = itertools.islice(test_loader, self.validation_batches)
+        num_batches = self.validation_batches or len(test_loader)
+        for _, test_tracker in self.trackers:
+            test_tracker.reset()
+
+        with torch.no_grad(), self.eval_weights():
+            for inputs, targets in tqdm(batches, total=num_batches):
+                inputs = inputs.cuda() if self.use_cuda else inputs.cpu()
+                targets = targets.cuda() if self.use_cuda else targets.cpu()
+                outputs = net(inputs)
+                # Track metric information
+                for metric_fn, name, _, test_tracker in self.metric_fns:
+                    metric_val = metric_fn(inputs, outputs, targets)
+                    test_tracker.update(metric_val)
+                    totals[name] += metric_val
+
+                count += 1
+                for _, test_tracker in self.trackers:
+                    test_tracker.update(outputs, targets)
+
+        return {name: total / count if count else None for name, total in totals.items()}
+
+    def train_epoch(self, net, optimizer, train_loader):
+        """
+        Run a training step on each batch, updating the training metric trackers.
+        """
+        for step, (inputs, targets) in enumerate(tqdm(train_loader)):
+            batch_size = inputs.shape[0]
+            inputs = inputs.cuda() if self.use_cuda else inputs.cpu()
+            targets = targets.cuda() if self.use_cuda else targets.cpu()
+
+            # Sanity check training data shape sizes
+            if self.input_shape:
+                expected_shape = tuple([batch_size] + self.input_shape)
+                assert (
+                    inputs.shape == expected_shape
+                ), f"Bad shape: expected {expected_shape} got {inputs.shape}"
+            if self.target_shape:
+                expected_shape = tuple([batch_size] + self.target_shape)
+                assert (
+                    targets.shape == expected_shape
+                ), f"Bad shape: expected {expected_shape} got {target.shape}"
+
+            # Get a prediction from the model, and the loss over the prediction.
+            optimizer.zero_grad()
+            if self.disc_net:
+                outputs, loss = self.run_gan_step(net, inputs, targets, step)
+            else:
+                outputs, loss = self.run_step(net, inputs, targets)
+
+            if self.output_shape:
+                expected_shape = tuple([batch_size] + self.output_shape)
+                assert (
+                    outputs.shape == expected_shape
+                ), f"Bad shape: expected {expected_shape} got {outputs.shape}"
+
+            # Calculate model weight gradients from the loss and update model.
+            if loss is not None:
+                self.update_net(optimizer, loss)
+
+            # Track metric information
+            with torch.no_grad():
+                for metric_fn, _, train_tracker, _ in self.metric_fns:
+                    metric_val = metric_fn(inputs, outputs, targets)
+                    train_tracker.update(metric_val)
+
+                for train_tracker, _ in self.trackers:
+                    train_tracker.update(outputs, targets)
+
+    def update_net(self, optimizer, loss):
+        """
+        Backpropagate the loss, then take an optimizer step.
+        """
+        if not loss.requires_grad:
+            raise ValueError(
+                "The loss doesn't depend on any trainable parameters, check that a loss "
+                "function is registered and the net isn't frozen"
+            )
+
+        loss.backward()
+
+        if self.ema:
+            self.ema.wait()
+
+        optimizer.step()
+        if self.ema:
+            self.ema.update()
+
+        if self.scheduler:
+            # Update the learning rate, according to the scheduler.
+            try:
+                self.scheduler.step()
+            except ValueError:
+                pass
 
     def train(self, net, num_epochs, optimizer, train_loader, test_loader):
+        start_epoch = 0
+        # Each phase stops early on its own, counting epochs from its start.
+        if self.early_stopping:
+            self.early_stopping.reset()
+
+        if self.checkpoint_name and self.resume:
+            state = checkpoint.load_training_state(
+                self.checkpoint_name, self.run_id, self.phase, self.task_name
+            )
+            if state and state.get("done"):
+                self.load_training_state(net, optimizer, state)
+                print(f"Phase {self.phase} already finished, skipping it")
+                self.phase += 1
+                return
+            elif state:
+                start_epoch = self.load_training_state(net, optimizer, state)
+                print(f"Resuming phase {self.phase} from epoch {start_epoch + 1}")
+
+        if self.early_stopping:
+            metric_names = [name for _, name, _, _ in self.metric_fns]
+            assert self.early_stopping_metric in metric_names, "Unknown stopping metric"
+            if self.early_stopping.should_stop(start_epoch - 1):
+                print("Training already stopped early")
+                start_epoch = num_epochs
+
         print("Starting training...")
         # Run training for some number of epochs.
-        for epoch in range(num_epochs):
+        end_epoch = start_epoch
+        for epoch in range(start_epoch, num_epochs):
+            end_epoch = epoch + 1
             print(f"\nEpoch {epoch + 1} / {num_epochs}\n")
             torch.cuda.empty_cache()
 
@@ -121,75 +621,45 @@ class Trainer:
                 self.checkpoint_epochs and epoch % self.checkpoint_epochs == 0
             )
             if self.checkpoint_name and is_checkpoint_epoch:
-                checkpoint.save(net, self.checkpoint_name, name=self.wandb_name)
+                with self.eval_weights():
+                    self.checkpoint_writer.save(
+                        net, self.checkpoint_name, name=self.wandb_name
+                    )
 
             # Run training loop
             net.train()
-            for inputs, targets in tqdm(train_loader):
-                batch_size = inputs.shape[0]
-                inputs = inputs.cuda() if self.use_cuda else inputs.cpu()
-                targets = targets.cuda() if self.use_cuda else targets.cpu()
-
-                # Sanity check training data shape sizes
-                if self.input_shape:
-                    expected_shape = tuple([batch_size] + self.input_shape)
-                    assert (
-                        inputs.shape == expected_shape
-                    ), f"Bad shape: expected {expected_shape} got {inputs.shape}"
-                if self.target_shape:
-                    expected_shape = tuple([batch_size] + self.target_shape)
-                    assert (
-                        targets.shape == expected_shape
-                    ), f"Bad shape: expected {expected_shape} got {target.shape}"
-
-                # Get a prediction from the model
-                optimizer.zero_grad()
-                outputs = net(inputs)
-                if self.output_shape:
-                    expected_shape = tuple([batch_size] + self.output_shape)
-                    assert (
-                        outputs.shape == expected_shape
-                    ), f"Bad shape: expected {expected_shape} got {outputs.shape}"
-
-                # Run loss function on over the model's prediction
-                loss = torch.tensor([0.0], requires_grad=True)
-                loss = loss.cuda() if self.use_cuda else loss
-                for loss_fn, weight in self.loss_fns:
-                    loss = loss + weight * loss_fn(inputs, outputs, targets)
-
-                # Calculate model weight gradients from the loss and update model.
-                loss.backward()
-                optimizer.step()
-                if self.scheduler:
-                    # Update the learning rate, according to the scheduler.
-                    try:
-                        self.scheduler.step()
-                    except ValueError:
-                        pass
+            for train_tracker, _ in self.trackers:
+                train_tracker.reset()
 
-                # Track metric information
-                with torch.no_grad():
-                    for metric_fn, _, train_tracker, _ in self.metric_fns:
-                        metric_val = metric_fn(inputs, outputs, targets)
-                        train_tracker.update(metric_val)
+            with self.profile_memory(f"Phase {self.phase} training", net):
+                self.train_epoch(net, optimizer, train_loader)
 
             # Check performance (loss) on validation set.
-            net.eval()
-            with torch.no_grad():
-                for inputs, targets in tqdm(test_loader):
-                    inputs = inputs.cuda() if self.use_cuda else inputs.cpu()
-                    targets = targets.cuda() if self.use_cuda else targets.cpu()
-                    outputs = net(inputs)
-                    # Track metric information
-                    for metric_fn, _, _, test_tracker in self.metric_fns:
-                        metric_val = metric_fn(inputs, outputs, targets)
-                        test_tracker.update(metric_val)
+            is_validation_epoch = (epoch + 1) % self.validate_every == 0
+            is_validation_epoch = is_validation_epoch or epoch + 1 == num_epochs
+            if is_validation_epoch:
+                with self.profile_memory(f"Phase {self.phase} validation"):
+                    validation_means = self.validate(net, test_loader)
 
             # Log epoch metrics
             training_info = {}
             for _, name, train_tracker, test_tracker in self.metric_fns:
                 training_info[f"Training {name}"] = train_tracker.value
-                training_info[f"Validation {name}"] = test_tracker.value
+                if is_validation_epoch:
+                    training_info[f"Validation {name}"] = test_tracker.value
+                    # The tracker averages over epochs, this is just this epoch.
+                    training_info[f"Mean Validation {name}"] = validation_means[name]
+
+            for train_tracker, test_tracker in self.trackers:
+                for name, value in train_tracker.get_metrics().items():
+                    training_info[f"Training {name}"] = value
+
+                if is_validation_epoch:
+                    for name, value in test_tracker.get_metrics().items():
+                        training_info[f"Validation {name}"] = value
+
+            if self.disc_net:
+                training_info["Training Discriminator Loss"] = self.disc_tracker.value
 
             if self.scheduler:
                 try:
@@ -197,10 +667,64 @@ class Trainer:
                 except ValueError:
                     pass  # Whatevs
 
+            # Keep the best model, and check whether it's time to stop.
+            should_stop = False
+            if self.early_stopping and is_validation_epoch:
+                validation_value = validation_means[self.early_stopping_metric]
+                is_best = self.early_stopping.update(validation_value, epoch)
+                if is_best and self.checkpoint_name:
+                    with self.eval_weights():
+                        self.checkpoint_writer.save(
+                            net,
+                            self.checkpoint_name,
+                            name=self.wandb_name,
+                            best=True,
+                            phase=self.phase,
+                        )
+
+                best_name = f"Best Validation {self.early_stopping_metric}"
+                training_info[best_name] = self.early_stopping.best_value
+                should_stop = self.early_stopping.should_stop(epoch)
+
             log_training_info(training_info, use_wandb=self.use_wandb)
+            for epoch_fn in self.epoch_fns:
+                should_stop = epoch_fn(epoch, training_info) or should_stop
+
+            # Save training state, so an interrupted run can resume from the next epoch.
+            if self.checkpoint_name:
+                self.checkpoint_writer.save_training_state(
+                    self.get_training_state(net, optimizer, epoch + 1),
+                    self.checkpoint_name,
+                    self.run_id,
+                    phase=self.phase,
+                    task_name=self.task_name,
+                )
 
-        # Save final model checkpoint
+            if should_stop:
+                print(f"\nStopping early after epoch {epoch + 1}")
+                break
+
+        # Save final model checkpoint and mark the phase as finished, then wait for all
+        # checkpoints to finish uploading.
         if self.checkpoint_name:
-            checkpoint.save(
-                net, self.checkpoint_name, name=self.wandb_name, use_wandb=self.use_wandb
+            self.checkpoint_writer.save_training_state(
+                self.get_training_state(net, optimizer, end_epoch, done=True),
+                self.checkpoint_name,
+                self.run_id,
+                phase=self.phase,
+                task_name=self.task_name,
             )
+            with self.eval_weights():
+                self.checkpoint_writer.save(
+                    net,
+                    self.checkpoint_name,
+                    name=self.wandb_name,
+                    use_wandb=self.use_wandb,
+                )
+
+            self.checkpoint_writer.flush()
+
+        if self.memory_profiler:
+            self.save_memory_profile()
+
+        self.phase += 1
@@ -0,0 +1,117 @@
+"""
+Process-wide registry of vocoders, which turn spectrograms back into audio.
+
+Preparing a vocoder's weights can be slow: WaveGlow's are downloaded from torch hub and
+then have weight norm removed. The registry only does this once per machine: the
+prepared weights are saved to disk as a state dict, and later loads memory-map the saved
+file into the vocoder's model, which is defined in this repo, so that loading doesn't
+depend on torch hub's code. Each vocoder is loaded lazily, the first time it is
+requested, and then shared by all callers in the process.
+
+Tests (or offline machines) can swap in a local stand-in with `registry.set_local`.
+"""
+import os
+import threading
+
+import torch
+
+from src.utils.checkpoint import CHECKPOINT_DIR
+
+VOCODER_DIR = os.path.join(CHECKPOINT_DIR, "vocoders")
+WAVEGLOW = "waveglow"
+
+
+class VocoderRegistry:
+    def __init__(self, vocoder_dir=VOCODER_DIR):
+        self.vocoder_dir = vocoder_dir
+        self.factories = {}
+        self.vocoders = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, model_fn, weights_fn):
+        """
+        Register a vocoder.
+            model_fn builds the vocoder's model, with untrained weights
+            weights_fn returns the model's ready-to-use weights as a state dict
+        """
+        self.factories[name] = (model_fn, weights_fn)
+
+    def set_local(self, name, vocoder):
+        """
+        Use the given vocoder instead of loading one, eg. a stand-in for tests.
+        """
+        with self.lock:
+            self.vocoders[(name, True)] = vocoder
+            self.vocoders[(name, False)] = vocoder
+
+    def clear(self):
+        """
+        Forget all loaded vocoders.
+        """
+        with self.lock:
+            self.vocoders = {}
+
+    def get(self, name, use_cuda=False):
+        """
+        Get a vocoder by name, loading it if required.
+        """
+        key = (name, use_cuda)
+        with self.lock:
+            if key not in self.vocoders:
+                vocoder = self._load(name)
+                vocoder = vocoder.cuda() if use_cuda else vocoder.cpu()
+                self.vocoders[key] = vocoder.eval()
+
+            return self.vocoders[key]
+
+    def get_path(self, name):
+        return os.path.join(self.vocoder_dir, f"{name}.ckpt")
+
+    def _load(self, name):
+        """
+        Load the prepared weights from disk, or prepare and save them if they don't
+        exist yet.
+        """
+        assert name in self.factories, f"No vocoder registered with name {name}"
+        model_fn, weights_fn = self.factories[name]
+        path = self.get_path(name)
+        if os.path.exists(path):
+            print(f"Loading vocoder {name} from {path}")
+            state_dict = torch.load(
+                path, map_location="cpu", mmap=True, weights_only=True
+            )
+        else:
+            print(f"Preparing vocoder {name}")
+            state_dict = {k: v.cpu() for k, v in weights_fn().items()}
+            os.makedirs(self.vocoder_dir, exist_ok=True)
+            # Write then rename, so that a crash never leaves a partial file behind.
+            tmp_path = f"{path}.tmp"
+            torch.save(state_dict, tmp_path)
+            os.replace(tmp_path, path)
+
+        vocoder = model_fn()
+        # Assign, rather than copy, to keep the memory-mapped tensors.
+        vocoder.load_state_dict(state_dict, assign=True)
+        return vocoder
+
+
+def build_waveglow():
+    from src.utils.waveglow import WaveGlow, WAVEGLOW_CONFIG
+
+    return WaveGlow(**WAVEGLOW_CONFIG)
+
+
+def get_waveglow_weights():
+    """
+    Download WaveGlow vocoder model from torch hub and remove weight norm for inference.
+    https://github.com/NVIDIA/waveglow
+    """
+    from src.utils import spectral
+
+    waveglow = torch.hub.load(spectral.WAVEGLOW_GITHUB, spectral.WAVEGLOW_MODEL_NAME)
+    waveglow = waveglow.remove_weightnorm(waveglow)
+    return waveglow.state_dict()
+
+
+registry = VocoderRegistry()
+registry.register(WAVEGLOW, build_waveglow, get_waveglow_weights)
@@ -0,0 +1,155 @@
+"""
+WaveGlow vocoder, for inference only, with weight norm removed.
+
+Code borrowed from NVIDIA's torch hub model:
+https://github.com/NVIDIA/DeepLearningExamples/blob/master/PyTorch/SpeechSynthesis/Tacotron2/waveglow/model.py
+
+The definition is vendored, so that saved weights can be loaded into it without
+torch hub, or its code, being available.
+"""
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+# Configuration of the torch hub model, nvidia_waveglow.
+WAVEGLOW_CONFIG = {
+    "n_mel_channels": 80,
+    "n_flows": 12,
+    "n_group": 8,
+    "n_early_every": 4,
+    "n_early_size": 2,
+    "wn_config": {"n_layers": 8, "n_channels": 512, "kernel_size": 3},
+}
+
+
+class WaveGlow(nn.Module):
+    def __init__(
+        self, n_mel_channels, n_flows, n_group, n_early_every, n_early_size, wn_config
+    ):
+        super().__init__()
+        assert n_group % 2 == 0
+        self.upsample = nn.ConvTranspose1d(
+            n_mel_channels, n_mel_channels, 1024, stride=256
+        )
+        self.n_flows = n_flows
+        self.n_group = n_group
+        self.n_early_every = n_early_every
+        self.n_early_size = n_early_size
+        self.WN = nn.ModuleList()
+        self.convinv = nn.ModuleList()
+
+        # Each flow acts on fewer channels, once early outputs have been split off.
+        n_half = n_group // 2
+        n_remaining_channels = n_group
+        for k in range(n_flows):
+            if k % n_early_every == 0 and k > 0:
+                n_half = n_half - n_early_size // 2
+                n_remaining_channels = n_remaining_channels - n_early_size
+
+            self.convinv.append(Invertible1x1Conv(n_remaining_channels))
+            self.WN.append(WN(n_half, n_mel_channels * n_group, **wn_config))
+
+        self.n_remaining_channels = n_remaining_channels
+
+    def infer(self, spect, sigma=1.0):
+        """
+        Convert a batch of mel spectrograms (batch, bins, frames) into audio.
+        """
+        spect = self.upsample(spect)
+        # Trim the transposed convolution's artifacts.
+        time_cutoff = self.upsample.kernel_size[0] - self.upsample.stride[0]
+        spect = spect[:, :, :-time_cutoff]
+
+        spect = spect.unfold(2, self.n_group, self.n_group).permute(0, 2, 1, 3)
+        spect = spect.contiguous().view(spect.size(0), spect.size(1), -1)
+        spect = spect.permute(0, 2, 1)
+
+        audio = torch.randn(
+            spect.size(0), self.n_remaining_channels, spect.size(2), device=spect.device
+        ).to(spect.dtype)
+        audio = sigma * audio
+
+        for k in reversed(range(self.n_flows)):
+            n_half = audio.size(1) // 2
+            audio_0 = audio[:, :n_half, :]
+            audio_1 = audio[:, n_half : (n_half + n_half), :]
+
+            output = self.WN[k](audio_0, spect)
+            s = output[:, n_half : (n_half + n_half), :]
+            b = output[:, :n_half, :]
+            audio_1 = (audio_1 - b) / torch.exp(s)
+            audio = torch.cat([audio_0, audio_1], 1)
+            audio = self.convinv[k].infer(audio)
+
+            if k % self.n_early_every == 0 and k > 0:
+                z = torch.randn(
+                    spect.size(0), self.n_early_size, spect.size(2), device=spect.device
+                ).to(spect.dtype)
+                audio = torch.cat((sigma * z, audio), 1)
+
+        return audio.permute(0, 2, 1).contiguous().view(audio.size(0), -1)
+
+
+class Invertible1x1Conv(nn.Module):
+    def __init__(self, c):
+        super().__init__()
+        self.conv = nn.Conv1d(c, c, kernel_size=1, stride=1, padding=0, bias=False)
+
+    def infer(self, z):
+        weight = self.conv.weight.squeeze(2)
+        weight_inverse = weight.float().inverse().to(z.dtype)
+        return F.conv1d(z, weight_inverse.unsqueeze(2))
+
+
+class WN(nn.Module):
+    """
+    WaveNet-like layers, conditioned on the spectrogram, which compute the affine
+    coupling of each flow.
+    """
+
+    def __init__(self, n_in_channels, n_mel_channels, n_layers, n_channels, kernel_size):
+        super().__init__()
+        assert kernel_size % 2 == 1
+        assert n_channels % 2 == 0
+        self.n_layers = n_layers
+        self.n_channels = n_channels
+        self.in_layers = nn.ModuleList()
+        self.res_skip_layers = nn.ModuleList()
+        self.cond_layers = nn.ModuleList()
+        self.start = nn.Conv1d(n_in_channels, n_channels, 1)
+        self.end = nn.Conv1d(n_channels, 2 * n_in_channels, 1)
+
+        for i in range(n_layers):
+            dilation = 2 ** i
+            padding = (kernel_size * dilation - dilation) // 2
+            self.in_layers.append(
+                nn.Conv1d(
+                    n_channels,
+                    2 * n_channels,
+                    kernel_size,
+                    dilation=dilation,
+                    padding=padding,
+                )
+            )
+            self.cond_layers.append(nn.Conv1d(n_mel_channels, 2 * n_channels, 1))
+            # The last layer only has skip outputs.
+            res_skip_channels = 2 * n_channels if i < n_layers - 1 else n_channels
+            self.res_skip_layers.append(nn.Conv1d(n_channels, res_skip_channels, 1))
+
+    def forward(self, audio, spect):
+        audio = self.start(audio)
+        output = 0
+        for i in range(self.n_layers):
+            in_act = self.in_layers[i](audio) + self.cond_layers[i](spect)
+            t_act = torch.tanh(in_act[:, : self.n_channels, :])
+            s_act = torch.sigmoid(in_act[:, self.n_channels :, :])
+            res_skip_acts = self.res_skip_layers[i](t_act * s_act)
+            if i < self.n_layers - 1:
+                audio = res_skip_acts[:, : self.n_channels, :] + audio
+                skip_acts = res_skip_acts[:, self.n_channels :, :]
+            else:
+                skip_acts = res_skip_acts
+
+            output = skip_acts + output
+
+        return self.end(output)
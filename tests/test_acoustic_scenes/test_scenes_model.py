@@ -0,0 +1,47 @@
+import torch
+
+from src.tasks.acoustic_scenes.model import SceneNet, NUM_LABELS, MIN_SAMPLES
+
+USE_CUDA = torch.cuda.is_available()
+
+
+def _cuda_maybe(torchy):
+    return torchy.cuda() if USE_CUDA else torchy.cpu()
+
+
+def _get_net():
+    return _cuda_maybe(SceneNet())
+
+
+def _get_noise(shape):
+    return _cuda_maybe(torch.zeros(shape).detach().uniform_())
+
+
+def test_processes_noise():
+    net = _get_net()
+    inputs = _get_noise((1, 1, MIN_SAMPLES))
+    outputs = net(inputs)
+    assert outputs.shape == (1, NUM_LABELS)
+
+
+def test_feature_extractor_matches_feature_mode():
+    net = _get_net().eval()
+    feature_net = net.get_feature_extractor(num_layers=6)
+    assert not hasattr(feature_net, "final_conv")
+    assert not any(p.requires_grad for p in feature_net.parameters())
+    num_params = sum(p.numel() for p in feature_net.parameters())
+    assert num_params < sum(p.numel() for p in net.parameters())
+    inputs = _get_noise((2, 1, MIN_SAMPLES))
+    features = feature_net(inputs)
+    net.set_feature_mode()
+    net(inputs)
+    assert len(features) == 6
+    for feature, feature_layer in zip(features, net.feature_layers):
+        assert torch.equal(feature, feature_layer)
+
+
+def test_feature_extractor_with_fewer_layers():
+    feature_net = _get_net().get_feature_extractor(num_layers=2)
+    features = feature_net(_get_noise((1, 1, MIN_SAMPLES)))
+    assert len(features) == 2
+    assert features[0].shape[:2] == (1, 32)
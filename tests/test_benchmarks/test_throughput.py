@@ -0,0 +1,13 @@
+from src.benchmarks.throughput import run_task
+
+
+def test_run_task_stops_after_steps():
+    """
+    Check that a task trains on synthetic data, and stops after the timed steps
+    """
+    result = run_task(
+        "scene_net_train", num_steps=2, num_warmup=1, batch_size=2, use_cuda=False
+    )
+    assert result["steps"] == 2
+    assert result["samples_per_s"] == 2 * result["steps_per_s"]
+    assert 0 <= result["data_wait"] <= 1
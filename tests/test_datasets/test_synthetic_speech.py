@@ -0,0 +1,49 @@
+import pytest
+import torch
+
+from src.datasets import SyntheticSpeechDataset as Dataset
+from src.datasets.speech.synthetic.synthetic_dataset import NOISE_TYPES
+
+
+def test_len():
+    assert len(Dataset(train=True, subsample=8)) == 8
+    assert len(Dataset(train=True, num_items=10 ** 9)) == 10 ** 9
+    with pytest.raises(IndexError):
+        Dataset(train=True, subsample=8)[8]
+
+
+def test_get_item():
+    dataset = Dataset(train=True, audio_length=2 ** 14)
+    noisy, clean = dataset[10 ** 4]
+    assert noisy.shape == clean.shape == (2 ** 14,)
+    assert noisy.dtype == clean.dtype == torch.float32
+    assert clean.abs().max() <= 1 and noisy.abs().max() <= 1
+    assert not torch.equal(noisy, clean)
+
+
+def test_items_are_deterministic():
+    """
+    Check that each item only depends on the seed and index
+    """
+    dataset = Dataset(train=True, audio_length=2 ** 14)
+    noisy, clean = dataset[3]
+    other_noisy, other_clean = Dataset(train=True, audio_length=2 ** 14)[3]
+    assert torch.equal(noisy, other_noisy) and torch.equal(clean, other_clean)
+    assert not torch.equal(clean, dataset[4][1])
+    assert not torch.equal(clean, Dataset(train=False, audio_length=2 ** 14)[3][1])
+    assert not torch.equal(clean, Dataset(train=True, seed=1, audio_length=2 ** 14)[3][1])
+
+
+@pytest.mark.parametrize("noise_type", NOISE_TYPES)
+def test_noise_types(noise_type):
+    dataset = Dataset(train=True, audio_length=2 ** 14, noise_types=(noise_type,))
+    noisy, clean = dataset[0]
+    assert torch.isfinite(noisy).all()
+    assert (noisy - clean).abs().max() > 0
+
+
+def test_clean_only():
+    dataset = Dataset(train=True, audio_length=2 ** 14)
+    dataset.clean_only = True
+    noisy, clean = dataset[0]
+    assert torch.equal(noisy, clean)
@@ -0,0 +1,15 @@
+"""
+Stand-in training task for the hyperparam search tests. The validation loss is the
+"learning rate", so the search should find the smallest one.
+"""
+
+
+def sample_hyperparams(rng):
+    return {"learning_rate": rng.uniform(0, 1)}
+
+
+def train(runtime, training, logging, hyperparams, epoch_fn):
+    for epoch in range(training["epochs"]):
+        loss = hyperparams["learning_rate"] / (epoch + 1)
+        if epoch_fn(epoch, {"Training Loss": loss, "Mean Validation Loss": loss}):
+            return
@@ -0,0 +1,79 @@
+import threading
+
+from src.search.asha import ASHA
+from src.search.runner import run_search, load_results
+
+
+def test_asha_rungs():
+    """
+    Check that rungs are spaced by a factor of eta, below the max epochs.
+    """
+    asha = ASHA({}, threading.Lock(), min_epochs=1, max_epochs=27, eta=3)
+    assert asha.rung_epochs == [1, 3, 9]
+    asha = ASHA({}, threading.Lock(), min_epochs=2, max_epochs=20, eta=2)
+    assert asha.rung_epochs == [2, 4, 8, 16]
+
+
+def test_asha_stops_bad_trials():
+    """
+    Check that only the top 1 / eta of trials carry on past each rung.
+    """
+    asha = ASHA({}, threading.Lock(), min_epochs=1, max_epochs=9, eta=3)
+    # The first trial at a rung always carries on.
+    assert not asha.should_stop(1, 0.5)
+    # Worse than the best of 2
+    assert asha.should_stop(1, 0.7)
+    # Better than the previous best
+    assert not asha.should_stop(1, 0.2)
+    # Top 2 of 4 carry on, but 0.6 is 3rd.
+    assert asha.should_stop(1, 0.6)
+    # Epochs between rungs never stop.
+    assert not asha.should_stop(2, 100)
+
+
+def test_asha_max_mode():
+    asha = ASHA({}, threading.Lock(), min_epochs=1, max_epochs=9, eta=3, mode="max")
+    assert not asha.should_stop(1, 0.5)
+    assert asha.should_stop(1, 0.3)
+    assert not asha.should_stop(1, 0.9)
+
+
+def test_run_search(tmp_path):
+    """
+    Check that a search runs trials in parallel and saves their results.
+    """
+    results_path = str(tmp_path / "results.jsonl")
+    results = run_search(
+        "tests.test_search.search_task",
+        results_path,
+        num_trials=6,
+        max_epochs=9,
+        num_workers=2,
+    )
+    assert len(results) == 6
+    assert load_results(results_path) == results
+    # The best trial always completes. Which others are stopped depends on the order
+    # in which the workers report, but they can only stop at a rung.
+    best = min(results, key=lambda r: r["best"])
+    assert best["status"] == "completed"
+    assert best["epochs"] == 9
+    for result in results:
+        if result["status"] == "stopped":
+            assert result["epochs"] in (1, 3)
+
+
+def test_run_search_stops_trials(tmp_path):
+    """
+    Check that trials are stopped by ASHA, with one worker, so that trials report in
+    order. Trial 4 is the first to fall out of the top third of its rung.
+    """
+    results = run_search(
+        "tests.test_search.search_task",
+        str(tmp_path / "results.jsonl"),
+        num_trials=6,
+        max_epochs=9,
+        num_workers=1,
+    )
+    results = sorted(results, key=lambda r: r["trial_id"])
+    assert [r["status"] for r in results] == ["completed"] * 4 + ["stopped", "completed"]
+    assert results[4]["epochs"] == 1
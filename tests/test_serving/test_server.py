@@ -0,0 +1,147 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from urllib import request, error
+
+import pytest
+
+import numpy as np
+import torch
+from scipy.io import wavfile
+
+from src.serving.batcher import MicroBatcher, split_chunks, join_chunks
+from src.serving.server import EnhanceServer, get_model_fn, read_wav, write_wav
+from src.serving.server import build_server
+from src.utils.checkpoint_store import CheckpointStore
+from src.tasks.spectral_u_net.model import SpectralUNet
+from src.tasks.waveunet.models.wave_u_net import WaveUNet
+
+
+def test_concurrent_requests_are_batched():
+    batch_shapes = []
+
+    def model_fn(batch_t):
+        batch_shapes.append(tuple(batch_t.shape))
+        return batch_t * 2
+
+    batcher = MicroBatcher(model_fn, max_batch_size=4, max_wait_ms=200)
+    inputs = [np.random.randn(1000 + i).astype("float32") for i in range(4)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        outputs = list(executor.map(batcher.enhance, inputs))
+
+    batcher.stop()
+    assert batch_shapes == [(4, 2 ** 12)]
+    for input_arr, output_arr in zip(inputs, outputs):
+        assert np.allclose(output_arr, input_arr * 2)
+
+    metrics = batcher.metrics()
+    assert metrics["requests"] == 4
+    assert metrics["mean_batch_size"] == 4
+
+
+def test_long_audio_is_chunked():
+    batcher = MicroBatcher(lambda t: t, chunk_length=2 ** 13, chunk_overlap=2 ** 10)
+    input_arr = np.random.randn(50000).astype("float32")
+    output_arr = batcher.enhance(input_arr)
+    batcher.stop()
+    assert batcher.metrics()["chunks"] == 7
+    assert np.allclose(output_arr, input_arr, atol=1e-5)
+
+
+def test_join_chunks_crossfades_overlaps():
+    input_arr = np.ones(1000, dtype="float32")
+    chunks = split_chunks(input_arr, 300, 100)
+    assert [start for start, _ in chunks] == [0, 200, 400, 600, 800]
+    assert np.allclose(join_chunks(chunks, 1000, 100), input_arr)
+
+
+def test_server_enhances_wav():
+    batcher = MicroBatcher(lambda t: -t)
+    server = EnhanceServer(("localhost", 0), batcher, max_concurrency=2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://localhost:{server.server_address[1]}"
+    try:
+        input_arr = np.random.randn(5000).astype("float32")
+        req = request.Request(f"{url}/enhance", data=write_wav(input_arr), method="POST")
+        with request.urlopen(req) as resp:
+            output_arr = read_wav(resp.read())
+
+        assert np.allclose(output_arr, -input_arr)
+    finally:
+        server.shutdown()
+        batcher.stop()
+
+
+@mock.patch("src.utils.checkpoint_store.s3", autospec=True)
+def test_server_starts_from_full_checkpoint(mock_s3, tmp_path):
+    """
+    Check that the server starts from a saved full.ckpt checkpoint and enhances audio
+    with the loaded model.
+    """
+    net = WaveUNet(num_channels=4, num_layers=3).eval()
+    store = CheckpointStore(str(tmp_path))
+    store.save(net, "wave-u-net-123.full.ckpt")
+    with mock.patch("src.utils.checkpoint.store", store):
+        server = build_server("wave-u-net-123.full.ckpt", "localhost", 0)
+
+    assert isinstance(server.batcher, MicroBatcher)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://localhost:{server.server_address[1]}"
+    try:
+        input_arr = np.random.randn(2 ** 14).astype("float32")
+        req = request.Request(f"{url}/enhance", data=write_wav(input_arr), method="POST")
+        with request.urlopen(req) as resp:
+            output_arr = read_wav(resp.read())
+
+        with torch.no_grad():
+            expected_arr = net(torch.tensor(input_arr)[None]).numpy()[0]
+
+        assert np.allclose(output_arr, expected_arr, atol=1e-5)
+    finally:
+        server.shutdown()
+        server.batcher.stop()
+
+
+def test_server_returns_error_when_enhancement_fails():
+    def model_fn(batch_t):
+        raise RuntimeError("Model failed")
+
+    batcher = MicroBatcher(model_fn)
+    server = EnhanceServer(("localhost", 0), batcher, max_concurrency=2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://localhost:{server.server_address[1]}"
+    try:
+        input_arr = np.random.randn(5000).astype("float32")
+        req = request.Request(f"{url}/enhance", data=write_wav(input_arr), method="POST")
+        with pytest.raises(error.HTTPError) as e:
+            request.urlopen(req)
+
+        assert e.value.code == 500
+        assert b"Model failed" in e.value.read()
+    finally:
+        server.shutdown()
+        batcher.stop()
+
+
+def test_read_wav_scales_integer_pcm():
+    input_arr = np.array([0, 0.5, -0.5, -1], dtype="float32")
+    for dtype in ["int16", "int32"]:
+        wav_file = io.BytesIO()
+        pcm_arr = (input_arr * np.iinfo(dtype).max).astype(dtype)
+        wavfile.write(wav_file, 16000, pcm_arr)
+        assert np.allclose(read_wav(wav_file.getvalue()), input_arr, atol=1e-4)
+
+
+def test_spectral_model_fn():
+    net = SpectralUNet()
+    batch_sizes = []
+    net.register_forward_pre_hook(lambda _, inputs: batch_sizes.append(len(inputs[0])))
+    model_fn = get_model_fn(net, use_cuda=False)
+    batch_t = torch.zeros(2, 2 ** 12).uniform_(-1, 1)
+    with torch.no_grad():
+        outputs = model_fn(batch_t)
+
+    assert outputs.shape == batch_t.shape
+    # The whole batch is enhanced in a single pass.
+    assert batch_sizes == [2]
@@ -1,5 +1,6 @@
 import torch
 
+from src.utils.loss import AudioFeatureLoss
 from src.tasks.acoustic_scenes_spectral.model import SpectralSceneNet, NUM_LABELS
 
 USE_CUDA = torch.cuda.is_available()
@@ -34,3 +35,29 @@ def test_processes_noise_with_feature_layers():
     assert len(net.feature_layers) == 6
     assert net.feature_layers[0].shape == (1, 64, 80, 256)
     assert net.feature_layers[5].shape == (1, 256, 20, 64)
+
+
+def test_feature_extractor_matches_feature_mode():
+    net = _get_net().eval()
+    feature_net = net.get_feature_extractor(num_layers=6)
+    assert not hasattr(feature_net, "classifier")
+    inputs = _get_noise((2, 1, 80, 256))
+    features = feature_net(inputs)
+    net.set_feature_mode(num_layers=6)
+    net(inputs)
+    assert len(features) == 6
+    for feature, feature_layer in zip(features, net.feature_layers):
+        assert torch.equal(feature, feature_layer)
+
+
+def test_feature_loss_with_feature_extractor():
+    feature_net = _get_net().get_feature_extractor(num_layers=6)
+    feature_loss = AudioFeatureLoss(feature_net, use_cuda=USE_CUDA)
+    inputs = _get_noise((2, 1, 80, 256))
+    targets = _get_noise((2, 1, 80, 256))
+    outputs = _get_noise((2, 1, 80, 256)).requires_grad_(True)
+    loss = feature_loss(inputs, outputs, targets)
+    loss.backward()
+    assert loss.item() > 0
+    assert outputs.grad.abs().sum() > 0
+    assert not any(p.grad is not None for p in feature_net.parameters())
@@ -10,6 +10,10 @@ from tests.utils import DummyNet
 INPUT_SHAPE = (1, 1, 80, 256)
 OUTPUT_SHAPE = (1, 1, 80, 256)
 USE_CUDA = torch.cuda.is_available()
+LOGGING = {
+    "wandb": {"project_name": None, "run_name": None},
+    "checkpoint": {"save_name": None, "save_epochs": None},
+}
 
 
 @mock.patch("src.utils.trainer.checkpoint", autospec=True)
@@ -23,12 +27,9 @@ def test_train_no_model(mock_checkpoint):
     ) as net_cls:
         net_cls.return_value = dummy_net
         train(
-            num_epochs=2,
-            use_cuda=USE_CUDA,
-            batch_size=1,
-            wandb_name=None,
-            subsample=4,
-            checkpoint_epochs=None,
+            runtime={"cuda": USE_CUDA},
+            training={"epochs": 2, "batch_size": 1, "subsample": 4},
+            logging=LOGGING,
         )
 
 
@@ -38,10 +39,7 @@ def test_train_with_model(mock_checkpoint):
     Check that training loop runs without crashing, when there is a model
     """
     train(
-        num_epochs=2,
-        use_cuda=USE_CUDA,
-        batch_size=1,
-        wandb_name=None,
-        subsample=4,
-        checkpoint_epochs=None,
+        runtime={"cuda": USE_CUDA},
+        training={"epochs": 2, "batch_size": 1, "subsample": 4},
+        logging=LOGGING,
     )
@@ -0,0 +1,61 @@
+import numpy as np
+import torch
+from torch import nn
+
+from src.utils import spectral
+from src.tasks.spectral_u_net.model import SpectralUNet
+from src.tasks.spectral_u_net.streaming import StreamingSpectralUNet, MEL_N_FFT
+
+USE_CUDA = torch.cuda.is_available()
+
+
+class IdentityNet(nn.Module):
+    def forward(self, input_t):
+        return input_t
+
+
+def _get_audio(length):
+    times = np.arange(length) / 16000
+    audio = 0.5 * np.sin(2 * np.pi * 220 * times) + 0.1 * np.random.randn(length)
+    return audio.astype("float32")
+
+
+def test_identity_mask_reconstructs_input():
+    stream = StreamingSpectralUNet(IdentityNet(), use_cuda=USE_CUDA)
+    audio = _get_audio(16000)
+    outputs = [stream.step(audio[i : i + 300]) for i in range(0, len(audio), 300)]
+    outputs = np.concatenate(outputs)
+    num_frames = len(audio) // stream.hop
+    num_frames -= num_frames % stream.update_frames
+    assert len(outputs) == num_frames * stream.hop
+    delay = stream.delay
+    assert np.allclose(outputs[delay:], audio[: len(outputs) - delay], atol=1e-4)
+
+
+def test_mel_frames_match_waveglow_spec():
+    """
+    The streamed mel frames should be the features the SpectralUNet is trained on.
+    """
+    stream = StreamingSpectralUNet(IdentityNet(), use_cuda=USE_CUDA)
+    audio = _get_audio(20 * stream.hop)
+    stream.step(audio)
+    # The newest mel frame is centred in the newest linear frame.
+    start = len(audio) - stream.n_fft + stream.mel_offset
+    # Frame 2 of a centred spectrogram starts `2 * hop - n_fft // 2` into the audio.
+    offset = 2 * stream.hop - MEL_N_FFT // 2
+    waveglow_spec = spectral.audio_to_waveglow_spec(audio[start - offset :])
+    assert np.allclose(stream.mel_frames[:, -1], waveglow_spec[:, 2], atol=1e-3)
+
+
+def test_streams_spectral_u_net():
+    net = SpectralUNet()
+    net = net.cuda() if USE_CUDA else net.cpu()
+    net.eval()
+    stream = StreamingSpectralUNet(net, use_cuda=USE_CUDA, update_frames=8)
+    audio = _get_audio(8 * stream.hop * 3)
+    outputs = [stream.step(audio[i : i + 256]) for i in range(0, len(audio), 256)]
+    outputs = np.concatenate(outputs)
+    assert outputs.shape == audio.shape
+    assert np.all(np.isfinite(outputs))
+    assert stream.latency_ms == 1000 * (1024 + 7 * stream.hop) / 16000
+    assert stream.real_time_factor > 0
@@ -0,0 +1,85 @@
+from unittest import mock
+
+import torch
+from torch import nn
+
+from src.utils import batch_size as batch_size_tuner
+from src.utils.batch_size import find_max_batch_size, measure_step
+from src.utils.trainer import Trainer
+from src.tasks.speech_denoise.model import SpeechDenoiseNet
+
+NUM_SAMPLES = 512
+
+mse = nn.MSELoss()
+
+
+def test_find_max_batch_size():
+    """
+    Check that the search finds the largest batch size within the memory budget.
+    """
+    net = SpeechDenoiseNet()
+    step_fn = _get_step_fn(net)
+    memory_budget = measure_step(net, step_fn, 12, "cpu")
+    assert measure_step(net, step_fn, 13, "cpu") > memory_budget
+    assert find_max_batch_size(net, step_fn, "cpu", memory_budget) == 12
+    assert find_max_batch_size(net, step_fn, "cpu", memory_budget, max_batch_size=8) == 8
+    assert all(p.grad is None for p in net.parameters())
+
+
+def test_measure_step_restores_buffers():
+    """
+    Check that probing doesn't change batch norm running stats.
+    """
+    net = nn.Sequential(nn.Linear(4, 4), nn.BatchNorm1d(4))
+    buffers = [buffer.clone() for buffer in net.buffers()]
+
+    def step_fn(batch_size):
+        net(torch.randn(batch_size, 4) + 10).sum().backward()
+
+    assert measure_step(net, step_fn, 8, "cpu") > 0
+    for buffer, saved_buffer in zip(net.buffers(), buffers):
+        assert torch.equal(buffer, saved_buffer)
+
+
+def test_trainer_batch_size(tmp_path):
+    """
+    Check that Trainer finds the batch size when it's "auto", and caches it.
+    """
+    cache_path = str(tmp_path / "batch_sizes.json")
+    trainer = Trainer(cuda=False)
+    trainer.register_loss_fn(lambda inputs, outputs, targets: mse(outputs, targets))
+    trainer.input_shape = [1, NUM_SAMPLES]
+    trainer.target_shape = [NUM_SAMPLES]
+    net = SpeechDenoiseNet()
+    memory_budget = measure_step(net, _get_step_fn(net), 6, "cpu")
+    training = {"batch_size": "auto", "batch_memory_budget_gb": memory_budget / 2 ** 30}
+    assert trainer.get_batch_size({"batch_size": 16}, net, "my-task") == 16
+    with mock.patch.object(batch_size_tuner, "CACHE_PATH", cache_path):
+        assert trainer.get_batch_size(training, net, "my-task") == 6
+        # The second call is cached, so nothing is probed.
+        with mock.patch.object(batch_size_tuner, "find_max_batch_size") as mock_find:
+            assert trainer.get_batch_size(training, net, "my-task") == 6
+            mock_find.assert_not_called()
+            # A different task is probed again.
+            mock_find.return_value = 3
+            assert trainer.get_batch_size(training, net, "other-task") == 3
+
+        # The default budget is cached, though the free memory it depends on changes.
+        training["batch_memory_budget_gb"] = None
+        get_memory_budget = mock.patch.object(batch_size_tuner, "get_memory_budget")
+        with get_memory_budget as mock_budget:
+            mock_budget.return_value = memory_budget
+            assert trainer.get_batch_size(training, net, "my-task") == 6
+            mock_budget.return_value = memory_budget + 1
+            with mock.patch.object(batch_size_tuner, "find_max_batch_size") as mock_find:
+                assert trainer.get_batch_size(training, net, "my-task") == 6
+                mock_find.assert_not_called()
+
+
+def _get_step_fn(net):
+    def step_fn(batch_size):
+        inputs = torch.zeros(batch_size, 1, NUM_SAMPLES)
+        targets = torch.zeros(batch_size, NUM_SAMPLES)
+        mse(net(inputs), targets).backward()
+
+    return step_fn
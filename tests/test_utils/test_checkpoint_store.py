@@ -0,0 +1,158 @@
+import os
+import shutil
+import multiprocessing
+from unittest import mock
+
+import torch
+
+from src.utils.checkpoint_store import CheckpointStore, get_file_hash
+
+
+@mock.patch("src.utils.checkpoint_store.s3", autospec=True)
+def test_store_deduplicates(mock_s3, tmp_path):
+    """
+    Check that identical checkpoints saved under different names are stored once.
+    """
+    store = CheckpointStore(str(tmp_path))
+    weights = {"weight": torch.ones(16)}
+    first_path = store.save(weights, "net-1.ckpt")
+    second_path = store.save(weights, "net-2.ckpt")
+    assert first_path == second_path
+    assert len(os.listdir(store.objects_dir)) == 1
+    assert torch.equal(torch.load(store.get("net-2.ckpt"))["weight"], weights["weight"])
+
+    # The object is only uploaded once, but each name gets a ref.
+    store.upload("net-1.ckpt")
+    store.upload("net-2.ckpt")
+    uploaded = [c.args[1] for c in mock_s3.upload_file.call_args_list]
+    assert uploaded.count(first_path) == 1
+    assert store.get_ref_path("net-1.ckpt") in uploaded
+    assert store.get_ref_path("net-2.ckpt") in uploaded
+
+
+@mock.patch("src.utils.checkpoint_store.s3", autospec=True)
+def test_store_evicts_least_recently_used(mock_s3, tmp_path):
+    """
+    Check that the cache stays under its size limit, keeping recently used
+    and pinned checkpoints.
+    """
+    store = CheckpointStore(str(tmp_path))
+    store.save(torch.zeros(1024), "pinned.ckpt")
+    store.pin("pinned.ckpt")
+    store.upload("pinned.ckpt")
+    object_size = store.get_cache_size()
+    store.max_bytes = 2 * object_size
+
+    store.save(torch.ones(1024), "old.ckpt")
+    store.upload("old.ckpt")
+    store.save(torch.full((1024,), 2.0), "new.ckpt")
+    store.upload("new.ckpt")
+
+    assert store.get_cache_size() <= store.max_bytes
+    manifest = store._read_manifest()
+    assert set(manifest["names"]) == {"pinned.ckpt", "old.ckpt", "new.ckpt"}
+    assert manifest["names"]["old.ckpt"] not in manifest["objects"]
+    assert manifest["names"]["pinned.ckpt"] in manifest["objects"]
+    assert manifest["names"]["new.ckpt"] in manifest["objects"]
+
+    # Evicted checkpoints are downloaded again when they are next requested.
+    old_hash = manifest["names"]["old.ckpt"]
+
+    def download_file(s3_path, file_path):
+        assert s3_path.endswith(old_hash)
+        torch.save(torch.ones(1024), file_path)
+
+    mock_s3.download_file.side_effect = download_file
+    with mock.patch("src.utils.checkpoint_store.get_file_hash", return_value=old_hash):
+        old_path = store.get("old.ckpt")
+
+    assert torch.equal(torch.load(old_path), torch.ones(1024))
+
+
+@mock.patch("src.utils.checkpoint_store.s3", autospec=True)
+def test_store_migrates_legacy_checkpoints(mock_s3, tmp_path):
+    """
+    Check that checkpoints saved as checkpoints/<name> are moved into the store.
+    """
+    store = CheckpointStore(str(tmp_path))
+    legacy_path = os.path.join(str(tmp_path), "net-123.full.ckpt")
+    torch.save(torch.ones(4), legacy_path)
+    checkpoint_hash = get_file_hash(legacy_path)
+
+    object_path = store.get("net-123.full.ckpt")
+    assert not os.path.exists(legacy_path)
+    assert object_path == store.get_object_path(checkpoint_hash)
+    assert torch.equal(torch.load(object_path), torch.ones(4))
+    # Local checkpoints load without S3, they're only uploaded by an explicit upload.
+    mock_s3.download_file.assert_not_called()
+    mock_s3.upload_file.assert_not_called()
+    store.upload("net-123.full.ckpt")
+
+    # A fresh machine finds the checkpoint through its ref on S3.
+    uploaded = {c.args[1]: c.args[0] for c in mock_s3.upload_file.call_args_list}
+    assert store.get_ref_path("net-123.full.ckpt") in uploaded
+    fresh_store = CheckpointStore(str(tmp_path / "fresh"), s3_dir=str(tmp_path))
+
+    def download_file(s3_path, file_path):
+        shutil.copy(s3_path, file_path)
+
+    mock_s3.download_file.side_effect = download_file
+    fresh_path = fresh_store.get("net-123.full.ckpt")
+    assert get_file_hash(fresh_path) == checkpoint_hash
+
+
+@mock.patch("src.utils.checkpoint_store.s3", autospec=True)
+def test_store_evicts_checkpoints_which_arent_uploaded(mock_s3, tmp_path):
+    """
+    Check that the cache stays under its size limit offline, evicting checkpoints which
+    were uploaded before those which weren't.
+    """
+    store = CheckpointStore(str(tmp_path))
+    store.save(torch.zeros(1024), "uploaded.ckpt")
+    store.upload("uploaded.ckpt")
+    object_size = store.get_cache_size()
+    store.max_bytes = 2 * object_size
+    store.save(torch.ones(1024), "oldest.ckpt")
+    store.save(torch.full((1024,), 2.0), "old.ckpt")
+    assert store.get_cache_size() <= store.max_bytes
+    manifest = store._read_manifest()
+    assert manifest["names"]["uploaded.ckpt"] not in manifest["objects"]
+    assert manifest["names"]["oldest.ckpt"] in manifest["objects"]
+
+    store.save(torch.full((1024,), 3.0), "new.ckpt")
+    assert store.get_cache_size() <= store.max_bytes
+    manifest = store._read_manifest()
+    assert manifest["names"]["oldest.ckpt"] not in manifest["objects"]
+    assert manifest["names"]["old.ckpt"] in manifest["objects"]
+    assert manifest["names"]["new.ckpt"] in manifest["objects"]
+
+
+def test_store_is_shared_by_processes(tmp_path):
+    """
+    Check that processes saving to the same store don't lose each other's manifest
+    updates.
+    """
+    num_processes = 4
+    num_saves = 10
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_save_checkpoints, args=(str(tmp_path), idx, num_saves))
+        for idx in range(num_processes)
+    ]
+    for process in processes:
+        process.start()
+
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    manifest = CheckpointStore(str(tmp_path))._read_manifest()
+    assert len(manifest["names"]) == num_processes * num_saves
+    assert len(manifest["objects"]) == num_processes * num_saves
+
+
+def _save_checkpoints(root, process_idx, num_saves):
+    store = CheckpointStore(root)
+    for save_idx in range(num_saves):
+        weights = torch.full((16,), float(process_idx * num_saves + save_idx))
+        store.save(weights, f"net-{process_idx}-{save_idx}")
@@ -0,0 +1,117 @@
+import itertools
+from collections import Counter
+
+import pytest
+import torch
+from torch.utils.data import DataLoader, TensorDataset, Dataset
+
+from src.utils.data_load import MultiSourceLoader, MultiSourceDataset
+
+
+def get_loader(start, length, batch_size=1):
+    """
+    Loader of items numbered from `start`, so each batch's source can be told apart.
+    """
+    dataset = TensorDataset(torch.arange(start, start + length))
+    return DataLoader(dataset, batch_size=batch_size)
+
+
+def test_epoch_covers_all_data():
+    """
+    Check that the longer source isn't cut short, as when strictly alternating
+    """
+    loader = MultiSourceLoader({"a": get_loader(0, 4), "b": get_loader(100, 12)}, seed=0)
+    assert len(loader) == 16
+    num_epochs = 20
+    items = [batch[0].item() for _ in range(num_epochs) for batch in loader]
+    assert len(items) == 16 * num_epochs
+    counts = Counter(items)
+    assert set(counts) == set(range(4)) | set(range(100, 112))
+    # Weights default to the sources' lengths, so each item is seen about once an epoch.
+    for item, count in counts.items():
+        assert abs(count - num_epochs) <= num_epochs // 4, item
+
+    # Each source is read in order, so its items are seen evenly.
+    for source_items in [range(4), range(100, 112)]:
+        source_counts = [counts[item] for item in source_items]
+        assert max(source_counts) - min(source_counts) <= 1
+
+    stats = loader.get_stats()
+    assert stats["a"]["batches"] == sum(counts[item] for item in range(4))
+    loader.close()
+
+
+def test_threads_only_run_while_iterating():
+    """
+    Check that prefetching stops between epochs, without losing any batches
+    """
+    loader = MultiSourceLoader({"a": get_loader(0, 3), "b": get_loader(100, 5)}, seed=0)
+    items = []
+    for _ in range(3):
+        items += [batch[0].item() for batch in loader]
+        assert not loader.threads
+
+    counts = Counter(items)
+    for source_items in [range(3), range(100, 105)]:
+        source_counts = [counts[item] for item in source_items]
+        assert max(source_counts) - min(source_counts) <= 1
+
+    loader.close()
+
+
+def test_clean_only():
+    class SpeechDataset(Dataset):
+        clean_only = False
+
+        def __len__(self):
+            return 1
+
+    datasets = [SpeechDataset(), SpeechDataset()]
+    dataset = MultiSourceDataset(datasets)
+    dataset.clean_only = True
+    assert dataset.clean_only
+    assert all(d.clean_only for d in datasets)
+
+
+def test_weighted_mix():
+    loaders = {"a": get_loader(0, 10), "b": get_loader(100, 10)}
+    loader = MultiSourceLoader(loaders, weights={"a": 3, "b": 1}, num_batches=400, seed=0)
+    items = [batch[0].item() for batch in loader]
+    num_a = sum(item < 100 for item in items)
+    assert 250 < num_a < 350
+    stats = loader.get_stats()
+    assert stats["a"]["batches"] == num_a
+    assert stats["b"]["batches"] == 400 - num_a
+    assert stats["a"]["samples"] == num_a
+    assert stats["a"]["samples_per_s"] > 0
+    assert stats["a"]["load_samples_per_s"] > 0
+    loader.close()
+
+
+def test_infinite():
+    loader = MultiSourceLoader(
+        {"a": get_loader(0, 2), "b": get_loader(100, 3)}, infinite=True
+    )
+    with pytest.raises(TypeError):
+        len(loader)
+
+    batches = list(itertools.islice(loader, 50))
+    assert len(batches) == 50
+    loader.close()
+
+
+class BrokenDataset(Dataset):
+    def __len__(self):
+        return 4
+
+    def __getitem__(self, idx):
+        raise ValueError("Broken")
+
+
+def test_source_errors_are_raised():
+    loaders = {"a": get_loader(0, 4), "broken": DataLoader(BrokenDataset())}
+    loader = MultiSourceLoader(loaders, weights={"a": 0, "broken": 1})
+    with pytest.raises(RuntimeError):
+        list(loader)
+
+    loader.close()
@@ -0,0 +1,63 @@
+import torch
+from torch import nn
+
+from src.utils.ema import WeightEMA
+
+
+def test_ema_update():
+    """
+    Check that the EMA matches a plain per-parameter moving average.
+    """
+    net = nn.Linear(4, 3)
+    expected = [p.detach().clone() for p in net.parameters()]
+    ema = WeightEMA(net, decay=0.9)
+    for _ in range(5):
+        with torch.no_grad():
+            for param in net.parameters():
+                param.add_(torch.randn_like(param))
+
+        ema.update()
+        for idx, param in enumerate(net.parameters()):
+            expected[idx] = 0.9 * expected[idx] + 0.1 * param.detach()
+
+    for ema_param, expected_param in zip(ema.ema_params, expected):
+        assert torch.allclose(ema_param, expected_param)
+
+
+def test_ema_update_every():
+    """
+    Check that updating every N steps compounds the decay.
+    """
+    net = nn.Linear(4, 3)
+    initial = [p.detach().clone() for p in net.parameters()]
+    ema = WeightEMA(net, decay=0.9, update_every=3)
+    with torch.no_grad():
+        for param in net.parameters():
+            param.fill_(1.0)
+
+    ema.update()
+    ema.update()
+    for ema_param, initial_param in zip(ema.ema_params, initial):
+        assert torch.equal(ema_param, initial_param)
+
+    ema.update()
+    for ema_param, initial_param in zip(ema.ema_params, initial):
+        expected = 0.9 ** 3 * initial_param + (1 - 0.9 ** 3)
+        assert torch.allclose(ema_param, expected)
+
+
+def test_ema_average_weights():
+    """
+    Check that averaged weights are swapped in and then restored.
+    """
+    net = nn.Linear(4, 3)
+    ema = WeightEMA(net, decay=0.5)
+    with torch.no_grad():
+        net.weight.fill_(2.0)
+
+    ema.update()
+    expected = ema.ema_params[0].clone()
+    with ema.average_weights():
+        assert torch.equal(net.weight, expected)
+
+    assert torch.all(net.weight == 2.0)
@@ -0,0 +1,62 @@
+import numpy as np
+import torch
+
+from src.utils import spectral
+from src.utils import griffin_lim
+
+AUDIO_LENGTH = 2 ** 14
+
+
+def _get_audio(batch_size):
+    times = np.arange(AUDIO_LENGTH) / 16000
+    audio = [np.sin(2 * np.pi * (200 + 50 * i) * times) for i in range(batch_size)]
+    return torch.tensor(np.stack(audio).astype("float32"))
+
+
+def _get_magnitude(audio_t):
+    return torch.stft(
+        audio_t,
+        n_fft=1024,
+        hop_length=256,
+        window=torch.hann_window(1024),
+        pad_mode="reflect",
+        return_complex=True,
+    ).abs()
+
+
+def test_mel_inverse_is_cached():
+    mel_inverse = griffin_lim.get_mel_inverse(1024, 128)
+    assert mel_inverse.shape == (513, 128)
+    assert griffin_lim.get_mel_inverse(1024, 128) is mel_inverse
+
+
+def test_log_mel_spec_to_audio_is_batched():
+    audio_t = _get_audio(3)
+    log_specs = [spectral.audio_to_log_mel_spec(a) for a in audio_t.numpy()]
+    log_spec_t = torch.tensor(np.stack(log_specs))
+    outputs, num_iters = griffin_lim.log_mel_spec_to_audio(
+        log_spec_t, n_iter=4, length=AUDIO_LENGTH
+    )
+    assert outputs.shape == (3, AUDIO_LENGTH)
+    assert 1 <= num_iters <= 4
+
+
+def test_warm_start_from_true_phase_converges():
+    audio_t = _get_audio(2)
+    mag_t = _get_magnitude(audio_t)
+    outputs, num_iters = griffin_lim.griffin_lim(mag_t, init_audio=audio_t, n_iter=32)
+    assert num_iters < 32
+    convergence_t = griffin_lim.spectral_convergence(outputs, mag_t)
+    assert torch.all(convergence_t < 0.01)
+
+
+def test_fast_griffin_lim_beats_plain_griffin_lim():
+    audio_t = _get_audio(2)
+    mag_t = _get_magnitude(audio_t)
+    torch.manual_seed(0)
+    plain_t, _ = griffin_lim.griffin_lim(mag_t, momentum=0, tol=0, length=AUDIO_LENGTH)
+    torch.manual_seed(0)
+    fast_t, _ = griffin_lim.griffin_lim(mag_t, tol=0, length=AUDIO_LENGTH)
+    plain_sc = griffin_lim.spectral_convergence(plain_t, mag_t).mean()
+    fast_sc = griffin_lim.spectral_convergence(fast_t, mag_t).mean()
+    assert fast_sc < plain_sc
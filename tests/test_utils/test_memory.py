@@ -0,0 +1,95 @@
+import json
+from unittest import mock
+
+import torch
+from torch import nn
+
+from src.utils.debug import memory
+from src.utils.debug.memory import MemoryProfiler, LayerMemoryHooks, get_rss_bytes
+from src.tasks.waveunet.models.wave_u_net import WaveUNet
+from src.tasks.acoustic_scenes.model import SceneNet, NUM_LABELS
+
+
+def test_profiler_phases(tmp_path):
+    """
+    Check that each phase records its peak host memory on CPU, and phases can nest
+    """
+    profiler = MemoryProfiler("cpu", sample_interval_s=0.01)
+    with profiler.phase("train"):
+        # Touch every page, so the memory is resident.
+        big = torch.ones(2 ** 25, dtype=torch.uint8)
+        big_bytes = get_rss_bytes()
+        # Entering a phase samples memory for the outer phases too.
+        with profiler.phase("validate"):
+            pass
+
+        del big
+
+    with profiler.phase("train"):
+        pass
+
+    summary = profiler.get_summary()
+    assert summary["train"]["count"] == 2
+    assert summary["validate"]["count"] == 1
+    # Allow for a little memory being freed between reading the RSS and sampling it.
+    assert summary["train"]["host_peak_mb"] >= big_bytes / 2 ** 20 - 1
+    assert summary["train"]["host_peak_mb"] >= summary["validate"]["host_peak_mb"]
+    assert summary["train"]["device_peak_mb"] is None
+    assert "train" in profiler.format_table()
+
+    path = tmp_path / "memory.json"
+    profiler.save_timeline(path)
+    with open(path) as f:
+        report = json.load(f)
+
+    assert len(report["phases"]) == 3
+    assert {s["phase"] for s in report["timeline"]} == {"train", "validate"}
+
+
+def test_wave_u_net_layers():
+    """
+    Check that the sizes of WaveUNet's skip connections are recorded
+    """
+    net = WaveUNet()
+    with LayerMemoryHooks(net) as layer_hooks, torch.no_grad():
+        net(torch.zeros(2, 2 ** 12))
+
+    summary = {
+        name: (shapes, last_mb) for name, shapes, last_mb, _ in layer_hooks.get_summary()
+    }
+    assert summary["encoders.0"][0] == [(2, 24, 2 ** 12)]
+    assert summary["encoders.0"][1] == 2 * 24 * 2 ** 12 * 4 / 2 ** 20
+    assert summary["encoders.11"][0] == [(2, 288, 2)]
+    assert "decoders.11" in summary
+    assert "encoders.11" in layer_hooks.format_table()
+    # Hooks are removed afterwards
+    assert not any(layer._forward_hooks for _, layer in layer_hooks.layers)
+
+
+def test_scene_net_feature_layers():
+    """
+    Check that SceneNet's conv layers record both their outputs and conv activations
+    """
+    net = SceneNet().eval()
+    with LayerMemoryHooks(net) as layer_hooks, torch.no_grad():
+        net(torch.zeros(1, 32767))
+
+    summary = {name: shapes for name, shapes, _, _ in layer_hooks.get_summary()}
+    assert summary["conv_1"] == [(1, 32, 16384), (1, 32, 16384)]
+    assert summary["final_conv"] == [(1, NUM_LABELS, 1)]
+
+
+def test_rss_without_proc(tmp_path):
+    """
+    Check that host memory falls back to the peak RSS where /proc isn't available
+    """
+    rss_bytes = get_rss_bytes()
+    missing_path = str(tmp_path / "statm")
+    with mock.patch.object(memory, "STATM_PATH", missing_path):
+        peak_bytes = get_rss_bytes()
+        profiler = MemoryProfiler("cpu", sample_interval_s=0.01)
+        with profiler.phase("train"):
+            pass
+
+    assert peak_bytes >= rss_bytes
+    assert profiler.get_summary()["train"]["host_peak_mb"] > 0
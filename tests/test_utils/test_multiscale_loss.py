@@ -0,0 +1,70 @@
+import torch
+
+from src.utils.loss import MultiScaleLoss, LeastSquaresLoss, RelativisticLoss
+from src.benchmarks.multiscale_loss import LoopMultiScaleLoss
+from src.tasks.waveunet.models.mel_discriminator import MelDiscriminatorNet
+
+AUDIO_LENGTH = 2 ** 12
+BATCH_SIZE = 3
+NUM_SCALES = 2
+
+
+def test_batched_loss_matches_loop():
+    """
+    Check that the batched multi-scale loss gives the same losses and gradients as
+    running the discriminator on real and fake audio at each scale in turn.
+    """
+    torch.manual_seed(0)
+    shared_net = MelDiscriminatorNet()
+    cases = [
+        (LeastSquaresLoss, [shared_net] * (NUM_SCALES + 1)),
+        (LeastSquaresLoss, [MelDiscriminatorNet() for _ in range(NUM_SCALES + 1)]),
+        (RelativisticLoss, [shared_net] * (NUM_SCALES + 1)),
+    ]
+    real = torch.randn(BATCH_SIZE, AUDIO_LENGTH)
+    fake = torch.randn(BATCH_SIZE, AUDIO_LENGTH, requires_grad=True)
+    for loss_class, disc_nets in cases:
+        loss_fns = [loss_class(disc_net) for disc_net in disc_nets]
+        loop_loss = LoopMultiScaleLoss(loss_fns, NUM_SCALES)
+        batched_loss = MultiScaleLoss(loss_fns[0], NUM_SCALES, disc_nets)
+        for method in ["for_discriminator", "for_generator"]:
+            results = []
+            for loss in [loop_loss, batched_loss]:
+                _zero_grads(disc_nets, fake)
+                loss_t = getattr(loss, method)(real, fake)
+                loss_t.backward()
+                grads = [p.grad.clone() for p in disc_nets[-1].parameters()]
+                results.append((loss_t.item(), fake.grad.clone(), grads))
+
+            (loop_value, loop_fake_grad, loop_grads), batched = results
+            batched_value, batched_fake_grad, batched_grads = batched
+            assert abs(loop_value - batched_value) < 1e-5 * max(abs(loop_value), 1)
+            assert torch.allclose(loop_fake_grad, batched_fake_grad, atol=1e-6)
+            for loop_grad, batched_grad in zip(loop_grads, batched_grads):
+                assert torch.allclose(loop_grad, batched_grad, atol=1e-5)
+
+
+def test_generator_loss_skips_real_audio():
+    """
+    Check that the least squares generator loss only runs fake audio.
+    """
+    disc_net = MelDiscriminatorNet()
+    batch_sizes = []
+    disc_net.register_forward_pre_hook(
+        lambda _, inputs: batch_sizes.append(len(inputs[0]))
+    )
+    loss = MultiScaleLoss(LeastSquaresLoss(disc_net), NUM_SCALES)
+    real = torch.randn(BATCH_SIZE, AUDIO_LENGTH)
+    fake = torch.randn(BATCH_SIZE, AUDIO_LENGTH)
+    loss.for_generator(real, fake)
+    assert batch_sizes == [BATCH_SIZE] * (NUM_SCALES + 1)
+    batch_sizes.clear()
+    loss.for_discriminator(real, fake)
+    assert batch_sizes == [2 * BATCH_SIZE] * (NUM_SCALES + 1)
+
+
+def _zero_grads(disc_nets, fake):
+    for disc_net in disc_nets:
+        disc_net.zero_grad()
+
+    fake.grad = None
@@ -0,0 +1,78 @@
+import json
+from unittest import mock
+
+import torch
+from click.testing import CliRunner
+
+from src.utils import tensor_file, checkpoint
+from src.utils.checkpoint_store import CheckpointStore
+from src.tasks.waveunet.models.wave_u_net import WaveUNet
+from src.tasks.spectral_u_net.model import SpectralUNet
+
+
+def test_tensor_file_round_trip(tmp_path):
+    """
+    Check that tensors of each dtype are saved and loaded unchanged.
+    """
+    path = str(tmp_path / "tensors.safetensors")
+    tensors = {
+        "float": torch.randn(3, 5),
+        "half": torch.randn(7).half(),
+        "bfloat": torch.randn(2, 3).bfloat16(),
+        "long": torch.arange(4),
+        "bool": torch.tensor([True, False, True]),
+        "scalar": torch.tensor(2.5),
+    }
+    tensor_file.save(tensors, path, metadata={"note": "hello"})
+    loaded = tensor_file.TensorFile(path)
+    assert loaded.metadata == {"note": "hello"}
+    assert set(loaded.keys()) == set(tensors.keys())
+    for name, tensor in tensors.items():
+        loaded_tensor = loaded.get(name)
+        assert loaded_tensor.dtype == tensor.dtype
+        assert torch.equal(loaded_tensor, tensor)
+
+
+def test_load_module(tmp_path):
+    """
+    Check that a model can be rebuilt from a flat tensor file, without the original class
+    instance, and gives the same outputs.
+    """
+    for net_class, kwargs, input_shape in [
+        (WaveUNet, {"num_channels": 4, "num_layers": 3}, (2, 2 ** 12)),
+        (SpectralUNet, {}, (2, 1, 80, 256)),
+    ]:
+        path = str(tmp_path / f"{net_class.__name__}.safetensors")
+        net = net_class(**kwargs).eval()
+        tensor_file.save_module(net, path, kwargs)
+        loaded_net = tensor_file.load_module(path).eval()
+        assert type(loaded_net) is net_class
+        input_t = torch.randn(input_shape)
+        with torch.no_grad():
+            assert torch.allclose(net(input_t), loaded_net(input_t))
+
+
+@mock.patch("src.utils.checkpoint_store.s3", autospec=True)
+def test_convert_full_checkpoint(mock_s3, tmp_path):
+    """
+    Check that a saved full.ckpt checkpoint is converted into a flat tensor checkpoint
+    in the checkpoint store, which loads a model with the same outputs.
+    """
+    store = CheckpointStore(str(tmp_path))
+    kwargs = {"num_channels": 4, "num_layers": 3}
+    net = WaveUNet(**kwargs).eval()
+    with mock.patch.object(checkpoint, "CHECKPOINT_DIR", str(tmp_path)), mock.patch(
+        "src.utils.checkpoint.store", store
+    ):
+        store.save(net, "wave-u-net-123.full.ckpt")
+        result = CliRunner().invoke(
+            tensor_file.convert_cli,
+            ["wave-u-net-123.full.ckpt", "--kwargs", json.dumps(kwargs)],
+        )
+        assert result.exit_code == 0, result.output
+        loaded_net = checkpoint.load("wave-u-net-123.safetensors", use_cuda=False)
+
+    assert type(loaded_net) is WaveUNet
+    input_t = torch.randn(2, 2 ** 12)
+    with torch.no_grad():
+        assert torch.allclose(net(input_t), loaded_net.eval()(input_t))
@@ -0,0 +1,81 @@
+import torch
+
+from src.utils.trackers import (
+    AccuracyTracker,
+    HammingLossTracker,
+    ConfusionMatrixTracker,
+    MultiLabelConfusionTracker,
+)
+
+
+def test_confusion_matrix():
+    tracker = ConfusionMatrixTracker(num_classes=3)
+    # Predicted classes are 0, 1, 1, 2
+    predictions = torch.tensor(
+        [[0.9, 0.1, 0.0], [0.1, 0.8, 0.1], [0.2, 0.7, 0.1], [0.1, 0.2, 0.7]]
+    )
+    labels = torch.tensor([0, 1, 2, 2])
+    tracker.update(predictions[:2], labels[:2])
+    tracker.update(predictions[2:], labels[2:])
+    expected = torch.tensor([[1, 0, 0], [0, 1, 0], [0, 1, 1]])
+    assert torch.equal(tracker.matrix, expected)
+    assert tracker.accuracy == 0.75
+    # Class 1 has precision 1/2 and recall 1, class 2 has precision 1 and recall 1/2.
+    assert torch.allclose(tracker.f1, torch.tensor([1, 2 / 3, 2 / 3], dtype=torch.double))
+    metrics = tracker.get_metrics()
+    assert metrics["Accuracy"] == 0.75
+    tracker.reset()
+    assert tracker.matrix.sum() == 0
+    assert tracker.accuracy == 0
+
+
+def test_multi_label_confusion():
+    tracker = MultiLabelConfusionTracker(num_labels=2)
+    predictions = torch.tensor([[0.9, 0.2], [0.6, 0.7], [0.1, 0.4]])
+    labels = torch.tensor([[1.0, 0.0], [0.0, 1.0], [0.0, 1.0]])
+    tracker.update(predictions[:1], labels[:1])
+    tracker.update(predictions[1:], labels[1:])
+    # Label 0 has a TP, a FP and a TN, label 1 has a TP, a FN and a TN.
+    expected = torch.tensor([[[1, 1], [0, 1]], [[1, 0], [1, 1]]])
+    assert torch.equal(tracker.matrix, expected)
+    assert tracker.hamming_loss == 2 / 6
+    # Each label has precision 1/2 and recall 1, or precision 1 and recall 1/2.
+    assert torch.allclose(tracker.f1, torch.tensor([2 / 3, 2 / 3], dtype=torch.double))
+    metrics = tracker.get_metrics()
+    assert metrics["Hamming Loss"] == 2 / 6
+    assert abs(metrics["Macro F1"] - 2 / 3) < 1e-9
+    tracker.reset()
+    assert tracker.matrix.sum() == 0
+    assert tracker.hamming_loss == 0
+
+
+def test_hamming_loss_tracker():
+    tracker = HammingLossTracker(num_samples=3, num_classes=2)
+    predictions = torch.tensor([[0.9, 0.2], [0.6, 0.7], [0.1, 0.4]])
+    labels = torch.tensor([[1.0, 0.0], [0.0, 1.0], [0.0, 1.0]])
+    tracker.update(predictions, labels)
+    # Label 0 has one false positive, label 1 has one false negative.
+    assert tracker.value == 2 / 6
+
+
+def test_accuracy_tracker():
+    tracker = AccuracyTracker(num_total=4)
+    tracker.update(torch.tensor([[0.9, 0.1], [0.2, 0.8]]), torch.tensor([0, 0]))
+    tracker.update(torch.tensor([[0.9, 0.1], [0.2, 0.8]]), torch.tensor([0, 1]))
+    assert tracker.value == 0.75
+
+
+def test_updates_do_not_sync():
+    """
+    Check that counts stay on the predictions' device until the metrics are read
+    """
+    device = "cuda" if torch.cuda.is_available() else "meta"
+    tracker = ConfusionMatrixTracker(num_classes=3, device=device)
+    assert tracker.counts.device.type == device
+    tracker.update(
+        torch.zeros(4, 3, device=device), torch.zeros(4, dtype=torch.long, device=device)
+    )
+    assert tracker.counts.device.type == device
+    tracker = MultiLabelConfusionTracker(num_labels=8, device=device)
+    tracker.update(torch.zeros(4, 8, device=device), torch.ones(4, 8, device=device))
+    assert tracker.counts.device.type == device
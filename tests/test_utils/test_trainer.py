@@ -1,11 +1,17 @@
+import json
 from unittest import mock
 
+import pytest
+
 import torch
 import numpy as np
 from torch import nn
 
-from src.tasks.spectral_u_net.train import train
-from src.utils.trainer import Trainer
+from src.utils import checkpoint
+from src.utils.checkpoint_store import CheckpointStore
+from src.utils.trainer import Trainer, DEFAULT_RUN_ID
+from src.utils.trackers import ConfusionMatrixTracker
+from src.utils.loss import LeastSquaresLoss
 
 from tests.utils import DummyNet, DummyDataset
 
@@ -14,6 +20,7 @@ OUTPUT_SHAPE = (1, 80, 256)
 USE_CUDA = torch.cuda.is_available()
 
 mse = nn.MSELoss()
+ce = nn.CrossEntropyLoss()
 
 
 @mock.patch("src.utils.trainer.checkpoint", autospec=True)
@@ -21,8 +28,10 @@ def test_train(mock_checkpoint):
     """
     Check that training loop runs without crashing, when there is no model
     """
-    trainer = Trainer(use_cuda=USE_CUDA, wandb_name="my-model")
-    trainer.setup_checkpoints("my-checkpoint", checkpoint_epochs=None)
+    trainer = Trainer(cuda=USE_CUDA)
+    trainer.wandb_name = "my-model"
+    trainer.setup_checkpoints("my-checkpoint", save_epochs=None)
+    mock_checkpoint.load_training_state.return_value = None
     train_loader, test_loader = trainer.load_data_loaders(
         DummyDataset,
         batch_size=16,
@@ -45,11 +54,48 @@ def test_train(mock_checkpoint):
         net, learning_rate=1e-4, adam_betas=[0.9, 0.99], weight_decay=1e-6
     )
     epochs = 3
-    mock_checkpoint.save.assert_not_called()
+    writer = mock_checkpoint.CheckpointWriter.return_value
+    writer.save.assert_not_called()
     trainer.train(net, epochs, optimizer, train_loader, test_loader)
-    mock_checkpoint.save.assert_called_once_with(
+    writer.save.assert_called_once_with(
         net, "my-checkpoint", name="my-model", use_wandb=False
     )
+    writer.flush.assert_called_once()
+
+
+@mock.patch("src.utils.trainer.checkpoint", autospec=True)
+def test_train_multi_source(mock_checkpoint):
+    """
+    Check that training runs on batches mixed from several datasets
+    """
+    trainer = Trainer(cuda=USE_CUDA)
+    trainer.setup_checkpoints(None, save_epochs=None)
+    datasets = {"a": DummyDataset, "b": DummyDataset}
+    train_loader, test_loader = trainer.load_multi_source_data_loaders(
+        datasets,
+        batch_size=16,
+        subsample=None,
+        weights={"a": 3, "b": 1},
+        build_output=_build_output,
+        length=64,
+    )
+    assert len(train_loader) == 8
+    assert len(trainer.test_set) == 128
+    trainer.register_loss_fn(_get_mse_loss)
+    trainer.register_metric_fn(_get_mse_metric, "Loss")
+    net = trainer.load_net(
+        DummyNet,
+        input_shape=(16,) + INPUT_SHAPE,
+        output_shape=(16,) + OUTPUT_SHAPE,
+        use_cuda=USE_CUDA,
+    )
+    optimizer = trainer.load_optimizer(
+        net, learning_rate=1e-4, adam_betas=[0.9, 0.99], weight_decay=1e-6
+    )
+    trainer.train(net, 2, optimizer, train_loader, test_loader)
+    stats = train_loader.get_stats()
+    assert stats["a"]["batches"] + stats["b"]["batches"] == 16
+    train_loader.close()
 
 
 @mock.patch("src.utils.trainer.checkpoint", autospec=True)
@@ -58,8 +104,10 @@ def test_train_with_lr_scheduler(mock_checkpoint):
     Check that training loop runs without crashing, when there is no model
     and when there is a learning rate scheulder used
     """
-    trainer = Trainer(use_cuda=USE_CUDA, wandb_name="my-model")
-    trainer.setup_checkpoints("my-checkpoint", checkpoint_epochs=None)
+    trainer = Trainer(cuda=USE_CUDA)
+    trainer.wandb_name = "my-model"
+    trainer.setup_checkpoints("my-checkpoint", save_epochs=None)
+    mock_checkpoint.load_training_state.return_value = None
     train_loader, test_loader = trainer.load_data_loaders(
         DummyDataset,
         batch_size=16,
@@ -87,11 +135,143 @@ def test_train_with_lr_scheduler(mock_checkpoint):
     steps_per_epoch = len(trainer.train_set) // 16
     trainer.use_one_cycle_lr_scheduler(optimizer, steps_per_epoch, epochs, 1e-3)
 
-    mock_checkpoint.save.assert_not_called()
+    writer = mock_checkpoint.CheckpointWriter.return_value
+    writer.save.assert_not_called()
     trainer.train(net, epochs, optimizer, train_loader, test_loader)
-    mock_checkpoint.save.assert_called_once_with(
+    writer.save.assert_called_once_with(
         net, "my-checkpoint", name="my-model", use_wandb=False
     )
+    writer.flush.assert_called_once()
+
+
+@mock.patch("src.utils.trainer.log_training_info")
+def test_train_with_tracker(mock_log):
+    """
+    Check that tracker metrics are logged for training and validation each epoch
+    """
+    trainer = Trainer(cuda=False)
+    trainer.setup_checkpoints(None, save_epochs=None)
+    train_loader, test_loader = trainer.load_data_loaders(
+        DummyDataset,
+        batch_size=4,
+        subsample=None,
+        build_output=lambda: (torch.randn(8), torch.randint(3, ())),
+        length=16,
+    )
+    trainer.register_loss_fn(lambda inputs, outputs, targets: ce(outputs, targets))
+    trainer.register_tracker(ConfusionMatrixTracker, num_classes=3)
+    net = nn.Linear(8, 3)
+    optimizer = trainer.load_optimizer(
+        net, learning_rate=1e-4, adam_betas=[0.9, 0.99], weight_decay=1e-6
+    )
+    trainer.train(net, 2, optimizer, train_loader, test_loader)
+    assert mock_log.call_count == 2
+    training_info = mock_log.call_args[0][0]
+    assert 0 <= training_info["Training Accuracy"] <= 1
+    assert 0 <= training_info["Validation Macro F1"] <= 1
+    train_tracker, test_tracker = trainer.trackers[0]
+    assert train_tracker.matrix.sum() == 16
+    assert test_tracker.matrix.sum() == 16
+
+
+@mock.patch("src.utils.trainer.log_training_info")
+def test_train_logs_mean_validation_metric(mock_log):
+    """
+    Check that each epoch logs the mean of each validation metric over just that epoch.
+    """
+    trainer = Trainer(cuda=False)
+    trainer.setup_checkpoints(None, save_epochs=None)
+    train_loader, test_loader = trainer.load_data_loaders(
+        DummyDataset,
+        batch_size=4,
+        subsample=None,
+        build_output=lambda: (torch.randn(8), torch.randn(3)),
+        length=16,
+    )
+    trainer.register_loss_fn(_get_mse_loss)
+    trainer.register_metric_fn(_build_plateau_metric(), "Plateau")
+    net = nn.Linear(8, 3)
+    optimizer = trainer.load_optimizer(
+        net, learning_rate=1e-4, adam_betas=[0.9, 0.99], weight_decay=1e-6
+    )
+    trainer.train(net, 2, optimizer, train_loader, test_loader)
+    first_info, second_info = [c.args[0] for c in mock_log.call_args_list]
+    # The plateau metric is 2, 1, 0, 0 in the first epoch, then 0 from then on.
+    assert first_info["Mean Validation Plateau"] == 0.75
+    assert second_info["Mean Validation Plateau"] == 0
+    assert second_info["Validation Plateau"] > 0
+
+
+@mock.patch("src.utils.trainer.log_training_info")
+def test_train_memory_profile(mock_log, tmp_path):
+    """
+    Check that training saves a memory profile of each phase, on CPU
+    """
+    path = str(tmp_path / "memory.json")
+    trainer = Trainer(cuda=False, memory_profile=path)
+    trainer.setup_checkpoints(None, save_epochs=None)
+    train_loader, test_loader = trainer.load_data_loaders(
+        DummyDataset,
+        batch_size=4,
+        subsample=None,
+        build_output=lambda: (torch.randn(8), torch.randint(3, ())),
+        length=16,
+    )
+    trainer.register_loss_fn(lambda inputs, outputs, targets: ce(outputs, targets))
+    net = nn.Sequential(nn.Linear(8, 16), nn.ReLU(), nn.Linear(16, 3))
+    optimizer = trainer.load_optimizer(
+        net, learning_rate=1e-4, adam_betas=[0.9, 0.99], weight_decay=1e-6
+    )
+    trainer.train(net, 2, optimizer, train_loader, test_loader)
+    summary = trainer.memory_profiler.get_summary()
+    assert summary["Phase 0 training"]["count"] == 2
+    assert summary["Phase 0 validation"]["count"] == 2
+    layers = trainer.layer_memory.get_summary()
+    assert [name for name, _, _, _ in layers] == ["0", "1", "2"]
+    assert layers[0][1] == [(4, 16)]
+    with open(path) as f:
+        assert json.load(f)["device"] == "cpu"
+
+
+@mock.patch("src.utils.trainer.log_training_info")
+def test_train_gan(mock_log):
+    """
+    Check that GAN training updates the discriminator then the generator in each step,
+    at the given ratio, running the generator once per step.
+    """
+    trainer, net, optimizer, train_loader, test_loader = _setup_resumable_trainer()
+    trainer.setup_checkpoints(None, save_epochs=None)
+    disc_net = nn.Sequential(nn.Flatten(), nn.Linear(np.prod(INPUT_SHAPE), 1))
+    disc_net = disc_net.cuda() if USE_CUDA else disc_net
+    disc_optimizer = trainer.load_optimizer(
+        disc_net, learning_rate=1e-4, adam_betas=[0.9, 0.99], weight_decay=1e-6
+    )
+    disc_loss = LeastSquaresLoss(disc_net)
+    trainer.register_loss_fn(
+        lambda inputs, outputs, targets: disc_loss.for_generator(targets, outputs)
+    )
+    num_forwards = [0]
+
+    def count_forward(module, inputs, outputs):
+        num_forwards[0] += module.training
+
+    net.register_forward_hook(count_forward)
+    trainer.use_gan(
+        disc_net,
+        disc_optimizer,
+        lambda inputs, outputs, targets: disc_loss.for_discriminator(targets, outputs),
+        gen_every=2,
+    )
+    trainer.train(net, 2, optimizer, train_loader, test_loader)
+
+    num_steps = 2 * len(train_loader)
+    assert num_forwards[0] == num_steps
+    gen_steps = [s["step"].item() for s in optimizer.state_dict()["state"].values()]
+    disc_steps = [s["step"].item() for s in disc_optimizer.state_dict()["state"].values()]
+    assert gen_steps == [num_steps // 2]
+    assert disc_steps == [num_steps, num_steps]
+    assert "Training Discriminator Loss" in mock_log.call_args[0][0]
+    assert all(param.requires_grad for param in disc_net.parameters())
 
 
 def _get_mse_loss(inputs, outputs, targets):
@@ -107,3 +287,289 @@ def _build_output():
     input_t = torch.Tensor(np.random.random(INPUT_SHAPE))
     target_t = torch.Tensor(np.random.random(OUTPUT_SHAPE))
     return input_t, target_t
+
+
+@mock.patch("src.utils.checkpoint_store.s3", autospec=True)
+@mock.patch("src.utils.checkpoint.s3", autospec=True)
+def test_train_resume(mock_s3, mock_store_s3, tmp_path):
+    """
+    Check that training resumes from the latest training state saved by the same run,
+    and skips phases which the run already finished.
+    """
+    store = CheckpointStore(str(tmp_path))
+    with mock.patch("src.utils.checkpoint.CHECKPOINT_DIR", str(tmp_path)), mock.patch(
+        "src.utils.checkpoint.store", store
+    ):
+        # Interrupt the run during its second epoch.
+        trainer, net, optimizer, train_loader, test_loader = _setup_resumable_trainer()
+        trainer.register_epoch_fn(_interrupt_after_first_epoch)
+        try:
+            trainer.train(net, 3, optimizer, train_loader, test_loader)
+        except KeyboardInterrupt:
+            trainer.checkpoint_writer.flush()
+
+        state = _load_state("my-run")
+        assert state["epoch"] == 1 and not state["done"]
+
+        # Start the run again, it should only train for two more epochs.
+        trainer, net, optimizer, train_loader, test_loader = _setup_resumable_trainer()
+        trainer.train(net, 3, optimizer, train_loader, test_loader)
+        state = _load_state("my-run")
+        assert state["epoch"] == 3 and state["done"]
+        adam_steps = [s["step"].item() for s in state["optimizer"]["state"].values()]
+        assert adam_steps == [3 * len(train_loader)]
+        for key, value in net.state_dict().items():
+            assert torch.equal(state["net"][key], value.cpu())
+
+        # Later calls to train are separate training phases, with their own state.
+        trainer.train(net, 1, optimizer, train_loader, test_loader)
+        state = _load_state("my-run", phase=1)
+        assert state["epoch"] == 1 and state["done"]
+
+        # Starting the finished run again skips both phases.
+        trainer, net, optimizer, train_loader, test_loader = _setup_resumable_trainer()
+        trainer.train(net, 3, optimizer, train_loader, test_loader)
+        trainer.train(net, 1, optimizer, train_loader, test_loader)
+        adam_steps = [s["step"].item() for s in optimizer.state_dict()["state"].values()]
+        assert adam_steps == [4 * len(train_loader)]
+
+        # Without a run id, relaunching the same config resumes the default run.
+        trainer, net, optimizer, train_loader, test_loader = _setup_resumable_trainer(
+            run_id=None
+        )
+        trainer.register_epoch_fn(_interrupt_after_first_epoch)
+        try:
+            trainer.train(net, 3, optimizer, train_loader, test_loader)
+        except KeyboardInterrupt:
+            trainer.checkpoint_writer.flush()
+
+        trainer, net, optimizer, train_loader, test_loader = _setup_resumable_trainer(
+            run_id=None
+        )
+        assert trainer.run_id == DEFAULT_RUN_ID
+        trainer.train(net, 3, optimizer, train_loader, test_loader)
+        state = _load_state(DEFAULT_RUN_ID)
+        adam_steps = [s["step"].item() for s in state["optimizer"]["state"].values()]
+        assert adam_steps == [3 * len(train_loader)]
+
+        # A run which doesn't resume, of the same task, starts from scratch.
+        trainer, net, optimizer, train_loader, test_loader = _setup_resumable_trainer(
+            run_id=None, resume=False
+        )
+        assert trainer.run_id not in ["my-run", DEFAULT_RUN_ID]
+        trainer.train(net, 1, optimizer, train_loader, test_loader)
+        state = _load_state(trainer.run_id)
+        adam_steps = [s["step"].item() for s in state["optimizer"]["state"].values()]
+        assert adam_steps == [len(train_loader)]
+
+        # RNG state is restored along with everything else.
+        trainer.load_training_state(net, optimizer, state)
+        expected = torch.rand(4)
+        trainer.load_training_state(net, optimizer, state)
+        assert torch.equal(torch.rand(4), expected)
+
+
+def _interrupt_after_first_epoch(epoch, training_info):
+    if epoch == 1:
+        raise KeyboardInterrupt()
+
+
+def _load_state(run_id, phase=0):
+    return checkpoint.load_training_state(
+        "my-checkpoint", run_id, phase, task_name="my-task"
+    )
+
+
+class ScaleNet(nn.Module):
+    """
+    Smallest net with a trainable parameter.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.scale = nn.Parameter(torch.tensor([1.0]))
+
+    def forward(self, input_t):
+        return input_t * self.scale
+
+
+def _setup_resumable_trainer(run_id="my-run", compile_net=False, resume=True):
+    trainer = Trainer(cuda=USE_CUDA, compile_net=compile_net)
+    trainer.wandb_name = "my-model"
+    trainer.setup_checkpoints(
+        "my-checkpoint",
+        save_epochs=None,
+        resume=resume,
+        run_id=run_id,
+        task_name="my-task",
+    )
+    train_loader, test_loader = trainer.load_data_loaders(
+        DummyDataset,
+        batch_size=16,
+        subsample=None,
+        build_output=_build_output,
+        length=32,
+    )
+    trainer.register_loss_fn(_get_mse_loss)
+    trainer.register_metric_fn(_get_mse_metric, "Loss")
+    net = trainer.load_net(ScaleNet)
+    optimizer = trainer.load_optimizer(
+        net, learning_rate=1e-4, adam_betas=[0.9, 0.99], weight_decay=1e-6
+    )
+    return trainer, net, optimizer, train_loader, test_loader
+
+
+@mock.patch("src.utils.checkpoint_store.s3", autospec=True)
+def test_checkpoint_writer(mock_s3, tmp_path):
+    """
+    Check that checkpoints are snapshotted when queued, then written and uploaded
+    in the background.
+    """
+    store = CheckpointStore(str(tmp_path))
+    with mock.patch("src.utils.checkpoint.store", store):
+        writer = checkpoint.CheckpointWriter(max_in_flight=1)
+        net = nn.Linear(4, 4)
+        nn.init.zeros_(net.weight)
+        first_name = writer.save(net, "my-checkpoint", name="first")
+        # Changes made after queueing shouldn't end up in the checkpoint.
+        nn.init.ones_(net.weight)
+        second_name = writer.save(net, "my-checkpoint", name="second")
+        writer.flush()
+
+        first_net = torch.load(store.get(first_name), weights_only=False)
+        second_net = torch.load(store.get(second_name), weights_only=False)
+        assert torch.all(first_net.weight == 0)
+        assert torch.all(second_net.weight == 1)
+        # Each checkpoint uploads an object and a ref.
+        assert mock_s3.upload_file.call_count == 4
+        assert not list(tmp_path.glob(".tmp*"))
+
+
+def test_copy_to_cpu():
+    """
+    Check that a model is copied to the CPU without copying its tensors on their device.
+    """
+    net = nn.Sequential(nn.Linear(4, 4), nn.BatchNorm1d(4))
+    net[0].weight.requires_grad = False
+    with mock.patch.object(torch.Tensor, "__deepcopy__") as mock_tensor_copy:
+        with mock.patch.object(nn.Parameter, "__deepcopy__") as mock_param_copy:
+            cpu_net = checkpoint.copy_to_cpu(net)
+
+    mock_tensor_copy.assert_not_called()
+    mock_param_copy.assert_not_called()
+    assert cpu_net is not net
+    assert not cpu_net[0].weight.requires_grad
+    assert cpu_net[0].bias.requires_grad
+    for name, tensor in net.state_dict().items():
+        cpu_tensor = cpu_net.state_dict()[name]
+        assert torch.equal(cpu_tensor, tensor)
+        assert cpu_tensor.data_ptr() != tensor.data_ptr()
+
+
+@mock.patch("src.utils.trainer.checkpoint", autospec=True)
+def test_train_early_stopping(mock_checkpoint):
+    """
+    Check that training stops once the validation metric stops improving,
+    and that the best model is saved, separately for each phase.
+    """
+    trainer, net, optimizer, train_loader, test_loader = _setup_resumable_trainer()
+    mock_checkpoint.load_training_state.return_value = None
+    trainer.register_metric_fn(_build_plateau_metric(), "Plateau")
+    trainer.use_early_stopping("Plateau", patience=2, validation_batches=1)
+    trainer.train(net, 10, optimizer, train_loader, test_loader)
+
+    # The metric improves for 3 epochs, then training stops 2 epochs later.
+    assert trainer.early_stopping.best_epoch == 2
+    writer = mock_checkpoint.CheckpointWriter.return_value
+    best_saves = [c for c in writer.save.call_args_list if c.kwargs.get("best")]
+    assert len(best_saves) == 3
+    saved_states = [c.args[0] for c in writer.save_training_state.call_args_list]
+    assert [state["epoch"] for state in saved_states] == [1, 2, 3, 4, 5, 5]
+    assert [state["done"] for state in saved_states] == [False] * 5 + [True]
+    assert all(c.kwargs["phase"] == 0 for c in best_saves)
+
+    # The next phase starts with a fresh best value: its first epoch is its best,
+    # though the metric is no better than in the first phase.
+    writer.save.reset_mock()
+    trainer.train(net, 10, optimizer, train_loader, test_loader)
+    assert trainer.early_stopping.best_epoch == 0
+    best_saves = [c for c in writer.save.call_args_list if c.kwargs.get("best")]
+    assert [c.kwargs["phase"] for c in best_saves] == [1]
+
+
+@mock.patch("src.utils.trainer.checkpoint", autospec=True)
+def test_train_early_stopping_on_multi_word_metric(mock_checkpoint):
+    """
+    Check that early stopping uses the metric name exactly as it was registered.
+    """
+    trainer, net, optimizer, train_loader, test_loader = _setup_resumable_trainer()
+    mock_checkpoint.load_training_state.return_value = None
+    trainer.register_metric_fn(_build_plateau_metric(), "Plateau Loss")
+    trainer.use_early_stopping("Plateau Loss", patience=2, validation_batches=1)
+    trainer.train(net, 10, optimizer, train_loader, test_loader)
+    assert trainer.early_stopping.best_epoch == 2
+
+
+def _build_plateau_metric():
+    """
+    Returns a metric which improves on each validation batch for the first 3 batches,
+    then stays the same. Validation outputs are computed without grads.
+    """
+    values = []
+
+    def get_plateau_metric(inputs, outputs, targets):
+        if outputs.requires_grad:
+            return 0.0
+
+        values.append(max(2 - len(values), 0))
+        return values[-1]
+
+    return get_plateau_metric
+
+
+def test_train_compiled():
+    """
+    Check that a compiled training step trains the same as an eager one.
+    """
+    nets = []
+    for compile_net in [False, True]:
+        torch.manual_seed(0)
+        np.random.seed(0)
+        trainer, net, optimizer, train_loader, test_loader = _setup_resumable_trainer(
+            compile_net=compile_net
+        )
+        trainer.setup_checkpoints(None, save_epochs=None)
+
+        trainer.train(net, 2, optimizer, train_loader, test_loader)
+        nets.append(net)
+
+    assert trainer.compiled_step
+    eager_net, compiled_net = nets
+    assert torch.allclose(eager_net.scale, compiled_net.scale)
+    assert not torch.equal(compiled_net.scale.data.cpu(), torch.tensor([1.0]))
+
+
+def test_train_compile_fallback():
+    """
+    Check that training falls back to eager mode if the training step can't be compiled.
+    """
+    trainer, net, optimizer, train_loader, test_loader = _setup_resumable_trainer()
+    trainer.setup_checkpoints(None, save_epochs=None)
+    trainer.use_compile()
+    error = torch._dynamo.exc.Unsupported("Can't compile this")
+    with mock.patch.object(trainer, "compiled_step", side_effect=error):
+        trainer.train(net, 1, optimizer, train_loader, test_loader)
+        assert trainer.compiled_step is None
+
+    assert not torch.equal(net.scale.data.cpu(), torch.tensor([1.0]))
+
+
+def test_train_without_trainable_loss():
+    """
+    Check that training fails clearly if the loss doesn't depend on the net's weights.
+    """
+    trainer, net, optimizer, train_loader, test_loader = _setup_resumable_trainer()
+    trainer.setup_checkpoints(None, save_epochs=None)
+    net.requires_grad_(False)
+    with pytest.raises(ValueError, match="trainable parameters"):
+        trainer.train(net, 1, optimizer, train_loader, test_loader)
@@ -0,0 +1,66 @@
+import torch
+from torch import nn
+
+from src.utils import spectral
+from src.utils.vocoder import VocoderRegistry, registry, build_waveglow, WAVEGLOW
+
+HOP = 256
+
+
+class DummyVocoder(nn.Module):
+    """
+    Stand-in vocoder which turns each spectrogram frame into a hop of audio.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.proj = nn.Linear(spectral.WAVEGLOW_BINS, HOP)
+
+    def infer(self, spec_t):
+        batch_size = spec_t.shape[0]
+        audio_t = self.proj(spec_t.transpose(1, 2))
+        return audio_t.reshape(batch_size, -1)
+
+
+def test_vocoder_is_prepared_once_and_saved(tmpdir):
+    num_preparations = []
+
+    def get_weights():
+        num_preparations.append(1)
+        return DummyVocoder().state_dict()
+
+    vocoders = VocoderRegistry(vocoder_dir=str(tmpdir))
+    vocoders.register("dummy", DummyVocoder, get_weights)
+    vocoder = vocoders.get("dummy")
+    assert vocoders.get("dummy") is vocoder
+    assert len(num_preparations) == 1
+
+    # A fresh registry loads the saved weights rather than preparing them again.
+    other_vocoders = VocoderRegistry(vocoder_dir=str(tmpdir))
+    other_vocoders.register("dummy", DummyVocoder, get_weights)
+    loaded = other_vocoders.get("dummy")
+    assert len(num_preparations) == 1
+    assert torch.equal(loaded.proj.weight, vocoder.proj.weight)
+
+
+def test_waveglow_infers_audio():
+    """
+    The vendored WaveGlow turns each spectrogram frame into a hop of audio.
+    """
+    waveglow = build_waveglow().eval()
+    spec_t = torch.zeros(2, spectral.WAVEGLOW_BINS, 5).uniform_()
+    with torch.no_grad():
+        audio_t = waveglow.infer(spec_t)
+
+    assert audio_t.shape == (2, 5 * spectral.WAVEGLOW_HOP)
+
+
+def test_batched_waveglow_spec_to_audio():
+    registry.set_local(WAVEGLOW, DummyVocoder())
+    try:
+        waveglow = spectral.load_waveglow()
+        spec_t = torch.zeros(3, spectral.WAVEGLOW_BINS, 10).uniform_()
+        audio = spectral.waveglow_spec_to_audio(spec_t, waveglow)
+        assert audio.shape == (3, 10 * HOP)
+    finally:
+        registry.clear()
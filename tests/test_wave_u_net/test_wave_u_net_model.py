@@ -1,3 +1,5 @@
+import io
+
 import torch
 
 from src.tasks.waveunet.models.wave_u_net import WaveUNet
@@ -34,6 +36,25 @@ def test_disable_skips():
     outputs = net(inputs)
 
 
+def test_loads_model_pickled_before_causal_mode():
+    """
+    Check that full checkpoints saved before causal mode was added still run.
+    """
+    net = _get_net(num_channels=4, num_layers=6)
+    # Old models have no causal attributes.
+    del net.causal
+    for module in net.modules():
+        module.__dict__.pop("causal_padding", None)
+
+    f = io.BytesIO()
+    torch.save(net, f)
+    f.seek(0)
+    loaded_net = torch.load(f, weights_only=False)
+    inputs = _get_noise((1, 2 ** 12))
+    with torch.no_grad():
+        assert torch.equal(loaded_net(inputs), net(inputs))
+
+
 def test_freeze_entire_model():
     net = _get_net()
     num_params = sum(1 for p in net.parameters())
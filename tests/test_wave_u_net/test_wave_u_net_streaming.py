@@ -0,0 +1,62 @@
+import pytest
+import torch
+
+from src.tasks.waveunet.models.wave_u_net import WaveUNet
+from src.tasks.waveunet.models.streaming import StreamingWaveUNet
+
+USE_CUDA = torch.cuda.is_available()
+
+
+def _cuda_maybe(torchy):
+    return torchy.cuda() if USE_CUDA else torchy.cpu()
+
+
+def _get_net():
+    net = WaveUNet(num_channels=4, num_layers=6, causal=True)
+    return _cuda_maybe(net).eval()
+
+
+def _get_noise(shape):
+    return _cuda_maybe(torch.zeros(shape).detach().uniform_(-1, 1))
+
+
+def test_causal_processes_noise():
+    net = _get_net()
+    inputs = _get_noise((2, 3000))
+    outputs = net(inputs)
+    assert outputs.shape == (2, 3000)
+
+
+def test_causal_output_ignores_future_input():
+    net = _get_net()
+    inputs = _get_noise((1, 2 ** 12))
+    changed = inputs.clone()
+    changed[:, 3000:] = 0
+    with torch.no_grad():
+        outputs = net(inputs)
+        changed_outputs = net(changed)
+
+    assert torch.allclose(outputs[:, :3000], changed_outputs[:, :3000], atol=1e-6)
+    assert not torch.allclose(outputs[:, 3000:], changed_outputs[:, 3000:])
+
+
+@pytest.mark.parametrize("hop", [256, 100, 1])
+def test_streaming_matches_offline(hop):
+    net = _get_net()
+    length = 2 ** 11 + 37
+    inputs = _get_noise((2, length))
+    with torch.no_grad():
+        expected = net(inputs)
+
+    stream = StreamingWaveUNet(net, hop=hop)
+    frames = [stream.step(inputs[:, i : i + hop]) for i in range(0, length, hop)]
+    outputs = torch.cat(frames, dim=1)
+    assert outputs.shape == expected.shape
+    assert torch.allclose(outputs, expected, atol=1e-5)
+    assert stream.latency == hop
+    assert stream.real_time_factor > 0
+
+
+def test_streaming_requires_causal_net():
+    with pytest.raises(AssertionError):
+        StreamingWaveUNet(WaveUNet(num_channels=4, num_layers=6))
@@ -10,6 +10,10 @@ from tests.utils import DummyNet
 INPUT_SHAPE = (1, 2 ** 15)
 OUTPUT_SHAPE = (1, 2 ** 15)
 USE_CUDA = torch.cuda.is_available()
+LOGGING = {
+    "wandb": {"project_name": None, "run_name": None},
+    "checkpoint": {"save_name": None, "save_epochs": None},
+}
 
 
 @mock.patch("src.utils.trainer.checkpoint", autospec=True)
@@ -21,12 +25,9 @@ def test_train_mse_no_model(mock_checkpoint):
     with mock.patch("src.tasks.waveunet.training.train_mse.WaveUNet") as net_cls:
         net_cls.return_value = dummy_net
         train_mse(
-            num_epochs=2,
-            use_cuda=USE_CUDA,
-            batch_size=1,
-            wandb_name=None,
-            subsample=4,
-            checkpoint_epochs=None,
+            runtime={"cuda": USE_CUDA},
+            training={"epochs": 2, "batch_size": 1, "subsample": 4},
+            logging=LOGGING,
         )
 
 
@@ -36,10 +37,7 @@ def test_train_mse_with_model(mock_checkpoint):
     Check that training loop runs without crashing, when there is a model
     """
     train_mse(
-        num_epochs=2,
-        use_cuda=USE_CUDA,
-        batch_size=1,
-        wandb_name=None,
-        subsample=4,
-        checkpoint_epochs=None,
+        runtime={"cuda": USE_CUDA},
+        training={"epochs": 2, "batch_size": 1, "subsample": 4},
+        logging=LOGGING,
     )
@@ -14,7 +14,9 @@ class DummyNet(torch.nn.Module):
     def forward(self, input_t):
         assert input_t.shape == self.input_shape
         t = torch.Tensor(np.random.random(self.output_shape))
-        return t.cuda() if self.use_cuda else t.cpu()
+        t = t.cuda() if self.use_cuda else t.cpu()
+        # Depend on the parameter, so there's something to train.
+        return t * self.dummy
 
 
 class DummyDataset(Dataset):